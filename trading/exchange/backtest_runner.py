@@ -0,0 +1,264 @@
+#!/usr/bin/python
+
+import trading.time_series.time_series as time_series
+import trading.exchange.exchange_simulation as exchange_simulation
+import trading.exchange.exchange_account as exchange_account
+import trading.exchange.result_cache as result_cache
+import trading.exchange.order as order
+import trading.exchange.trade as trade
+import logger.logger as logger
+import logging
+import multiprocessing
+import numpy
+import hashlib
+import time
+
+class BacktestSpec( object ):
+
+	"""
+	This class describes one ExchangeSimulation run with plain values so it can be pickled and sent to a worker process.
+	The series is either the directory of a stored TimeSeries ( opened memory mapped by the worker ) or a list of prices.
+	strategyClass must be importable by the worker, it is created as strategyClass( exchangeSimulation, accountId,
+	**strategyParameters ) and registers its own listeners.
+	"""
+
+	def __init__(self, name, symbol, strategyClass, strategyParameters = None, timeSeriesDirectory = None, prices = None,
+			transactionFeePercentage = 0, tickSize = .01, initPrice = None, spread = .01, accountId = 1):
+		self.name = name
+		self.symbol = symbol
+		self.strategyClass = strategyClass
+		self.strategyParameters = strategyParameters or {}
+		self.timeSeriesDirectory = timeSeriesDirectory
+		self.prices = prices
+		self.transactionFeePercentage = transactionFeePercentage
+		self.tickSize = tickSize
+		self.initPrice = initPrice # Top of book is initialized with initTopOfBookWithPrice when set
+		self.spread = spread
+		self.accountId = accountId
+
+	def __str__(self):
+		return "BacktestSpec name:[%s] symbol:[%s] strategyParameters:[%s]" % ( self.name, self.symbol, self.strategyParameters )
+
+	def getTimeSeries(self):
+		if self.timeSeriesDirectory is not None:
+			return time_series.TimeSeries.open( self.timeSeriesDirectory )
+		return time_series.TimeSeries( self.prices )
+
+	def getStrategyFingerprint(self):
+		# A strategy can define getFingerprint( strategyParameters ), e.g. to add a version that is changed with its logic
+		if hasattr ( self.strategyClass, 'getFingerprint' ):
+			return self.strategyClass.getFingerprint( self.strategyParameters )
+		return "%s.%s:%r" % ( self.strategyClass.__module__, self.strategyClass.__name__, sorted ( self.strategyParameters.items() ) )
+
+	def getFingerprint(self, aTimeSeries):
+		# Result cache key, a hash of the ticks and of every setting the run depends on.  The name is not part of it
+		fingerprint = hashlib.sha1( aTimeSeries.getFingerprint() )
+		fingerprint.update( repr ( ( self.symbol, self.transactionFeePercentage, self.tickSize, self.initPrice, self.spread, self.accountId, self.getStrategyFingerprint() ) ) )
+		return fingerprint.hexdigest()
+
+class BacktestResult( object ):
+
+	"""
+	This class is the summary of a run sent back by a worker.  The fills of the strategy account are NumPy arrays taken from
+	the trade tape ( timestamp, side, qty, price, fee ) so no trade or order objects are pickled.  Results read from a
+	ResultCache have cached set.
+	"""
+
+	FILL_COLUMNS = ( 'timestamp', 'side', 'qty', 'price', 'fee' )
+
+	def __init__(self, name, fills, lastPrice, seconds, cached = False):
+		self.name = name
+		self.fills = fills
+		self.lastPrice = lastPrice
+		self.seconds = seconds
+		self.cached = cached
+		buySellFactor = numpy.where( fills['side'] == trade.TradeActions.Buy, 1.0, -1.0 )
+		self.position = float ( ( fills['qty'] * buySellFactor ).sum() )
+		self.fees = float ( fills['fee'].sum() )
+		self.cash = float ( -( fills['qty'] * fills['price'] * buySellFactor ).sum() ) - self.fees
+		self.pnl = self.cash + ( self.position * lastPrice if lastPrice is not None else 0.0 )
+
+	@staticmethod
+	def fromArrays(name, arrays, seconds):
+		lastPrice = float ( arrays['lastPrice'][0] )
+		return BacktestResult( name, dict ( ( column, arrays[ column ] ) for column in BacktestResult.FILL_COLUMNS ), None if numpy.isnan( lastPrice ) else lastPrice, seconds, cached = True )
+
+	def getArrays(self):
+		# Fills and last price as arrays for the ResultCache
+		arrays = dict ( self.fills )
+		arrays['lastPrice'] = numpy.array( [ numpy.nan if self.lastPrice is None else self.lastPrice ] )
+		return arrays
+
+	def getFillCount(self):
+		return len ( self.fills['qty'] )
+
+	def __str__(self):
+		return "BacktestResult name:[%s] fills:[%s] position:[%s] pnl:[%.2f] fees:[%.2f] seconds:[%.3f]" % ( self.name, self.getFillCount(), self.position, self.pnl, self.fees, self.seconds )
+
+def runBacktest( spec, cache = None ):
+	# Runs in the worker process, module level so it can be pickled by the pool.  With a cache a stored result is returned
+	# instead of running the simulation again
+	startTime = time.time()
+	aTimeSeries = spec.getTimeSeries()
+	if cache is not None:
+		key = spec.getFingerprint( aTimeSeries )
+		arrays = cache.get( key )
+		if arrays is not None:
+			return BacktestResult.fromArrays( spec.name, arrays, time.time() - startTime )
+
+	exchangeSimulation = exchange_simulation.ExchangeSimulation( spec.symbol, spec.transactionFeePercentage, spec.tickSize )
+	if spec.initPrice is not None:
+		exchangeSimulation.initTopOfBookWithPrice( spec.initPrice, spec.spread )
+	spec.strategyClass( exchangeSimulation, spec.accountId, **spec.strategyParameters )
+
+	exchangeSimulation.runTimeSeriesAsMarketOrderTrades( aTimeSeries )
+
+	tradeTape = exchangeSimulation.tradeTape
+	isStrategyFill = tradeTape.getColumn( 'accountId' ) == spec.accountId
+	fills = dict ( ( column, numpy.ascontiguousarray( tradeTape.getColumn( column )[ isStrategyFill ] ) ) for column in BacktestResult.FILL_COLUMNS )
+	lastPrice = float ( aTimeSeries.getPrices()[-1] ) if len ( aTimeSeries ) > 0 else None
+	result = BacktestResult( spec.name, fills, lastPrice, time.time() - startTime )
+	if cache is not None:
+		cache.put( key, result.getArrays() )
+	return result
+
+def runIndexedBacktest( indexedSpec ):
+	index, spec, cache = indexedSpec
+	return ( index, runBacktest( spec, cache ) )
+
+def initializeWorker( logLevel ):
+	logging.getLogger('MyLogger').setLevel( logLevel )
+
+class BacktestRunner():
+
+	"""
+	This class runs many BacktestSpecs over a pool of worker processes.  Specs are handed out chunkSize at a time as workers
+	become free and progressCallback( completed, total, result ) is called in the parent as each result arrives.  Results are
+	returned in the order of the specs.  With processes = 1 the specs are run in the current process, which is easier to debug.
+	With a ResultCache the workers return stored results for specs that were already run.
+	"""
+
+	def __init__(self, processes = None, chunkSize = 1, progressCallback = None, workerLogLevel = logging.WARNING, cache = None):
+		self.processes = processes or multiprocessing.cpu_count()
+		self.chunkSize = chunkSize
+		self.progressCallback = progressCallback
+		self.workerLogLevel = workerLogLevel
+		self.cache = cache
+		self.logger = logging.getLogger('MyLogger')
+
+	def reportProgress(self, completed, total, result):
+		self.logger.info( "Backtest completed:[%s/%s] result:[%s]" % ( completed, total, result ) )
+		if self.progressCallback is not None:
+			self.progressCallback( completed, total, result )
+
+	def run(self, specs):
+		self.logger.info( "Running backtests:[%s] processes:[%s] chunkSize:[%s]" % ( len ( specs ), self.processes, self.chunkSize ) )
+		results = [ None ] * len ( specs )
+
+		if self.processes == 1:
+			for index, spec in enumerate ( specs ):
+				results[ index ] = runBacktest( spec, self.cache )
+				self.reportProgress( index + 1, len ( specs ), results[ index ] )
+			return results
+
+		pool = multiprocessing.Pool( self.processes, initializeWorker, ( self.workerLogLevel, ) )
+		try:
+			completed = 0
+			indexedSpecs = [ ( index, spec, self.cache ) for index, spec in enumerate ( specs ) ]
+			for index, result in pool.imap_unordered( runIndexedBacktest, indexedSpecs, self.chunkSize ):
+				results[ index ] = result
+				completed += 1
+				self.reportProgress( completed, len ( specs ), result )
+			pool.close()
+		except:
+			pool.terminate()
+			raise
+		finally:
+			pool.join()
+		return results
+
+class TestBandStrategy( object ):
+
+	"""
+	Strategy used by the tests, keeps one buy order offset below and one sell order offset above the last trade price.
+	"""
+
+	def __init__(self, exchangeSimulation, accountId, offset = .02, qty = 1):
+		self.exchangeSimulation = exchangeSimulation
+		self.accountId = accountId
+		self.offset = offset
+		self.qty = qty
+		exchangeSimulation.registerTradePriceListener( exchange_account.ExchangeAccount( accountId ), self.onTradePrice )
+		exchangeSimulation.registerTradeListener( exchange_account.ExchangeAccount( accountId ), self.onTrade )
+
+	def onTrade(self, exchangeTrade):
+		pass # Fills are summarized from the trade tape
+
+	def onTradePrice(self, price):
+		if self.exchangeSimulation.getOpenOrderIdsForAccountId( self.accountId ):
+			return
+		symbol = self.exchangeSimulation.symbol
+		self.exchangeSimulation.submitOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, round ( price - self.offset, 2 ), self.qty, self.accountId ) )
+		self.exchangeSimulation.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, round ( price + self.offset, 2 ), self.qty, self.accountId ) )
+
+class TestBacktestRunner():
+
+	@staticmethod
+	def testBacktestRunner():
+		import random
+
+		random.seed( 3 )
+		prices = [ 10.0 ]
+		for i in range ( 0, 500 ):
+			prices.append( round ( prices[-1] + random.choice( [ -.01, .01 ] ), 2 ) )
+
+		specs = [ BacktestSpec( "%s_%s" % ( symbol, offset ), symbol, TestBandStrategy, { 'offset' : offset }, prices = prices )
+			for symbol in ( "AA", "BB" ) for offset in ( .01, .02, .05 ) ]
+
+		progress = []
+		poolResults = BacktestRunner( processes = 2, chunkSize = 2, progressCallback = lambda completed, total, result : progress.append( completed ) ).run( specs )
+		localResults = BacktestRunner( processes = 1 ).run( specs )
+
+		assert ( progress == range ( 1, len ( specs ) + 1 ) )
+		assert ( [ result.name for result in poolResults ] == [ spec.name for spec in specs ] )
+		for poolResult, localResult in zip ( poolResults, localResults ):
+			assert ( poolResult.getFillCount() > 0 and poolResult.getFillCount() == localResult.getFillCount() )
+			assert ( abs ( poolResult.pnl - localResult.pnl ) < 1e-9 and poolResult.position == localResult.position )
+			assert ( set ( poolResult.fills.keys() ) == set ( [ 'timestamp', 'side', 'qty', 'price', 'fee' ] ) )
+
+	@staticmethod
+	def testBacktestRunnerWithCache():
+		import tempfile
+		import shutil
+
+		directory = tempfile.mkdtemp()
+		try:
+			prices = [ 10.0, 10.01, 10.03, 10.0, 9.97, 9.99, 10.02, 10.05, 10.01 ]
+			time_series.TimeSeries( prices ).save( directory + '/series' )
+			specs = [ BacktestSpec( "list_%s" % ( offset ), "AA", TestBandStrategy, { 'offset' : offset }, prices = prices, initPrice = 10.0 ) for offset in ( .01, .02 ) ]
+			specs.append( BacktestSpec( "stored", "AA", TestBandStrategy, { 'offset' : .01 }, timeSeriesDirectory = directory + '/series', initPrice = 10.0 ) )
+
+			# The stored series has the same ticks as the list so it shares the first result
+			testCache = result_cache.ResultCache( directory + '/cache' )
+			firstResults = BacktestRunner( processes = 1, cache = testCache ).run( specs )
+			assert ( [ result.cached for result in firstResults ] == [ False, False, True ] )
+			secondResults = BacktestRunner( processes = 2, cache = testCache ).run( specs )
+			assert ( all ( result.cached for result in secondResults ) )
+			for firstResult, secondResult in zip ( firstResults, secondResults ):
+				assert ( secondResult.getFillCount() > 0 and firstResult.pnl == secondResult.pnl and firstResult.lastPrice == secondResult.lastPrice )
+				assert ( secondResult.fills['side'].dtype == firstResult.fills['side'].dtype )
+
+			# Any change of the inputs is a different entry
+			specs[0].transactionFeePercentage = .001
+			specs[1].prices = prices[ : -1 ]
+			assert ( not any ( result.cached for result in BacktestRunner( processes = 1, cache = testCache ).run( specs[ : 2 ] ) ) )
+			assert ( len ( testCache.getEntries() ) == 4 )
+		finally:
+			shutil.rmtree( directory )
+
+if __name__ == "__main__":
+
+	logger.MyLogger.InitializeLogger()
+	logging.getLogger('MyLogger').setLevel( logging.WARNING )
+	TestBacktestRunner.testBacktestRunner()
+	TestBacktestRunner.testBacktestRunnerWithCache()
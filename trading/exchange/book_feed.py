@@ -0,0 +1,143 @@
+#!/usr/bin/python
+
+import trading.exchange.trade as trade
+import logger.logger as logger
+import logging
+
+class BookUpdate( object ):
+
+	"""
+	Market data message sent by Exchange.publishBookDeltas to the quote listeners.  deltas is a list of
+	( side, price, total qty, sequence ) with one sequence number per delta, a qty of 0 means the level is gone.  A snapshot
+	holds every level of the book with the sequence number of the last delta it includes and replaces the subscriber's book.
+	"""
+
+	__slots__ = ( 'symbol', 'sequence', 'deltas', 'isSnapshot' )
+
+	def __init__(self, symbol, sequence, deltas, isSnapshot = False):
+		self.symbol = symbol
+		self.sequence = sequence # Sequence number of the last delta
+		self.deltas = deltas
+		self.isSnapshot = isSnapshot
+
+	def __str__(self):
+		return "BookUpdate symbol:[%s] sequence:[%s] deltas:[%s] isSnapshot:[%s]" % ( self.symbol, self.sequence, len ( self.deltas ), self.isSnapshot )
+
+class LocalOrderBook():
+
+	"""
+	Subscriber side of the book feed, keeps price -> total qty for each side from BookUpdate messages at a cost proportional
+	to the deltas.  Register onBookUpdate as the quote listener.  The book is only valid after a snapshot, when a sequence
+	number is missing ( e.g. updates dropped by a ListenerDispatcher queue ) it waits for the next snapshot.
+	"""
+
+	def __init__(self, symbol):
+		self.symbol = symbol
+		self.bids = {} # Price -> total qty
+		self.asks = {}
+		self.sequence = None # Sequence number of the last applied delta, None until a snapshot is received
+		self.gapCount = 0
+		self.logger = logging.getLogger('MyLogger')
+
+	def isValid(self):
+		return self.sequence is not None
+
+	def onBookUpdate(self, bookUpdate):
+		if bookUpdate.isSnapshot:
+			self.bids = {}
+			self.asks = {}
+			self.sequence = None
+		elif self.sequence is None:
+			return
+		elif bookUpdate.deltas and bookUpdate.deltas[0][3] > self.sequence + 1:
+			self.logger.warning( "Missing book deltas, waiting for a snapshot symbol:[%s] sequence:[%s] received:[%s]" % ( self.symbol, self.sequence, bookUpdate.deltas[0][3] ) )
+			self.sequence = None
+			self.gapCount += 1
+			return
+
+		for side, price, qty, sequence in bookUpdate.deltas:
+			if self.sequence is not None and sequence <= self.sequence: # Already applied
+				continue
+			levels = self.bids if side == trade.TradeActions.Buy else self.asks
+			if qty > 0:
+				levels[ price ] = qty
+			else:
+				levels.pop( price, None )
+		self.sequence = bookUpdate.sequence
+
+	def getHighestBidPrice(self):
+		return max ( self.bids ) if self.bids else None
+
+	def getLowestAskPrice(self):
+		return min ( self.asks ) if self.asks else None
+
+	def getLevels(self):
+		# Same order as OrderBook.getLevels
+		levels = [ ( trade.TradeActions.Buy, price, self.bids[ price ] ) for price in sorted ( self.bids, reverse = True ) ]
+		levels += [ ( trade.TradeActions.Sell, price, self.asks[ price ] ) for price in sorted ( self.asks ) ]
+		return levels
+
+class TestBookFeed():
+
+	@staticmethod
+	def testBookFeed():
+		import trading.exchange.exchange as exchange
+		import trading.exchange.exchange_account as exchange_account
+		import trading.exchange.order as order
+		import random
+
+		symbol = "AA"
+		testExchange = exchange.Exchange( symbol, bookSnapshotInterval = 50 )
+		testExchange.submitOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 9.9, 5, 1 ) )
+
+		# A late joiner starts from a snapshot
+		updates = []
+		localOrderBook = LocalOrderBook( symbol )
+		testExchange.registerQuoteListener( exchange_account.ExchangeAccount( 1 ), lambda bookUpdate : ( updates.append( bookUpdate ), localOrderBook.onBookUpdate( bookUpdate ) ) )
+		assert ( updates[-1].isSnapshot and localOrderBook.getLevels() == [ ( trade.TradeActions.Buy, 9.9, 5 ) ] )
+
+		orderId = testExchange.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 10, 5, 2 ) )[1]
+		testExchange.submitOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Market, None, 2, 1 ) )
+		assert ( [ delta[ : 3 ] for delta in updates[-1].deltas ] == [ ( trade.TradeActions.Sell, 10, 3 ) ] )
+		testExchange.cancelOrder( orderId )
+		assert ( [ delta[ : 3 ] for delta in updates[-1].deltas ] == [ ( trade.TradeActions.Sell, 10, 0 ) ] and updates[-1].sequence == 3 )
+
+		# The local book follows random orders and cancels, periodic snapshots repair it after a lost update
+		random.seed( 3 )
+		for i in range ( 0, 2000 ):
+			if i == 1000:
+				localOrderBook.sequence -= 1 # As if the last update was lost
+			openOrderIds = testExchange.getOpenOrderIdsForAccountId( 1 )
+			if openOrderIds and random.random() < .3:
+				testExchange.cancelOrder( random.choice( openOrderIds ) )
+			else:
+				tradeAction = random.choice( [ trade.TradeActions.Buy, trade.TradeActions.Sell ] )
+				testExchange.submitOrders( [ order.Order( symbol, tradeAction, order.OrderTypes.Limit, round ( random.uniform( 9.8, 10.2 ), 2 ), random.randint( 1, 5 ), 1 ) ] )
+			if localOrderBook.isValid():
+				assert ( localOrderBook.getLevels() == testExchange.orderBook.getLevels() )
+		assert ( localOrderBook.gapCount == 1 and localOrderBook.isValid() )
+		assert ( localOrderBook.getLowestAskPrice() == testExchange.orderBook.getLowestAskPrice() )
+		assert ( localOrderBook.getHighestBidPrice() == testExchange.orderBook.getHighestBidPrice() )
+
+	@staticmethod
+	def testSimulationBookFeed():
+		import trading.exchange.exchange_simulation as exchange_simulation
+		import trading.exchange.exchange_account as exchange_account
+		import trading.exchange.order as order
+
+		symbol = "AA"
+		for runTicks in ( lambda simulation, prices : [ simulation.runHistoricalTradeAsMarketOrder( price ) for price in prices ], lambda simulation, prices : simulation.runPriceArrayAsMarketOrderTrades( prices ) ):
+			testExchangeSimulation = exchange_simulation.ExchangeSimulation( symbol )
+			testExchangeSimulation.lastTradePoint = 10
+			for i in range ( 1, 4 ):
+				testExchangeSimulation.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 10 + i * .01, 1, 1 ) )
+			localOrderBook = LocalOrderBook( symbol )
+			testExchangeSimulation.registerQuoteListener( exchange_account.ExchangeAccount( 1 ), localOrderBook.onBookUpdate )
+			runTicks( testExchangeSimulation, [ 10.01, 10.025, 10.0 ] )
+			assert ( localOrderBook.getLevels() == [ ( trade.TradeActions.Sell, 10.03, 1 ) ] and localOrderBook.sequence == 2 )
+
+if __name__ == "__main__":
+
+	logger.MyLogger.InitializeLogger()
+	TestBookFeed.testBookFeed()
+	TestBookFeed.testSimulationBookFeed()
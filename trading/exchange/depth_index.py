@@ -0,0 +1,235 @@
+#!/usr/bin/python
+
+import logger.logger as logger
+import logging
+import array
+
+class FenwickTree():
+
+	"""
+	This class is a binary indexed ( Fenwick ) tree over a fixed number of positions.  It supports adding to a single position
+	and summing all positions up to and including a position in O(log n).  It can also find the first position where the running
+	sum reaches a target which is used to walk the book for a given quantity without visiting every price level.
+	"""
+
+	def __init__(self, size, values = None ):
+		self.size = size
+		self.tree = array.array( 'd', [0.0] ) * ( size + 1 ) # 1 based internally
+
+		if values is not None: # O(n) build from point values
+			for i in range ( 1, size + 1 ):
+				self.tree[i] += values[ i - 1 ]
+				parent = i + ( i & -i )
+				if parent <= size:
+					self.tree[ parent ] += self.tree[i]
+
+	def add(self, position, delta):
+		i = position + 1
+		while i <= self.size:
+			self.tree[i] += delta
+			i += i & -i
+
+	def prefixSum(self, position):
+		# Sum of positions 0..position inclusive
+		total = 0.0
+		i = min ( position + 1, self.size )
+		while i > 0:
+			total += self.tree[i]
+			i -= i & -i
+		return total
+
+	def findPosition(self, target):
+		# Returns the first position where prefixSum(position) >= target along with prefixSum(position - 1)
+		position = 0
+		remaining = target
+		step = 1
+		while step * 2 <= self.size:
+			step *= 2
+
+		while step > 0:
+			nextPosition = position + step
+			if nextPosition <= self.size and self.tree[ nextPosition ] < remaining:
+				position = nextPosition
+				remaining -= self.tree[ nextPosition ]
+			step //= 2
+
+		return ( position, target - remaining )
+
+class DepthIndex():
+
+	"""
+	This class keeps the cumulative depth of one side of the order book indexed by price tick.  Positions start at the most
+	aggressive end of the covered range for that side ( lowest tick for asks, highest tick for bids ) so a prefix sum up to a
+	price is the quantity that can be filled by walking the book up to that price.  A second tree holds qty * price so the
+	average fill price for a quantity can be found with the same walk.  The covered range grows by doubling when a price
+	falls outside of it, up to maxSize ticks.  Prices that would grow the range past maxSize are kept in a small overflow dict 
+	which is scanned by the queries. 
+	"""
+
+	def __init__(self, tickSize, highestIsBest, initialSize = 64, maxSize = 1 << 20 ):
+		self.tickSize = tickSize
+		self.sign = -1 if highestIsBest else 1 # Position increases as the price gets worse for this side
+		self.baseKey = None
+		self.size = initialSize
+		self.maxSize = maxSize 
+		self.overflowLevels = {} # key -> [ qty, notional ] for prices outside of the covered range 
+		self.levelQty = array.array( 'd', [0.0] ) * self.size # Point values, used to rebuild the trees when the range grows
+		self.levelNotional = array.array( 'd', [0.0] ) * self.size
+		self.qtyTree = FenwickTree( self.size )
+		self.notionalTree = FenwickTree( self.size )
+		self.logger = logging.getLogger('MyLogger')
+
+	def priceToKey(self, price):
+		return self.sign * int ( round ( price / self.tickSize ) )
+
+	def resize(self, key):
+		# Re-center the covered range so it includes key, keeping existing levels at the same key. Returns False if the 
+		# range would grow past maxSize 
+		lowKey = key if self.baseKey is None else min ( self.baseKey, key )
+		highKey = key if self.baseKey is None else max ( self.baseKey + self.size - 1, key )
+		if highKey - lowKey + 1 > self.maxSize: 
+			return False 
+		newSize = self.size
+		while newSize < ( highKey - lowKey + 1 ) * 2 and newSize < self.maxSize:
+			newSize *= 2
+		newBaseKey = lowKey - ( newSize - ( highKey - lowKey + 1 ) ) // 2
+
+		self.logger.info( "Resizing depth index size:[%s] -> [%s]" % ( self.size, newSize ) )
+
+		newLevelQty = array.array( 'd', [0.0] ) * newSize
+		newLevelNotional = array.array( 'd', [0.0] ) * newSize
+		if self.baseKey is not None:
+			offset = self.baseKey - newBaseKey
+			newLevelQty[ offset : offset + self.size ] = self.levelQty
+			newLevelNotional[ offset : offset + self.size ] = self.levelNotional
+
+		self.baseKey = newBaseKey
+		self.size = newSize
+		self.levelQty = newLevelQty
+		self.levelNotional = newLevelNotional
+		self.qtyTree = FenwickTree( newSize, newLevelQty )
+		self.notionalTree = FenwickTree( newSize, newLevelNotional )
+		return True 
+
+	def addQty(self, price, qty):
+		key = self.priceToKey( price )
+		if self.baseKey is None or key < self.baseKey or key >= self.baseKey + self.size:
+			if key in self.overflowLevels or not self.resize( key ): 
+				level = self.overflowLevels.setdefault( key, [ 0.0, 0.0 ] )
+				level[0] += qty 
+				level[1] += qty * price 
+				if level[0] == 0: 
+					del self.overflowLevels[ key ]
+				return 
+
+		position = key - self.baseKey
+		self.levelQty[ position ] += qty
+		self.levelNotional[ position ] += qty * price
+		self.qtyTree.add( position, qty )
+		self.notionalTree.add( position, qty * price )
+
+	def getTotalQty(self):
+		return self.qtyTree.prefixSum( self.size - 1 ) + sum ( level[0] for level in self.overflowLevels.itervalues() )
+
+	def getQtyThroughPrice(self, price):
+		# Total quantity at prices equal or better than price for this side
+		key = self.priceToKey( price )
+		totalQty = sum ( level[0] for levelKey, level in self.overflowLevels.iteritems() if levelKey <= key )
+		if self.baseKey is None or key < self.baseKey:
+			return totalQty
+		return totalQty + self.qtyTree.prefixSum( key - self.baseKey )
+
+	def getAverageFillPrice(self, qty):
+		# Average price obtained by filling qty against this side from the best price outwards, None if there is not enough quantity
+		if qty <= 0 or self.getTotalQty() < qty:
+			return None
+
+		# Overflow levels more aggressive than the covered range are filled first, then the tree, then the remaining overflow levels 
+		remainingQty = qty 
+		notional = 0.0 
+		overflowKeys = sorted ( self.overflowLevels.keys() )
+		for levelKey in overflowKeys: 
+			if self.baseKey is not None and levelKey >= self.baseKey: 
+				break 
+			levelQty, levelNotional = self.overflowLevels[ levelKey ] 
+			fillQty = min ( remainingQty, levelQty ) 
+			notional += fillQty * levelNotional / levelQty 
+			remainingQty -= fillQty 
+			if remainingQty == 0: 
+				return notional / qty 
+
+		treeQty = self.qtyTree.prefixSum( self.size - 1 )
+		if treeQty >= remainingQty: 
+			position, qtyBefore = self.qtyTree.findPosition( remainingQty )
+			notionalBefore = self.notionalTree.prefixSum( position - 1 ) if position > 0 else 0.0
+			levelPrice = self.levelNotional[ position ] / self.levelQty[ position ]
+			return ( notional + notionalBefore + ( remainingQty - qtyBefore ) * levelPrice ) / qty
+		
+		notional += self.notionalTree.prefixSum( self.size - 1 )
+		remainingQty -= treeQty 
+		for levelKey in overflowKeys: 
+			if levelKey < self.baseKey: 
+				continue 
+			levelQty, levelNotional = self.overflowLevels[ levelKey ] 
+			fillQty = min ( remainingQty, levelQty ) 
+			notional += fillQty * levelNotional / levelQty 
+			remainingQty -= fillQty 
+			if remainingQty == 0: 
+				break 
+		return notional / qty 
+
+	def clear(self):
+		self.__init__( self.tickSize, self.sign == -1, maxSize = self.maxSize )
+
+class TestDepthIndex():
+
+	@staticmethod
+	def testFenwickTree():
+		values = [ 3, 0, 5, 1, 0, 0, 2, 4 ]
+		testTree = FenwickTree( len ( values ), values )
+		for position in range ( 0, len ( values ) ):
+			assert ( testTree.prefixSum( position ) == sum ( values[ : position + 1 ] ) )
+
+		testTree.add( 4, 6 )
+		assert ( testTree.prefixSum( 4 ) == 15 )
+		assert ( testTree.findPosition( 9 ) == ( 3, 8 ) )
+		assert ( testTree.findPosition( 10 ) == ( 4, 9 ) )
+
+	@staticmethod
+	def testDepthIndex():
+		askDepth = DepthIndex( .01, highestIsBest = False )
+		for price in [ 101, 102, 103 ]:
+			askDepth.addQty( price, 10 )
+		askDepth.addQty( 150.5, 5 ) # Forces the covered range to grow
+
+		assert ( askDepth.getQtyThroughPrice( 100 ) == 0 )
+		assert ( askDepth.getQtyThroughPrice( 102 ) == 20 )
+		assert ( askDepth.getQtyThroughPrice( 1000 ) == 35 )
+		assert ( askDepth.getAverageFillPrice( 15 ) == ( 101 * 10 + 102 * 5 ) / 15.0 )
+		assert ( askDepth.getAverageFillPrice( 36 ) is None )
+
+		bidDepth = DepthIndex( .01, highestIsBest = True )
+		for price in [ 97, 98, 99 ]:
+			bidDepth.addQty( price, 10 )
+		bidDepth.addQty( 99, -4 )
+		assert ( bidDepth.getQtyThroughPrice( 98 ) == 16 )
+		assert ( bidDepth.getAverageFillPrice( 6 ) == 99 )
+		assert ( bidDepth.getAverageFillPrice( 26 ) == ( 99 * 6 + 98 * 10 + 97 * 10 ) / 26.0 )
+
+		# Prices far outside of the covered range are kept in the overflow levels 
+		cappedDepth = DepthIndex( 1, highestIsBest = False, maxSize = 128 )
+		cappedDepth.addQty( 100, 10 )
+		cappedDepth.addQty( 1, 1 )
+		cappedDepth.addQty( 1000, 2 )
+		assert ( cappedDepth.size <= 128 and len ( cappedDepth.overflowLevels ) == 2 ) 
+		assert ( cappedDepth.getQtyThroughPrice( 1 ) == 1 ) 
+		assert ( cappedDepth.getQtyThroughPrice( 999 ) == 11 ) 
+		assert ( cappedDepth.getAverageFillPrice( 12 ) == ( 1 + 100 * 10 + 1000 ) / 12.0 ) 
+		cappedDepth.addQty( 1, -1 ) 
+		assert ( len ( cappedDepth.overflowLevels ) == 1 and cappedDepth.getTotalQty() == 12 ) 
+
+if __name__ == "__main__":
+
+	logger.MyLogger.InitializeLogger()
+	TestDepthIndex.testFenwickTree()
+	TestDepthIndex.testDepthIndex()
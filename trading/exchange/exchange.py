@@ -6,6 +6,11 @@ import quote as quote
 import exchange_account as exchange_account
 import exchange_participant as exchange_participant 
 import order_book as order_book 
+import trade_tape as trade_tape 
+import book_feed as book_feed 
+import participant_queue as participant_queue 
+import copy 
+import math 
 import logger.logger as logger
 import logging
 
@@ -14,37 +19,81 @@ class Exchange( object ):
 	"""
 	This class provides the logic to match trades.  Specifically it can handle limit and market orders along with canceling 
 	existing orders in the orderbook.  It keeps track of the currnet order book and diseminates trades via function calls 
-	that can be registered by exchange participants.
+	that can be registered by exchange participants.  Limit prices must be a multiple of tickSize, see OrderBook for denseBandTicks.
+	Every fill is also recorded in tradeTape, see TradeTape for tradeTapeDirectory.  Quote listeners receive the changes of the 
+	book as BookUpdate deltas, see publishBookDeltas for bookSnapshotInterval. 
 	"""
 
-	def __init__(self, symbol, transactionFeePercentage = 0):
+	def __init__(self, symbol, transactionFeePercentage = 0, tickSize = .01, denseBandTicks = None, tradeTapeDirectory = None, bookSnapshotInterval = None):
 		self.symbol = symbol 
 		self.transactionFeePercentage = transactionFeePercentage 
 		self.tradeId = 0  
 		self.currentExchangeOrderId = 0 
-		self.deleteOrderDict = {} # Price Level -> touple( bid or ask, price level, accountId ) used instead of search for deletion of orders from the book 
 		self.funcOnQuoteListeners = {} # ExchangeAccount -> quoteFuncListener  
 		self.funcOnTradeListeners = {} # ExchangeAccount -> tradeFuncListener  
+		self.funcOnTradesListeners = {} # ExchangeAccount -> tradesFuncListener, receives all trades of a batch for the account in one call 
 		self.funcOnTradePriceListeners = {} # ExchangeAccount -> tradeFuncListener  
-		self.orderBook = order_book.OrderBook(symbol) 
+		self.listenerDispatcher = None # See setListenerDispatcher 
+		self.bookSequence = 0 # Sequence number of the last book delta published 
+		self.bookSnapshotInterval = bookSnapshotInterval 
+		self.bookDeltasSinceSnapshot = 0 
+		self.orderBook = order_book.OrderBook(symbol, tickSize, denseBandTicks) 
+		self.tradeTape = trade_tape.TradeTape( directory = tradeTapeDirectory, name = symbol ) 
 		self.logger = logging.getLogger('MyLogger')		
 	
+	def fork(self):
+		# Copy of the exchange that continues independently, e.g. to branch a simulation at some point in time.  The order 
+		# books share their price levels until one of them changes a level ( see OrderBook.fork ).  The fork starts without 
+		# listeners and with an empty trade tape held in memory 
+		forkedExchange = copy.copy( self )
+		forkedExchange.orderBook = self.orderBook.fork()
+		forkedExchange.funcOnQuoteListeners = {} 
+		forkedExchange.funcOnTradeListeners = {} 
+		forkedExchange.funcOnTradesListeners = {} 
+		forkedExchange.funcOnTradePriceListeners = {} 
+		forkedExchange.listenerDispatcher = None 
+		forkedExchange.tradeTape = trade_tape.TradeTape( name = self.symbol )
+		return forkedExchange 
+
 	def __str__ ( self ):
 		returnStr = " ------------------- Printing Exchange Information for symbol:[%s] ------------------- \n" % ( self.symbol )  
 		returnStr += self.orderBook.__str__() 
 		return returnStr 
 		
-	def registerQuoteListener(self, exchangeAccount, funcOnQuote ):
+	def setListenerDispatcher(self, listenerDispatcher ):
+		# Listeners registered from now on are called by the ListenerDispatcher's threads instead of the matching thread, 
+		# see listener_dispatcher.ListenerDispatcher.  Listeners registered before, e.g. the simulation's own, stay inline.  The 
+		# exchange takes no locks, so a dispatched listener must not call submitOrder, cancelOrder or any other method of the 
+		# exchange, orders placed in reaction to a call go through an ExchangeGateway whose thread owns the exchange 
+		self.logger.info( "Setting listener dispatcher:[%s]" % listenerDispatcher )  
+		self.listenerDispatcher = listenerDispatcher 
+
+	def dispatchListener(self, funcListener, maxSize = None, policy = None, conflationKey = None, allowConflate = True ): 
+		# maxSize, policy and conflationKey override the dispatcher's defaults for this listener 
+		if self.listenerDispatcher is None: 
+			return funcListener 
+		if not allowConflate and ( self.listenerDispatcher.policy if policy is None else policy ) == participant_queue.BackpressurePolicies.Conflate: 
+			self.logger.warning( "Conflate policy would drop fills, pass a Block or DropOldest policy for listener:[%s]" % funcListener ) 
+			raise Exception( "Conflate policy would drop fills, pass a Block or DropOldest policy for listener:[%s]" % funcListener ) 
+		return self.listenerDispatcher.wrap( funcListener, maxSize, policy, conflationKey ) 
+
+	def registerQuoteListener(self, exchangeAccount, funcOnQuote, maxSize = None, policy = None, conflationKey = None ):
 		self.logger.info( "Registering quote listener for exchangeAccount:[%s]" % exchangeAccount )  
-		self.funcOnQuoteListeners[ exchangeAccount.getAccountId() ] = funcOnQuote
+		self.funcOnQuoteListeners[ exchangeAccount.getAccountId() ] = self.dispatchListener( funcOnQuote, maxSize, policy, conflationKey )
+		self.funcOnQuoteListeners[ exchangeAccount.getAccountId() ]( self.createBookSnapshot() ) # Late joiners start from a snapshot 
 	
-	def registerTradeListener(self, exchangeAccount, funcOnTrade ):
+	def registerTradeListener(self, exchangeAccount, funcOnTrade, maxSize = None, policy = None ):
+		# Every fill has to reach its account so a dispatched trade listener can not be conflated 
 		self.logger.info( "Registering trade listener for exchangeAccount:[%s]" % exchangeAccount )  
-		self.funcOnTradeListeners[ exchangeAccount.getAccountId() ] = funcOnTrade 
+		self.funcOnTradeListeners[ exchangeAccount.getAccountId() ] = self.dispatchListener( funcOnTrade, maxSize, policy, allowConflate = False ) 
+		
+	def registerTradesListener(self, exchangeAccount, funcOnTrades, maxSize = None, policy = None ):
+		self.logger.info( "Registering trades listener for exchangeAccount:[%s]" % exchangeAccount )  
+		self.funcOnTradesListeners[ exchangeAccount.getAccountId() ] = self.dispatchListener( funcOnTrades, maxSize, policy, allowConflate = False ) 
 		
-	def registerTradePriceListener(self, exchangeAccount, funcOnTradePrice ): 
+	def registerTradePriceListener(self, exchangeAccount, funcOnTradePrice, maxSize = None, policy = None, conflationKey = None ): 
 		self.logger.info( "Registering trade listener for exchangeAccount:[%s]" % exchangeAccount )  
-		self.funcOnTradePriceListeners[ exchangeAccount.getAccountId() ] = funcOnTradePrice 
+		self.funcOnTradePriceListeners[ exchangeAccount.getAccountId() ] = self.dispatchListener( funcOnTradePrice, maxSize, policy, conflationKey ) 
 	
 	def publishTrades(self, trades):
 			
@@ -60,6 +109,54 @@ class Exchange( object ):
 			else: 
 				self.logger.warning( "Failed to publish trade to listener no listener attached accoutnId:[%s] tradeId:[%s]" % ( trade.getAccountId(), trade.tradeId ) ) 
 
+	def createBookSnapshot(self):
+		return book_feed.BookUpdate( self.symbol, self.bookSequence, [ level + ( self.bookSequence, ) for level in self.orderBook.getLevels() ], isSnapshot = True )
+
+	def publishBookDeltas(self):
+		# Sends the levels changed since the last call to every quote listener as one BookUpdate, the cost is proportional to 
+		# the changed levels.  Every bookSnapshotInterval deltas a snapshot follows so subscribers that missed an update recover 
+		if not self.funcOnQuoteListeners: 
+			self.orderBook.clearChangedLevels() 
+			return 
+
+		deltas = [] 
+		for level in self.orderBook.takeChangedLevels(): 
+			self.bookSequence += 1 
+			deltas.append( level + ( self.bookSequence, ) )
+		if not deltas: 
+			return 
+		bookUpdate = book_feed.BookUpdate( self.symbol, self.bookSequence, deltas )
+		for funcOnQuote in self.funcOnQuoteListeners.values(): 
+			funcOnQuote( bookUpdate ) 
+
+		self.bookDeltasSinceSnapshot += len ( deltas ) 
+		if self.bookSnapshotInterval and self.bookDeltasSinceSnapshot >= self.bookSnapshotInterval: 
+			self.logger.info( "Publishing book snapshot symbol:[%s] sequence:[%s]" % ( self.symbol, self.bookSequence ) )  
+			self.bookDeltasSinceSnapshot = 0 
+			bookSnapshot = self.createBookSnapshot() 
+			for funcOnQuote in self.funcOnQuoteListeners.values(): 
+				funcOnQuote( bookSnapshot ) 
+
+	def publishTradesByAccount(self, trades):
+		# Groups the trades of a batch by account so each listener is called once, accounts without a trades listener 
+		# fall back to their per trade listener 
+		self.logger.info( "Publishing batch of [%s] trades" % ( len ( trades ) ) )  
+
+		accountTrades = {} 
+		for trade in trades: 
+			if trade is not None: 
+				accountTrades.setdefault( trade.getAccountId(), [] ).append( trade ) 
+
+		for accountId, tradesForAccount in accountTrades.iteritems(): 
+			if accountId in self.funcOnTradesListeners: 
+				self.funcOnTradesListeners[ accountId ]( tradesForAccount ) 
+			elif accountId in self.funcOnTradeListeners: 
+				publishFunc = self.funcOnTradeListeners[ accountId ] 
+				for trade in tradesForAccount: 
+					publishFunc( trade ) 
+			else: 
+				self.logger.warning( "Failed to publish [%s] trades to listener no listener attached accoutnId:[%s]" % ( len ( tradesForAccount ), accountId ) ) 
+
 	def validateOrder(self, currentOrder):
 		# Validate symbol is correct for exchange, user is able to trade in that symbol, the qty is reasonable, the price is reasonable, etc.... 
 
@@ -67,19 +164,55 @@ class Exchange( object ):
 			self.logger.warning( "Failed to validate order, Invalid symbol for exchange order:[%s]" % ( currentOrder ) ) 
 			raise Exception('Invalid Symbol for Exchange')
 
+		if math.isnan( currentOrder.getQty() ) or math.isinf( currentOrder.getQty() ): # e.g. NaN from a binary order entry message 
+			self.logger.warning( "Failed to validate order, Quantity is not finite order:[%s]" % ( currentOrder ) ) 
+			raise Exception('Invalid Quantity, quantity must be a finite value')
+
 		if currentOrder.getQty() <= 0: 
 			self.logger.warning( "Failed to validate order, Invalid Quantity order:[%s]" % ( currentOrder ) ) 
 			raise Exception('Invalid Quantity, quantity most be a positive value')
 			
 		if currentOrder.getOrderType() == order.OrderTypes.Limit : # check price only for limit orders 
+			if math.isnan( currentOrder.getPrice() ) or math.isinf( currentOrder.getPrice() ): 
+				self.logger.warning( "Failed to validate order, Price is not finite order:[%s]" % ( currentOrder ) ) 
+				raise Exception('Invalid Price, for limit orders price must be a finite value')
 			if currentOrder.getPrice() <= 0:  # Although for some instruments negative prices are valid, we are not going to allow this here
 				self.logger.warning( "Failed to validate order, Invalid Price order:[%s]" % ( currentOrder ) ) 
 				raise Exception('Invalid Price, for limit orders price must be a positive value ')
+			if not self.orderBook.isValidTickPrice( currentOrder.getPrice() ): 
+				self.logger.warning( "Failed to validate order, Price is not a multiple of the tick size order:[%s]" % ( currentOrder ) ) 
+				raise Exception('Invalid Price, for limit orders price must be a multiple of the tick size')
 	
 	def createNewOrderId(self):
 		self.currentExchangeOrderId += 1 
 		return self.currentExchangeOrderId 
 	
+	def processOrder(self, currentOrder, trades):
+		# Matches a validated order that has been given an order id, the resulting trades are appended to trades 
+		if currentOrder.orderType == order.OrderTypes.Market: 
+			if currentOrder.tradeAction == trade.TradeActions.Buy: 
+				self.fillBuyOrder ( currentOrder, trades = trades ) 
+			elif currentOrder.tradeAction == trade.TradeActions.Sell: 
+				self.fillSellOrder ( currentOrder, trades = trades ) 
+			else: 
+				self.logger.warning( "Failed to handle Trade Action for order:[%s]" % ( currentOrder ) ) 
+				raise Exception ("Failed to handle Trade Action")	
+
+		elif currentOrder.orderType == order.OrderTypes.Limit: 
+			if currentOrder.tradeAction == trade.TradeActions.Buy: 
+				self.processLimitBuyOrder ( currentOrder, trades ) 
+			elif currentOrder.tradeAction == trade.TradeActions.Sell: 
+				self.processLimitSellOrder ( currentOrder, trades ) 
+			else: 
+				self.logger.warning( "Failed to handle Trade Action for order:[%s]" % ( currentOrder ) ) 
+				raise Exception ("Failed to handle Trade Action")	
+		
+		else: 
+			self.logger.warning( "Failed to handle Order Type for order:[%s]" % ( currentOrder ) ) 
+			raise Exception ("Failed to handle Order Type")	
+
+		return trades 
+
 	def submitOrder(self, currentOrder):
 
 		try:
@@ -87,32 +220,11 @@ class Exchange( object ):
 			
 			self.validateOrder( currentOrder )
 			currentOrder.setOrderId( self.createNewOrderId() )
-			trades = []  
-		
-			if currentOrder.orderType == order.OrderTypes.Market: 
-				if currentOrder.tradeAction == trade.TradeActions.Buy: 
-					trades = trades + self.fillBuyOrder ( currentOrder ) 
-				elif currentOrder.tradeAction == trade.TradeActions.Sell: 
-					trades = trades + self.fillSellOrder ( currentOrder ) 
-				else: 
-					self.logger.warning( "Failed to handle Trade Action for order:[%s]" % ( currentOrder ) ) 
-					raise Exception ("Failed to handle Trade Action")	
-
-			elif currentOrder.orderType == order.OrderTypes.Limit: 
-				if currentOrder.tradeAction == trade.TradeActions.Buy: 
-					trades = trades + self.processLimitBuyOrder ( currentOrder )
-				elif currentOrder.tradeAction == trade.TradeActions.Sell: 
-					trades = trades + self.processLimitSellOrder ( currentOrder ) 
-				else: 
-					self.logger.warning( "Failed to handle Trade Action for order:[%s]" % ( currentOrder ) ) 
-					raise Exception ("Failed to handle Trade Action")	
-			
-			else: 
-				self.logger.warning( "Failed to handle Order Type for order:[%s]" % ( currentOrder ) ) 
-				raise Exception ("Failed to handle Order Type")	
+			trades = self.processOrder( currentOrder, [] ) 
 			
 			if len(trades) > 0:
 				self.publishTrades( trades ) 
+			self.publishBookDeltas() 
 
 			return ( True, currentOrder.getOrderId() ) 
 
@@ -120,67 +232,143 @@ class Exchange( object ):
 			self.logger.exception( "Exception caught while processing orderId:[%s] exception:[%s]" % ( currentOrder.orderId, ex ) ) 
 			return ( False, ex.args[0] )  
 
+	def submitOrders(self, orders):
+		# Submits a batch of orders.  The whole batch is validated first, the valid orders are then matched in arrival order 
+		# into a single trade buffer which is published once at the end, grouped by account.  Returns one result per order
+		# in the same format as submitOrder 
+		self.logger.info( "Processing submitOrders for [%s] orders" % ( len ( orders ) ) ) 
+
+		results = [ None ] * len ( orders ) 
+		for i, currentOrder in enumerate ( orders ): 
+			try: 
+				self.validateOrder( currentOrder ) 
+			except Exception as ex: 
+				results[i] = ( False, ex.args[0] ) 
+
+		trades = [] 
+		for i, currentOrder in enumerate ( orders ): 
+			if results[i] is not None: 
+				continue 
+			try: 
+				currentOrder.setOrderId( self.createNewOrderId() ) 
+				self.processOrder( currentOrder, trades ) 
+				results[i] = ( True, currentOrder.getOrderId() ) 
+			except Exception as ex: 
+				self.logger.exception( "Exception caught while processing orderId:[%s] exception:[%s]" % ( currentOrder.orderId, ex ) ) 
+				results[i] = ( False, ex.args[0] ) 
+
+		if len(trades) > 0: 
+			self.publishTradesByAccount( trades ) 
+		self.publishBookDeltas() 
+
+		return results 
+
+	def getOpenOrderIdsForAccountId (self, accountId):
+		return sorted ( self.orderBook.getOrderIdsForAccount( accountId ) )
+
 	def getSumerizedAllOpenOrdersForAccountId (self, accountId):
 		# There should be validation that the current user can view the accountId orders
-		# This method is not efficient for use here, current use case is only for testing purposes,
-		# it should be modified to use a different data structure that is more efficient if using during application runtime 
-		return list( (aOrderTuple) for orderId, aOrderTuple in self.deleteOrderDict.items() if aOrderTuple[2] == accountId )
+		# Uses the per account index of the order slab, cost is proportional to the number of open orders of the account 
+		return list( self.orderBook.getOpenOrderInfo( orderId ) for orderId in self.getOpenOrderIdsForAccountId( accountId ) )
+	
+	def cancelAllOrdersForAccount(self, accountId):
+		# Cancels every open order of the account ( e.g. cancel on disconnect ), the top of book is recomputed once at the end
+		self.logger.info( "processing cancel all orders for accountId:[%s]" % ( accountId ) )
+
+		canceledOrderIds = self.getOpenOrderIdsForAccountId( accountId ) 
+		for orderId in canceledOrderIds: 
+			tradeAction, priceLevel, orderAccountId = self.orderBook.getOpenOrderInfo( orderId ) 
+			self.orderBook.removeOrderFromOrderBook( tradeAction, priceLevel, orderId, updateTopOfBook = False )
+
+		if canceledOrderIds: 
+			self.orderBook.updateTopOfBook() 
+			self.publishBookDeltas() 
+		return canceledOrderIds 
 	
 	def cancelOrder(self, orderId):
 		self.logger.info( "processing cancel order orderId:[%s]" % ( orderId ) )
 
-		if orderId in self.deleteOrderDict: 
-			tradeAction, priceLevel, accountId  = self.deleteOrderDict[ orderId ]
+		orderInfo = self.orderBook.getOpenOrderInfo( orderId ) 
+		if orderInfo is not None: 
+			tradeAction, priceLevel, accountId  = orderInfo 
 			self.orderBook.removeOrderFromOrderBook( tradeAction, priceLevel, orderId )
-			del self.deleteOrderDict[orderId]
+			self.publishBookDeltas() 
 			return True
 
 		else: 
 			self.logger.warning ( "Failed to remove order from the order book. Could not find orderId:[%s]" % ( orderId ) )
 			raise Exception ( "Failed to remove order from the order book.  Could not find orderId:[%s]. Order was likely already matched" % ( orderId ) ) 
 	
-	def matchTrade( self, currentOrder, matchOrder, matchPrice ):
+	def matchTrade( self, currentOrder, matchOrder, matchPrice, trades = None ):
 				
 		self.logger.info ( "Matching two orders currentOrderId:[%s], matchOrderId:[%s], matchPrice:[%f]" % ( currentOrder.orderId, matchOrder.orderId, matchPrice ) )
 		self.logger.info ( "Matching two orders currentOrder:[%s]" % ( currentOrder ) )
 		self.logger.info ( "Matching two orders matchOrder:[%s]" % ( matchOrder ) )
 
-		trades = [] 
+		if trades is None: 
+			trades = [] 
 		self.tradeId += 1  
 		tradeQty = min ( currentOrder.getQty(), matchOrder.getQty() )
 
 		transactionFee = matchPrice * tradeQty * self.transactionFeePercentage 
-		currentOrder.extraInfo ['transactionFee'] = transactionFee 
-		matchOrder.extraInfo ['transactionFee'] = transactionFee 
+		currentOrder.addFee( transactionFee )
+		matchOrder.addFee( transactionFee )
 
-		trades.append( trade.Trade ( currentOrder.getAccountId(), self.tradeId, tradeQty, matchPrice, currentOrder.getTradeAction(), self.symbol, extraInfo = currentOrder.extraInfo ) ) 
-		trades.append( trade.Trade ( matchOrder.getAccountId(), self.tradeId, tradeQty, matchPrice, matchOrder.getTradeAction(), self.symbol, extraInfo = matchOrder.extraInfo ) ) 
+		trades.append( trade.Trade ( currentOrder.getAccountId(), self.tradeId, tradeQty, matchPrice, currentOrder.getTradeAction(), self.symbol, extraInfo = currentOrder.extraInfo, orderId = currentOrder.getOrderId(), fee = transactionFee ) ) 
+		trades.append( trade.Trade ( matchOrder.getAccountId(), self.tradeId, tradeQty, matchPrice, matchOrder.getTradeAction(), self.symbol, extraInfo = matchOrder.extraInfo, orderId = matchOrder.getOrderId(), fee = transactionFee ) ) 
+		self.tradeTape.appendTrade( trades[-2] ) 
+		self.tradeTape.appendTrade( trades[-1] ) 
 			
 		currentOrder.setQty( currentOrder.getQty() - tradeQty )
-		matchOrder.setQty( matchOrder.getQty() - tradeQty )
+		self.orderBook.reduceOrderQty( matchOrder, tradeQty ) # Resting order, keeps price level totals in sync 
+
+		return trades 
 
+	def matchPriceLevel( self, currentOrder, matchOrders, matchPrice, trades ):
+		# Fills currentOrder against every order of a price level that was fully consumed and already removed from the book.
+		# Produces one trade pair per resting order like matchTrade but without per order logging or order book updates 
+		self.logger.info ( "Matching price level currentOrderId:[%s], matchPrice:[%f], orderCount:[%s]" % ( currentOrder.orderId, matchPrice, len ( matchOrders ) ) )
+
+		accountId = currentOrder.getAccountId() 
+		tradeAction = currentOrder.getTradeAction() 
+		orderId = currentOrder.getOrderId() 
+		filledQty = 0 
+		for matchOrder in matchOrders: 
+			self.tradeId += 1  
+			tradeQty = matchOrder.getQty() 
+			transactionFee = matchPrice * tradeQty * self.transactionFeePercentage 
+			currentOrder.addFee( transactionFee )
+			matchOrder.addFee( transactionFee )
+
+			trades.append( trade.Trade ( accountId, self.tradeId, tradeQty, matchPrice, tradeAction, self.symbol, extraInfo = currentOrder.extraInfo, orderId = orderId, fee = transactionFee ) ) 
+			trades.append( trade.Trade ( matchOrder.getAccountId(), self.tradeId, tradeQty, matchPrice, matchOrder.getTradeAction(), self.symbol, extraInfo = matchOrder.extraInfo, orderId = matchOrder.getOrderId(), fee = transactionFee ) ) 
+			self.tradeTape.appendTrade( trades[-2] ) 
+			self.tradeTape.appendTrade( trades[-1] ) 
+			matchOrder.setQty( 0 )
+			filledQty += tradeQty 
+
+		currentOrder.setQty( currentOrder.getQty() - filledQty )
 		return trades 
 
-	def processLimitBuyOrder ( self, currentOrder ): 
+	def processLimitBuyOrder ( self, currentOrder, trades = None ): 
+		if trades is None: 
+			trades = [] 
 		if currentOrder.getPrice() >= self.orderBook.getLowestAskPrice()  and self.orderBook.getLowestAskPrice() is not None:  # Should fill limit order against market orders if possible 
-			trades = self.fillBuyOrder( currentOrder, stoppingPrice = currentOrder.getPrice() )
+			self.fillBuyOrder( currentOrder, stoppingPrice = currentOrder.getPrice(), trades = trades )
 			if currentOrder.getQty() > 0:
 				self.orderBook.appendBuyOfferToOrderBook( currentOrder )
-				self.deleteOrderDict [ currentOrder.getOrderId() ] = ( currentOrder.getTradeAction(), currentOrder.getPrice(), currentOrder.getAccountId() ) 
 			return trades 
 		else:  # Did not cross the market, only need to append to quote book
 			self.orderBook.appendBuyOfferToOrderBook( currentOrder )
-			self.deleteOrderDict [ currentOrder.getOrderId() ] = ( currentOrder.getTradeAction(), currentOrder.getPrice(), currentOrder.getAccountId() ) 
-			return []
+			return trades
 
 	def checkMatchBuyOrder ( self, matchOrder, processingData ) :
 
 		currentOrder, trades, stoppingPrice  = processingData
-		trades += self.matchTrade( currentOrder, matchOrder, matchOrder.getPrice() )
+		self.matchTrade( currentOrder, matchOrder, matchOrder.getPrice(), trades )
 	
 		if matchOrder.getQty() == 0:
 			self.orderBook.removeSellOrderFromOrderBook ( matchOrder.getPrice(), matchOrder.getOrderId() )  
-			del self.deleteOrderDict [ matchOrder.getOrderId() ]
 	
 		if stoppingPrice is not None : 
 			if self.orderBook.getLowestAskPrice() > currentOrder.getPrice(): # Need to append new bid offer into the market 
@@ -191,38 +379,44 @@ class Exchange( object ):
 		
 		return True 
 
-	def fillBuyOrder( self, currentOrder, stoppingPrice = None):
-		trades = [] 
+	def fillBuyOrder( self, currentOrder, stoppingPrice = None, trades = None ):
+		if trades is None: 
+			trades = [] 
 		while currentOrder.getQty() > 0 :
-			if self.orderBook.getLowestAskPrice() == None: 
+			lowestAskPrice = self.orderBook.getLowestAskPrice() 
+			if lowestAskPrice == None: 
 				self.logger.warning ( "There are not enough orders in the ask book for completly fill the order" ) 
 				return trades 
-			
-			processingData = ( currentOrder, trades, stoppingPrice ) 
-			self.orderBook.visitAskOrders( self.checkMatchBuyOrder, processingData )
+			if stoppingPrice is not None and lowestAskPrice > stoppingPrice: 
+				return trades 
+
+			if currentOrder.getQty() >= self.orderBook.getAskPriceLevel( lowestAskPrice ).getTotalQty(): # Whole level is consumed 
+				self.matchPriceLevel( currentOrder, self.orderBook.removeBestAskPriceLevel(), lowestAskPrice, trades )
+			else: # Last level is partially filled order by order 
+				processingData = ( currentOrder, trades, stoppingPrice ) 
+				self.orderBook.visitAskOrders( self.checkMatchBuyOrder, processingData )
 			
 		return trades 
 
-	def processLimitSellOrder ( self, currentOrder ): 
+	def processLimitSellOrder ( self, currentOrder, trades = None ): 
+		if trades is None: 
+			trades = [] 
 		if currentOrder.getPrice() <= self.orderBook.getHighestBidPrice() and self.orderBook.getHighestBidPrice() is not None:
-			trades = self.fillSellOrder( currentOrder, stoppingPrice = currentOrder.getPrice() )
+			self.fillSellOrder( currentOrder, stoppingPrice = currentOrder.getPrice(), trades = trades )
 			if currentOrder.getQty() > 0:
 				self.orderBook.appendSellOfferToOrderBook( currentOrder )
-				self.deleteOrderDict [ currentOrder.getOrderId() ] = ( currentOrder.getTradeAction(), currentOrder.getPrice(), currentOrder.getAccountId() ) 
 			return trades 
 		else:
 			self.orderBook.appendSellOfferToOrderBook( currentOrder )
-			self.deleteOrderDict [ currentOrder.getOrderId() ] = ( currentOrder.getTradeAction(), currentOrder.getPrice(), currentOrder.getAccountId() ) 
-			return []
+			return trades
 	
 	def checkMatchSellOrder ( self, matchOrder, processingData ) :
 
 		currentOrder, trades, stoppingPrice  = processingData
-		trades += self.matchTrade( currentOrder, matchOrder, matchOrder.getPrice() )
+		self.matchTrade( currentOrder, matchOrder, matchOrder.getPrice(), trades )
 	
 		if matchOrder.getQty() == 0:
 			self.orderBook.removeBuyOrderFromOrderBook ( matchOrder.getPrice(), matchOrder.getOrderId() )  
-			del self.deleteOrderDict [ matchOrder.getOrderId() ]
 	
 		if stoppingPrice is not None : 
 			if self.orderBook.getHighestBidPrice() < currentOrder.getPrice(): # Need to append new bid offer into the market 
@@ -233,24 +427,31 @@ class Exchange( object ):
 			
 		return True 
 
-	def fillSellOrder( self, currentOrder, stoppingPrice = None):
-		trades = [] 
+	def fillSellOrder( self, currentOrder, stoppingPrice = None, trades = None ):
+		if trades is None: 
+			trades = [] 
 		while currentOrder.getQty() > 0 :
 				
 			self.logger.info( "currentOrder.getQty():[%s], self.orderBook.getHighestBidPrice():[%s]" % ( currentOrder.getQty(), self.orderBook.getHighestBidPrice() ) ) 
 
-			if self.orderBook.getHighestBidPrice() == None: 
+			highestBidPrice = self.orderBook.getHighestBidPrice() 
+			if highestBidPrice == None: 
 				self.logger.warning ( "There are not enough orders in the ask book for completly fill the order" ) 
 				return trades 
-			
-			processingData = ( currentOrder, trades, stoppingPrice ) 
-			self.orderBook.visitBidOrders( self.checkMatchSellOrder, processingData )
+			if stoppingPrice is not None and highestBidPrice < stoppingPrice: 
+				return trades 
+
+			if currentOrder.getQty() >= self.orderBook.getBidPriceLevel( highestBidPrice ).getTotalQty(): # Whole level is consumed 
+				self.matchPriceLevel( currentOrder, self.orderBook.removeBestBidPriceLevel(), highestBidPrice, trades )
+			else: # Last level is partially filled order by order 
+				processingData = ( currentOrder, trades, stoppingPrice ) 
+				self.orderBook.visitBidOrders( self.checkMatchSellOrder, processingData )
 			
 		return trades 
 	
 	def clearExchange( self ): 
 		self.orderBook.clearOrderBook() 
-		self.deleteOrderDict = {} 
+		self.publishBookDeltas() 
 	
 class TestExchange():
 	
@@ -333,6 +534,19 @@ class TestExchange():
 		result = testExchange.submitOrder( testOrder )
 		assert ( result[0] == False )  
 		
+		testOrder = order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 10.005 , 10, 0, testExchangeParticipant1.getAccount().getAccountId() ) 
+		result = testExchange.submitOrder( testOrder )
+		assert ( result[0] == False )  
+
+		# Non finite values, NaN compares False with everything so it passes the range checks 
+		for price, qty in ( ( float ( 'nan' ), 10 ), ( float ( 'inf' ), 10 ), ( 10, float ( 'nan' ) ), ( 10, float ( 'inf' ) ) ): 
+			testOrder = order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, price , qty, 0, testExchangeParticipant1.getAccount().getAccountId() ) 
+			result = testExchange.submitOrder( testOrder )
+			assert ( result[0] == False and result[1].startswith( 'Invalid' ) )  
+		testOrder = order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Market, None , float ( 'nan' ), 0, testExchangeParticipant1.getAccount().getAccountId() ) 
+		assert ( testExchange.submitOrder( testOrder )[0] == False )  
+		assert ( testExchange.orderBook.getTopOfBook().bid is None )  
+		
 		print "Test Completed Succesfully"	
 
 
@@ -357,6 +571,182 @@ class TestExchange():
 
 		print "Test Completed Succesfully"	
 
+	@staticmethod
+	def testExchangeTimePriority():
+		
+		( symbol, testExchange, testExchangeParticipant1, testExchangeParticipant2 )  = TestExchange.testExchangeCreateTestSetup()
+	
+		orderIds = [] 
+		for i in range ( 0, 4 ): 
+			testOrder = order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 10, 100, 0, testExchangeParticipant1.getAccount().getAccountId() ) 
+			result = testExchange.submitOrder( testOrder )
+			assert ( result[0] == True )  
+			orderIds.append( result[1] ) 
+		
+		# Cancel an order in the middle of the queue, the remaining orders keep their priority 
+		testExchange.cancelOrder( orderIds[1] )
+		
+		testOrder = order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Market, None, 150, 0, testExchangeParticipant2.getAccount().getAccountId() ) 
+		result = testExchange.submitOrder( testOrder )
+		assert ( result[0] == True )  
+		
+		remainingOrders = [ o.getOrderId() for o in testExchange.orderBook.getAskPriceLevel(10) ] 
+		assert ( remainingOrders == [ orderIds[2], orderIds[3] ] ) 
+		assert ( testExchange.orderBook.getAskPriceLevel(10)[ orderIds[2] ].getQty() == 50 ) 
+		assert ( testExchange.orderBook.getTopOfBook() == quote.Quote (symbol, None, 10, 0, 150) ) 
+
+		print "Test Completed Succesfully"	
+
+	@staticmethod
+	def testDenseExchange():
+		
+		symbol = "AA"
+		testExchange = Exchange( symbol, tickSize = .05, denseBandTicks = 20 )
+		testExchangeParticipant1 = exchange_participant.ExchangeParticipant( exchange_account.ExchangeAccount(1) )
+		testExchange.registerTradeListener( testExchangeParticipant1.getAccount(), testExchangeParticipant1.onTrade )
+		accountId = testExchangeParticipant1.getAccount().getAccountId() 
+		
+		for i in range ( 0, 40 ): 
+			testOrder = order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 10 + i * .05, 10, accountId ) 
+			assert ( testExchange.submitOrder( testOrder )[0] == True )  
+		
+		# Sweep across the edge of the dense band 
+		testOrder = order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 11.5, 305, accountId ) 
+		assert ( testExchange.submitOrder( testOrder )[0] == True )  
+		assert ( testExchange.orderBook.getTopOfBook() == quote.Quote (symbol, None, 11.5, 0, 5) ) 
+
+		print "Test Completed Succesfully"	
+
+	@staticmethod
+	def testCancelAllOrdersForAccount():
+		
+		( symbol, testExchange, testExchangeParticipant1, testExchangeParticipant2 )  = TestExchange.testExchangeCreateTestSetup()
+		accountId1 = testExchangeParticipant1.getAccount().getAccountId() 
+		accountId2 = testExchangeParticipant2.getAccount().getAccountId() 
+		
+		for i in range ( 0, 5 ): 
+			assert ( testExchange.submitOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 10 - i, 10, accountId1 ) )[0] == True ) 
+			assert ( testExchange.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 11 + i, 10, accountId1 ) )[0] == True ) 
+		assert ( testExchange.submitOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 8, 5, accountId2 ) )[0] == True ) 
+		result = testExchange.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 12, 5, accountId2 ) )
+		assert ( result[0] == True ) 
+		assert ( len ( testExchange.getSumerizedAllOpenOrdersForAccountId( accountId1 ) ) == 10 ) 
+
+		# Fills and cancels keep the account index up to date 
+		assert ( testExchange.submitOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Market, None, 10, accountId2 ) )[0] == True ) 
+		testExchange.cancelOrder( result[1] ) 
+		assert ( len ( testExchange.getSumerizedAllOpenOrdersForAccountId( accountId1 ) ) == 9 ) 
+		assert ( testExchange.getSumerizedAllOpenOrdersForAccountId( accountId2 ) == [ ( trade.TradeActions.Buy, 8, accountId2 ) ] ) 
+		
+		canceledOrderIds = testExchange.cancelAllOrdersForAccount( accountId1 ) 
+		assert ( len ( canceledOrderIds ) == 9 ) 
+		assert ( testExchange.getSumerizedAllOpenOrdersForAccountId( accountId1 ) == [] ) 
+		assert ( testExchange.orderBook.getTopOfBook() == quote.Quote (symbol, 8, None, 5, 0) ) 
+		assert ( testExchange.cancelAllOrdersForAccount( accountId1 ) == [] ) 
+
+		print "Test Completed Succesfully"	
+
+	@staticmethod
+	def testSubmitOrders():
+		
+		( symbol, testExchange, testExchangeParticipant1, testExchangeParticipant2 )  = TestExchange.testExchangeCreateTestSetup()
+		accountId1 = testExchangeParticipant1.getAccount().getAccountId() 
+		accountId2 = testExchangeParticipant2.getAccount().getAccountId() 
+
+		publishedTrades = [] 
+		testExchange.registerTradesListener( testExchangeParticipant2.getAccount(), publishedTrades.append ) 
+
+		orders = [ order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 10, 100, accountId1 ), 
+			order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 11, 100, accountId1 ), 
+			order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, -1, 100, accountId2 ), # Rejected up front 
+			order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 11, 150, accountId2 ), 
+			order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Market, None, 25, accountId2 ) ] 
+		results = testExchange.submitOrders( orders ) 
+
+		assert ( [ result[0] for result in results ] == [ True, True, False, True, True ] ) 
+		assert ( [ result[1] for result in results if result[0] ] == [ 1, 2, 3, 4 ] ) 
+
+		# Account 2 received its three trades in one call, in the order they happened 
+		assert ( len ( publishedTrades ) == 1 ) 
+		assert ( [ ( t.orderId, t.qty, t.tradePrice ) for t in publishedTrades[0] ] == [ ( 3, 100, 10 ), ( 3, 50, 11 ), ( 4, 25, 11 ) ] ) 
+		assert ( testExchange.orderBook.getTopOfBook() == quote.Quote (symbol, None, 11, 0, 25) ) 
+
+		print "Test Completed Succesfully"	
+
+	@staticmethod
+	def testSweepPriceLevels():
+		
+		( symbol, testExchange, testExchangeParticipant1, testExchangeParticipant2 )  = TestExchange.testExchangeCreateTestSetup()
+		accountId1 = testExchangeParticipant1.getAccount().getAccountId() 
+		accountId2 = testExchangeParticipant2.getAccount().getAccountId() 
+		publishedTrades = [] 
+		testExchange.registerTradesListener( testExchangeParticipant2.getAccount(), publishedTrades.extend ) 
+
+		for price in [ 10, 11, 12, 14 ]: 
+			for i in range ( 0, 3 ): 
+				testExchange.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, price, 10, accountId1 ) ) 
+
+		# Levels 10 and 11 are consumed whole, level 12 is partially filled order by order 
+		testOrder = order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Market, None, 75, accountId2 ) 
+		assert ( testExchange.submitOrders( [ testOrder ] )[0][0] == True ) 
+		assert ( [ ( t.qty, t.tradePrice ) for t in publishedTrades ] == [ ( 10, 10 ) ] * 3 + [ ( 10, 11 ) ] * 3 + [ ( 10, 12 ), ( 5, 12 ) ] ) 
+		assert ( testOrder.getQty() == 0 ) 
+		assert ( testExchange.orderBook.getTopOfBook() == quote.Quote (symbol, None, 12, 0, 15) ) 
+		assert ( testExchange.orderBook.getTotalAskQtyBelowPrice( 100 ) == 45 and len ( testExchange.orderBook.orderSlab ) == 5 ) 
+
+		# A marketable limit order stops at its limit price and rests the remainder 
+		testOrder = order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 13, 40, accountId2 ) 
+		assert ( testExchange.submitOrder( testOrder )[0] == True ) 
+		assert ( testExchange.orderBook.getTopOfBook() == quote.Quote (symbol, 13, 14, 25, 30) ) 
+		assert ( testExchange.getSumerizedAllOpenOrdersForAccountId( accountId1 ) == [ ( trade.TradeActions.Sell, 14, accountId1 ) ] * 3 ) 
+
+		# Sell side sweep across the resting bid and into an empty book 
+		testOrder = order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Market, None, 30, accountId1 ) 
+		assert ( testExchange.submitOrder( testOrder )[0] == True ) 
+		assert ( testOrder.getQty() == 5 and testExchange.orderBook.getHighestBidPrice() is None ) 
+
+		# Every fill is on the trade tape, both sides of each trade 
+		assert ( len ( testExchange.tradeTape ) == 2 * 11 ) 
+		assert ( testExchange.tradeTape.getColumn( 'qty' ).sum() == 2 * ( 75 + 15 + 25 ) ) 
+		assert ( list ( testExchange.tradeTape.getColumn( 'accountId' )[ : 2 ] ) == [ accountId2, accountId1 ] ) 
+
+		print "Test Completed Succesfully"	
+
+	@staticmethod
+	def testForkExchange():
+		
+		( symbol, testExchange, testExchangeParticipant1, testExchangeParticipant2 )  = TestExchange.testExchangeCreateTestSetup()
+		accountId1 = testExchangeParticipant1.getAccount().getAccountId() 
+		accountId2 = testExchangeParticipant2.getAccount().getAccountId() 
+
+		for price in [ 10, 11, 12 ]: 
+			for i in range ( 0, 2 ): 
+				testExchange.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, price, 10, accountId1 ) ) 
+		testExchange.submitOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 9, 10, accountId2 ) ) 
+
+		# The fork matches and cancels against its own copy of the book 
+		forkedExchange = testExchange.fork() 
+		forkedTrades = [] 
+		forkedExchange.registerTradeListener( testExchangeParticipant2.getAccount(), forkedTrades.append ) 
+		forkedExchange.registerTradeListener( testExchangeParticipant1.getAccount(), forkedTrades.append ) 
+		assert ( forkedExchange.submitOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Market, None, 25, accountId2 ) )[0] == True ) 
+		assert ( len ( forkedTrades ) == 6 and len ( testExchange.tradeTape ) == 0 ) 
+		assert ( forkedExchange.cancelAllOrdersForAccount( accountId1 ) == [ 3, 4, 5, 6 ] ) 
+		forkedExchange.cancelOrder( 7 ) 
+		assert ( forkedExchange.orderBook.getTopOfBook() == quote.Quote (symbol, None, None, 0, 0) ) 
+
+		assert ( testExchange.orderBook.getTopOfBook() == quote.Quote (symbol, 9, 10, 10, 20) ) 
+		assert ( len ( testExchange.getOpenOrderIdsForAccountId( accountId1 ) ) == 6 ) 
+		assert ( testExchange.orderBook.getAskPriceLevel( 12 ).getFrontOrder().getQty() == 10 ) 
+
+		# Order ids continue independently in each exchange, the market order used id 8 in the fork 
+		assert ( testExchange.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 9, 10, accountId1 ) ) == ( True, 8 ) ) 
+		assert ( forkedExchange.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 13, 10, accountId1 ) ) == ( True, 9 ) ) 
+		assert ( testExchange.orderBook.getTopOfBook() == quote.Quote (symbol, None, 10, 0, 20) ) 
+		assert ( forkedExchange.orderBook.getTopOfBook() == quote.Quote (symbol, None, 13, 0, 10) ) 
+
+		print "Test Completed Succesfully"	
+
 if __name__ == "__main__":
 	
 	logger.MyLogger.InitializeLogger()
@@ -365,4 +755,10 @@ if __name__ == "__main__":
 	TestExchange.testExchangeSubmitLimitOrderPartialFill()
 	TestExchange.testInvalidOrder()
 	TestExchange.testExchangeCancelOrder()
+	TestExchange.testExchangeTimePriority()
+	TestExchange.testDenseExchange()
+	TestExchange.testCancelAllOrdersForAccount()
+	TestExchange.testSubmitOrders()
+	TestExchange.testSweepPriceLevels()
+	TestExchange.testForkExchange()
 
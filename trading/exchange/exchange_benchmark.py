@@ -0,0 +1,497 @@
+#!/usr/bin/python
+
+import trading.exchange.order as order
+import trading.exchange.trade as trade
+import trading.exchange.exchange as exchange
+import trading.exchange.exchange_simulation as exchange_simulation
+import trading.exchange.exchange_router as exchange_router
+import trading.exchange.exchange_account as exchange_account
+import trading.exchange.order_ring as order_ring
+import trading.exchange.exchange_gateway as exchange_gateway
+import trading.exchange.participant_queue as participant_queue
+import trading.exchange.tcp_gateway as tcp_gateway
+import trading.exchange.listener_dispatcher as listener_dispatcher
+import trading.exchange.book_feed as book_feed
+import threading
+import multiprocessing
+import Queue
+import trading.time_series.time_series as time_series
+import logging
+import resource
+import sys
+import gc
+import copy
+import time
+import random
+import tempfile
+import shutil
+
+class LegacyOrder:
+
+	"""
+	Copy of the original order layout ( old style class with a per instance __dict__ ) kept only as the baseline for the
+	memory benchmark below.
+	"""
+
+	def __init__(self, symbol, tradeAction, orderType, price, qty, acctId, orderId=None ):
+		self.symbol = symbol
+		self.tradeAction = tradeAction
+		self.orderType = orderType
+		self.price = price
+		self.qty = qty
+		self.originalQty = qty
+		self.orderId = orderId
+		self.acctId = acctId
+		self.state = None
+		self.extraInfo = None
+
+class QueueRecordRing():
+
+	"""
+	multiprocessing.Queue with the tryPut and drain of order_ring.RecordRing, so the ingress benchmark runs the same
+	OrderRingConsumer over both transports.  Each record is pickled and sent through a pipe.
+	"""
+
+	def __init__(self, capacity = 1 << 14):
+		self.queue = multiprocessing.Queue( capacity )
+
+	def tryPut(self, *record):
+		try:
+			self.queue.put_nowait( record )
+			return True
+		except Queue.Full:
+			return False
+
+	def put(self, *record):
+		self.queue.put( record )
+
+	def drain(self, maxRecords = 1024):
+		records = []
+		try:
+			while len ( records ) < maxRecords:
+				records.append( self.queue.get_nowait() )
+		except Queue.Empty:
+			pass
+		return records
+
+class ExchangeBenchmark():
+
+	"""
+	This class contains benchmarks for the exchange.  They are not tests, they print the measurements so changes to the data
+	structures of the exchange can be compared before and after.
+	"""
+
+	@staticmethod
+	def getMaxRssBytes():
+		return resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss * 1024 # ru_maxrss is in kilobytes on linux
+
+	@staticmethod
+	def measureInChildProcess( function, *args ):
+		# ( growth of the peak RSS, seconds ) while function runs, in a forked child so the peak of earlier benchmarks does
+		# not hide the growth.  The child sees the objects of this process as they were when it started
+		results = multiprocessing.Queue()
+		def run():
+			gc.collect()
+			startRss = ExchangeBenchmark.getMaxRssBytes()
+			startTime = time.time()
+			kept = function( *args ) # Held until the peak is read
+			seconds = time.time() - startTime
+			gc.collect()
+			results.put( ( ExchangeBenchmark.getMaxRssBytes() - startRss, seconds ) )
+		child = multiprocessing.Process( target = run )
+		child.start()
+		result = results.get()
+		child.join()
+		return result
+
+	@staticmethod
+	def createLegacyRestingOrders( numberOfOrders ):
+		# The original layout, price level -> dict of orderId -> order on each side and orderId -> ( side, price, accountId )
+		bidOrderBook = {}
+		askOrderBook = {}
+		deleteOrderDict = {}
+		for i in xrange ( 0, numberOfOrders ):
+			if i % 2 == 0:
+				legacyOrder = LegacyOrder( "AA", trade.TradeActions.Buy, order.OrderTypes.Limit, 100 - ( i % 200 ) * .01 - .01, 10, 1, i + 1 )
+				bidOrderBook.setdefault( legacyOrder.price, {} )[ legacyOrder.orderId ] = legacyOrder
+			else:
+				legacyOrder = LegacyOrder( "AA", trade.TradeActions.Sell, order.OrderTypes.Limit, 100 + ( i % 200 ) * .01 + .01, 10, 1, i + 1 )
+				askOrderBook.setdefault( legacyOrder.price, {} )[ legacyOrder.orderId ] = legacyOrder
+			deleteOrderDict[ legacyOrder.orderId ] = ( legacyOrder.tradeAction, legacyOrder.price, legacyOrder.acctId )
+		return ( bidOrderBook, askOrderBook, deleteOrderDict )
+
+	@staticmethod
+	def createRestingExchange( numberOfOrders ):
+		testExchange = exchange.Exchange( "AA" )
+		ExchangeBenchmark.createRestingOrders( testExchange, numberOfOrders )
+		return testExchange
+
+	@staticmethod
+	def createRestingOrders( testExchange, numberOfOrders, accountId = 1 ):
+		# Spreads limit orders over 100 price levels on each side without crossing the market
+		for i in xrange ( 0, numberOfOrders ):
+			if i % 2 == 0:
+				testOrder = order.Order( testExchange.symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 100 - ( i % 200 ) * .01 - .01, 10, accountId )
+			else:
+				testOrder = order.Order( testExchange.symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 100 + ( i % 200 ) * .01 + .01, 10, accountId )
+			testExchange.submitOrder( testOrder )
+
+	@staticmethod
+	def benchmarkOrderObjectSize():
+		legacyOrder = LegacyOrder( "AA", trade.TradeActions.Buy, order.OrderTypes.Limit, 100.0, 10, 1, 1 )
+		legacyBytes = sys.getsizeof( legacyOrder ) + sys.getsizeof( legacyOrder.__dict__ )
+
+		slottedOrder = order.Order( "AA", trade.TradeActions.Buy, order.OrderTypes.Limit, 100.0, 10, 1, 1 )
+		slottedBytes = sys.getsizeof( slottedOrder )
+
+		print "Order object bytes before ( __dict__ ):[%s] after ( __slots__ ):[%s]" % ( legacyBytes, slottedBytes )
+		return ( legacyBytes, slottedBytes )
+
+	@staticmethod
+	def benchmarkRestingOrderMemory( numberOfOrders = 50000 ):
+		# Bytes per resting order including the order book and bookkeeping, measured as growth of the RSS of a fresh child
+		# process for the original dict of order objects layout and for the order slab of the exchange
+		legacyBytes = ExchangeBenchmark.measureInChildProcess( ExchangeBenchmark.createLegacyRestingOrders, numberOfOrders )[0] / float ( numberOfOrders )
+		slabBytes = ExchangeBenchmark.measureInChildProcess( ExchangeBenchmark.createRestingExchange, numberOfOrders )[0] / float ( numberOfOrders )
+
+		print "Resting orders:[%s] bytes per resting order before ( dict of order objects ):[%.1f] after ( order slab ):[%.1f]" % ( numberOfOrders, legacyBytes, slabBytes )
+		return ( legacyBytes, slabBytes )
+
+	@staticmethod
+	def createCrossingOrders( symbol, numberOfOrders ):
+		# Alternating buy and sell limit orders around 100 so roughly half of them trade against the book
+		orders = []
+		for i in xrange ( 0, numberOfOrders ):
+			if i % 2 == 0:
+				orders.append( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 100 + ( i % 7 - 3 ) * .01, 10 + i % 5, 1 + i % 4 ) )
+			else:
+				orders.append( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 100 + ( i % 11 - 5 ) * .01, 10 + i % 3, 1 + i % 4 ) )
+		return orders
+
+	@staticmethod
+	def benchmarkBatchSubmission( numberOfOrders = 50000, batchSize = 100 ):
+		# Orders per second of submitOrder called in a loop compared with submitOrders called with batches of the same orders
+		def onTrade( trade ):
+			pass
+		def onTrades( trades ):
+			pass
+
+		results = []
+		for useBatches in ( False, True ):
+			testExchange = exchange.Exchange( "AA" )
+			for accountId in range ( 1, 5 ):
+				testExchange.funcOnTradeListeners[ accountId ] = onTrade
+				testExchange.funcOnTradesListeners[ accountId ] = onTrades
+			orders = ExchangeBenchmark.createCrossingOrders( testExchange.symbol, numberOfOrders )
+
+			startTime = time.time()
+			if useBatches:
+				for i in xrange ( 0, numberOfOrders, batchSize ):
+					testExchange.submitOrders( orders[ i : i + batchSize ] )
+			else:
+				for testOrder in orders:
+					testExchange.submitOrder( testOrder )
+			results.append( numberOfOrders / ( time.time() - startTime ) )
+
+		print "Orders per second submitOrder loop:[%.0f] submitOrders batches of [%s]:[%.0f]" % ( results[0], batchSize, results[1] )
+		return results
+
+	@staticmethod
+	def benchmarkSweep( numberOfLevels = 200, ordersPerLevel = 50, repeats = 5 ):
+		# Seconds for a single market order to consume every resting ask order, averaged over repeats
+		totalTime = 0.0
+		for i in xrange ( 0, repeats ):
+			testExchange = exchange.Exchange( "AA" )
+			orders = [ order.Order( "AA", trade.TradeActions.Sell, order.OrderTypes.Limit, 100 + ( j % numberOfLevels ) * .01, 10, 1 ) for j in xrange ( 0, numberOfLevels * ordersPerLevel ) ]
+			testExchange.submitOrders( orders )
+
+			sweepOrder = order.Order( "AA", trade.TradeActions.Buy, order.OrderTypes.Market, None, numberOfLevels * ordersPerLevel * 10, 2 )
+			startTime = time.time()
+			testExchange.submitOrder( sweepOrder )
+			totalTime += time.time() - startTime
+
+		print "Sweep of levels:[%s] orders per level:[%s] seconds:[%.4f]" % ( numberOfLevels, ordersPerLevel, totalTime / repeats )
+		return totalTime / repeats
+
+	@staticmethod
+	def benchmarkLevelChurn( numberOfLevels = 50000, numberOfCancels = 20000 ):
+		# Seconds per cancel and resubmit of the only order of a random level below the top of a deep book, each one removes
+		# and adds a price level away from the best price
+		testExchange = exchange.Exchange( "AA" )
+		orders = [ order.Order( "AA", trade.TradeActions.Sell, order.OrderTypes.Limit, 100 + j * .01, 10, 1 ) for j in xrange ( 0, numberOfLevels ) ]
+		testExchange.submitOrders( orders )
+
+		random.seed( 1 )
+		startTime = time.time()
+		for i in xrange ( 0, numberOfCancels ):
+			level = random.randint( 1, numberOfLevels - 1 )
+			testExchange.cancelOrder( orders[ level ].getOrderId() )
+			orders[ level ] = order.Order( "AA", trade.TradeActions.Sell, order.OrderTypes.Limit, 100 + level * .01, 10, 1 )
+			testExchange.submitOrder( orders[ level ] )
+		seconds = ( time.time() - startTime ) / numberOfCancels
+
+		print "Level churn of levels:[%s] seconds per cancel and resubmit:[%.6f]" % ( numberOfLevels, seconds )
+		return seconds
+
+	@staticmethod
+	def benchmarkSimulationReplay( numberOfTicks = 200000, numberOfOrders = 2000 ):
+		# Seconds to replay a random walk against resting orders, tick by tick from a list, chunked from a memory mapped series,
+		# and from the memory mapped series with a trade price listener attached, which replays it tick by tick again
+		random.seed( 1 )
+		prices = [ 100.0 ]
+		for i in xrange ( 1, numberOfTicks ):
+			prices.append( round ( prices[-1] + random.choice( [ -.01, .01 ] ), 2 ) )
+
+		directory = tempfile.mkdtemp()
+		try:
+			time_series.TimeSeries( prices ).save( directory )
+			results = []
+			for timeSeriesData, withListener in ( ( prices, False ), ( time_series.TimeSeries.open( directory ), False ), ( time_series.TimeSeries.open( directory ), True ) ):
+				testExchangeSimulation = exchange_simulation.ExchangeSimulation( "AA" )
+				testExchangeSimulation.lastTradePoint = prices[0]
+				for i in xrange ( 1, numberOfOrders / 2 + 1 ):
+					testExchangeSimulation.submitOrder( order.Order( "AA", trade.TradeActions.Buy, order.OrderTypes.Limit, round ( 100 - i * .01, 2 ), 1, 1 ) )
+					testExchangeSimulation.submitOrder( order.Order( "AA", trade.TradeActions.Sell, order.OrderTypes.Limit, round ( 100 + i * .01, 2 ), 1, 1 ) )
+				if withListener:
+					testExchangeSimulation.registerTradePriceListener( exchange_account.ExchangeAccount( 2 ), lambda price : None )
+
+				startTime = time.time()
+				testExchangeSimulation.runTimeSeriesAsMarketOrderTrades( timeSeriesData )
+				results.append( time.time() - startTime )
+		finally:
+			shutil.rmtree( directory )
+
+		print "Replay of ticks:[%s] resting orders:[%s] seconds list:[%.3f] memory mapped time series:[%.3f] with a trade price listener:[%.3f]" % ( numberOfTicks, numberOfOrders, results[0], results[1], results[2] )
+		return results
+
+	@staticmethod
+	def createScenarios( testExchange, numberOfScenarios, deepCopy = False ):
+		# Each scenario takes out the best ask level and rests an order, on a fork of the exchange or on a deep copy of it
+		scenarios = []
+		for i in xrange ( 0, numberOfScenarios ):
+			scenarioExchange = testExchange.fork()
+			if deepCopy:
+				scenarioExchange.orderBook = copy.deepcopy( testExchange.orderBook, { id ( testExchange.logger ) : testExchange.logger } )
+			scenarioExchange.submitOrder( order.Order( "AA", trade.TradeActions.Buy, order.OrderTypes.Limit, 100.01, 250, 2 ) )
+			scenarios.append( scenarioExchange )
+		return scenarios
+
+	@staticmethod
+	def benchmarkForkedScenarios( numberOfOrders = 50000, numberOfForks = 1000, numberOfDeepCopies = 10 ):
+		# Time and memory per what-if scenario on forks of the same exchange against deep copies of its order book, each
+		# measured in a fresh child process
+		testExchange = exchange.Exchange( "AA" )
+		startTime = time.time()
+		ExchangeBenchmark.createRestingOrders( testExchange, numberOfOrders )
+		buildSeconds = time.time() - startTime
+
+		forkBytes, forkSeconds = ExchangeBenchmark.measureInChildProcess( ExchangeBenchmark.createScenarios, testExchange, numberOfForks )
+		copyBytes, copySeconds = ExchangeBenchmark.measureInChildProcess( ExchangeBenchmark.createScenarios, testExchange, numberOfDeepCopies, True )
+		results = ( buildSeconds, forkSeconds / numberOfForks, forkBytes / float ( numberOfForks ), copySeconds / numberOfDeepCopies, copyBytes / float ( numberOfDeepCopies ) )
+
+		print "Resting orders:[%s] seconds to rebuild:[%.3f] per fork and order:[%.5f] bytes per fork:[%.0f] per deep copy and order:[%.5f] bytes per deep copy:[%.0f]" % ( ( numberOfOrders, ) + results )
+		return results
+
+	@staticmethod
+	def benchmarkRouter( numberOfSymbols = 8, ordersPerSymbol = 5000, batchSize = 400, processes = ( 0, 2, 4 ) ):
+		# Orders per second routed over symbols matched in this process and sharded over worker processes
+		symbols = [ "S%s" % ( i ) for i in range ( 0, numberOfSymbols ) ]
+		orders = []
+		for symbolOrders in zip ( *[ ExchangeBenchmark.createCrossingOrders( symbol, ordersPerSymbol ) for symbol in symbols ] ):
+			orders.extend( symbolOrders )
+
+		results = []
+		for processCount in processes:
+			router = exchange_router.ExchangeRouter( processes = processCount )
+			try:
+				for symbol in symbols:
+					router.addSymbol( symbol )
+				for accountId in range ( 1, 5 ):
+					router.registerTradesListener( exchange_account.ExchangeAccount( accountId ), lambda trades : None )
+
+				startTime = time.time()
+				for i in xrange ( 0, len ( orders ), batchSize ):
+					router.submitOrders( orders[ i : i + batchSize ] )
+				results.append( len ( orders ) / ( time.time() - startTime ) )
+			finally:
+				router.close()
+
+		print "Routed orders per second symbols:[%s] by processes %s:[%s]" % ( numberOfSymbols, list ( processes ), ", ".join( "%.0f" % ( result ) for result in results ) )
+		return results
+
+	@staticmethod
+	def runRingProducer( ingressRing, producerId, numberOfOrders ):
+		producer = order_ring.OrderRingProducer( ingressRing, None, producerId )
+		for i in xrange ( 0, numberOfOrders ):
+			producer.submitOrder( i % 2, order.OrderTypes.Limit, 100 + ( i % 7 - 3 ) * .01, 10, producerId )
+
+	@staticmethod
+	def benchmarkOrderIngress( numberOfProducers = 2, ordersPerProducer = 20000, batchSize = 256 ):
+		# Records per second from producer processes to the matching process, transport only and matched into an Exchange
+		# with the acks and fills written back on the egress of each producer.  Both transports run the same producer and
+		# OrderRingConsumer code, the baseline only swaps the shared memory rings for multiprocessing.Queue
+		numberOfOrders = numberOfProducers * ordersPerProducer
+		results = []
+		for match in ( False, True ):
+			rates = []
+			for createRing in ( lambda capacity, multiProducer : order_ring.RecordRing( capacity, multiProducer ), lambda capacity, multiProducer : QueueRecordRing( capacity ) ):
+				ingressRing = createRing( 1 << 14, True )
+				egressRings = dict ( ( producerId, createRing( 1 << 17, False ) ) for producerId in range ( 0, numberOfProducers ) )
+				consumer = order_ring.OrderRingConsumer( exchange.Exchange( "AA" ), ingressRing, egressRings )
+				producers = [ multiprocessing.Process( target = ExchangeBenchmark.runRingProducer, args = ( ingressRing, producerId, ordersPerProducer ) ) for producerId in range ( 0, numberOfProducers ) ]
+				startTime = time.time()
+				for producer in producers:
+					producer.start()
+				received = 0
+				while received < numberOfOrders:
+					if match:
+						count = consumer.processBatch( batchSize )
+						for egressRing in egressRings.itervalues():
+							egressRing.drain( 1 << 17 )
+					else:
+						count = len ( ingressRing.drain( batchSize ) )
+					received += count
+					if count == 0:
+						time.sleep( .0001 )
+				rates.append( numberOfOrders / ( time.time() - startTime ) )
+				assert ( not consumer.disconnectedProducers )
+				for producer in producers:
+					producer.join()
+			results.append( tuple ( rates ) )
+
+		print "Order ingress records per second producers:[%s] transport ring:[%.0f] queue:[%.0f] matched ring:[%.0f] queue:[%.0f]" % ( numberOfProducers, results[0][0], results[0][1], results[1][0], results[1][1] )
+		return results
+
+	@staticmethod
+	def benchmarkGatewaySlowParticipant( numberOfOrders = 20000, slowSeconds = .0005 ):
+		# Seconds to match the same orders when one of the four accounts takes slowSeconds per fill, with the listener called
+		# inline by the exchange and with the gateway queueing the fills for a reader thread
+		def onSlowTrades( trades ):
+			time.sleep( slowSeconds * len ( trades ) )
+
+		testExchange = exchange.Exchange( "AA" )
+		for accountId in range ( 1, 5 ):
+			testExchange.registerTradesListener( exchange_account.ExchangeAccount( accountId ), onSlowTrades if accountId == 1 else ( lambda trades : None ) )
+		orders = ExchangeBenchmark.createCrossingOrders( "AA", numberOfOrders )
+		startTime = time.time()
+		for i in xrange ( 0, numberOfOrders, 256 ):
+			testExchange.submitOrders( orders[ i : i + 256 ] )
+		inlineSeconds = time.time() - startTime
+
+		gateway = exchange_gateway.ExchangeGateway( exchange.Exchange( "AA" ) )
+		participantQueues = [ gateway.connect( accountId ) for accountId in range ( 1, 5 ) ]
+		stopEvent = threading.Event()
+		def readSlowly():
+			while not stopEvent.is_set():
+				message = participantQueues[0].get( timeout = .01 )
+				if message is not None and message[0] == exchange_gateway.GatewayMessageTypes.Fill:
+					time.sleep( slowSeconds )
+		reader = threading.Thread( target = readSlowly )
+		reader.start()
+		gateway.start()
+		startTime = time.time()
+		for currentOrder in ExchangeBenchmark.createCrossingOrders( "AA", numberOfOrders ):
+			gateway.submitOrder( currentOrder )
+		gateway.stop()
+		gatewaySeconds = time.time() - startTime
+		stopEvent.set()
+		reader.join()
+
+		print "Matching seconds with a slow participant orders:[%s] inline listener:[%.3f] gateway:[%.3f] dropped:[%s]" % ( numberOfOrders, inlineSeconds, gatewaySeconds, participantQueues[0].droppedCount )
+		return ( inlineSeconds, gatewaySeconds )
+
+	@staticmethod
+	def benchmarkListenerDispatch( numberOfTicks = 5000, slowSeconds = .0005 ):
+		# Seconds to replay ticks when a trade price listener takes slowSeconds per price, called inline and through a
+		# ListenerDispatcher that conflates the prices the listener has not caught up with
+		def onSlowTradePrice( price ):
+			time.sleep( slowSeconds )
+
+		random.seed( 1 )
+		prices = [ 100.0 ]
+		for i in xrange ( 1, numberOfTicks ):
+			prices.append( round ( prices[-1] + random.choice( [ -.01, .01 ] ), 2 ) )
+
+		results = []
+		for dispatched in ( False, True ):
+			testExchangeSimulation = exchange_simulation.ExchangeSimulation( "AA" )
+			dispatcher = listener_dispatcher.ListenerDispatcher( numberOfThreads = 1, policy = participant_queue.BackpressurePolicies.Conflate )
+			if dispatched:
+				testExchangeSimulation.setListenerDispatcher( dispatcher )
+				dispatcher.start()
+			testExchangeSimulation.registerTradePriceListener( exchange_account.ExchangeAccount( 1 ), onSlowTradePrice )
+			startTime = time.time()
+			testExchangeSimulation.runTimeSeriesAsMarketOrderTrades( prices )
+			results.append( time.time() - startTime )
+			if dispatched:
+				dispatcher.stop()
+
+		print "Replay of ticks:[%s] with a slow trade price listener seconds inline:[%.3f] dispatched:[%.3f] conflated:[%s]" % ( numberOfTicks, results[0], results[1], dispatcher.listenerQueues[0].conflatedCount )
+		return results
+
+	@staticmethod
+	def benchmarkBookFeed( numberOfLevels = 1000, numberOfOrders = 2000 ):
+		# Seconds to submit orders against a deep book while a subscriber keeps its view of the book current, without a
+		# subscriber, with a LocalOrderBook fed by book deltas and with a condenced order book copied after every order
+		random.seed( 1 )
+		orders = []
+		for i in xrange ( 0, numberOfOrders ):
+			tradeAction = random.choice( [ trade.TradeActions.Buy, trade.TradeActions.Sell ] )
+			orders.append( ( tradeAction, round ( 100 + random.randint( -5, 5 ) * .01, 2 ), random.randint( 1, 5 ) ) )
+
+		results = []
+		for subscriber in ( None, 'deltas', 'snapshots' ):
+			testExchange = exchange.Exchange( "AA" )
+			for i in xrange ( 1, numberOfLevels + 1 ):
+				testExchange.submitOrder( order.Order( "AA", trade.TradeActions.Buy, order.OrderTypes.Limit, round ( 99.95 - i * .01, 2 ), 10, 1 ) )
+				testExchange.submitOrder( order.Order( "AA", trade.TradeActions.Sell, order.OrderTypes.Limit, round ( 100.05 + i * .01, 2 ), 10, 1 ) )
+			localOrderBook = book_feed.LocalOrderBook( "AA" )
+			if subscriber == 'deltas':
+				testExchange.registerQuoteListener( exchange_account.ExchangeAccount( 2 ), localOrderBook.onBookUpdate )
+
+			startTime = time.time()
+			for tradeAction, price, qty in orders:
+				testExchange.submitOrder( order.Order( "AA", tradeAction, order.OrderTypes.Limit, price, qty, 2 ) )
+				if subscriber == 'snapshots':
+					testExchange.orderBook.createCondencedOrderBook()
+			results.append( time.time() - startTime )
+			if subscriber == 'deltas':
+				assert ( localOrderBook.getLevels() == testExchange.orderBook.getLevels() )
+
+		print "Book feed with levels:[%s] orders:[%s] seconds without subscriber:[%.3f] deltas:[%.3f] snapshot per order:[%.3f]" % ( 2 * numberOfLevels, numberOfOrders, results[0], results[1], results[2] )
+		return results
+
+	@staticmethod
+	def benchmarkTcpGateway( numberOfClients = 4, ordersPerClient = 5000 ):
+		# Round trip latency and throughput of the TCP gateway over loopback, with one and with window orders in flight
+		gateway = tcp_gateway.TcpGateway( exchange.Exchange( "AA" ) )
+		gatewayThread = threading.Thread( target = gateway.serveForever )
+		gatewayThread.start()
+		allResults = []
+		for i, window in enumerate ( ( 1, 32 ) ):
+			results = tcp_gateway.TcpLoadGenerator( gateway.address, numberOfClients, ordersPerClient, window, firstAccountId = 1 + i * numberOfClients ).run()
+			print "TCP gateway clients:[%s] window:[%s] orders/s:[%.0f] latency us p50:[%.0f] p90:[%.0f] p99:[%.0f] max:[%.0f]" % ( numberOfClients, window, results['ordersPerSecond'], results['p50'], results['p90'], results['p99'], results['max'] )
+			allResults.append( results )
+		gateway.stop()
+		gatewayThread.join()
+		return allResults
+
+if __name__ == "__main__":
+
+	logging.getLogger('MyLogger').addHandler( logging.NullHandler() )
+	logging.getLogger('MyLogger').setLevel( logging.WARNING )
+	logging.getLogger('MyLogger').propagate = False
+
+	ExchangeBenchmark.benchmarkOrderObjectSize()
+	ExchangeBenchmark.benchmarkRestingOrderMemory()
+	ExchangeBenchmark.benchmarkBatchSubmission()
+	ExchangeBenchmark.benchmarkSweep()
+	ExchangeBenchmark.benchmarkLevelChurn()
+	ExchangeBenchmark.benchmarkSimulationReplay()
+	ExchangeBenchmark.benchmarkForkedScenarios()
+	ExchangeBenchmark.benchmarkRouter()
+	ExchangeBenchmark.benchmarkOrderIngress()
+	ExchangeBenchmark.benchmarkGatewaySlowParticipant()
+	ExchangeBenchmark.benchmarkListenerDispatch()
+	ExchangeBenchmark.benchmarkBookFeed()
+	ExchangeBenchmark.benchmarkTcpGateway()
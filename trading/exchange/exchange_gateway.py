@@ -0,0 +1,209 @@
+#!/usr/bin/python
+
+import trading.exchange.exchange_account as exchange_account
+import trading.exchange.order as order
+import trading.exchange.trade as trade
+import trading.exchange.participant_queue as participant_queue
+import logger.logger as logger
+import logging
+import itertools
+import threading
+import Queue
+
+class GatewayMessageTypes():
+	Ack = 1
+	Reject = 2
+	Fill = 3
+	CancelAck = 4
+	CancelReject = 5
+
+	def __init__(self):
+		pass
+
+class ExchangeGateway():
+
+	"""
+	This class puts a single matching thread in front of an Exchange.  submitOrder and cancelOrder can be called from any
+	thread, they only put a request on the request queue and return its request id.  The matching thread is the only one
+	using the Exchange, it takes up to batchSize requests at a time and matches runs of new orders with submitOrders.
+	Acks, rejects and fills are put on the ParticipantQueue of the account instead of calling participant code, so the
+	time a participant takes to handle them does not add to the matching latency.  Fills are published by the exchange
+	before submitOrders returns so they are held until the acks of the batch are queued.
+	"""
+
+	SUBMIT_ORDER = 1
+	CANCEL_ORDER = 2
+
+	def __init__(self, exchange, batchSize = 256):
+		self.exchange = exchange
+		self.batchSize = batchSize
+		self.requests = Queue.Queue()
+		self.requestIds = itertools.count( 1 )
+		self.participants = {} # accountId -> ParticipantQueue
+		self.requestAccounts = {} # Exchange orderId -> ( requestId, accountId ) of orders that can still fill
+		self.pendingTrades = []
+		self.matchingThread = None
+		self.logger = logging.getLogger('MyLogger')
+
+	def connect(self, accountId, maxSize = 1024, policy = participant_queue.BackpressurePolicies.DropOldest):
+		# Queue the participant reads its messages from, connect before submitting orders for the account
+		self.logger.info( "Connecting gateway participant accountId:[%s] maxSize:[%s] policy:[%s]" % ( accountId, maxSize, policy ) )
+		participantQueue = participant_queue.ParticipantQueue( maxSize, policy )
+		self.participants[ accountId ] = participantQueue
+		self.exchange.registerTradesListener( exchange_account.ExchangeAccount( accountId ), self.pendingTrades.extend )
+		return participantQueue
+
+	def start(self):
+		self.matchingThread = threading.Thread( target = self.run )
+		self.matchingThread.daemon = True
+		self.matchingThread.start()
+
+	def stop(self):
+		# Requests already queued are matched before the thread exits
+		self.requests.put( None )
+		self.matchingThread.join()
+		for participantQueue in self.participants.itervalues():
+			participantQueue.close()
+
+	def submitOrder(self, currentOrder):
+		requestId = next( self.requestIds )
+		self.requests.put( ( ExchangeGateway.SUBMIT_ORDER, requestId, currentOrder ) )
+		return requestId
+
+	def cancelOrder(self, accountId, orderId):
+		requestId = next( self.requestIds )
+		self.requests.put( ( ExchangeGateway.CANCEL_ORDER, requestId, ( accountId, orderId ) ) )
+		return requestId
+
+	def sendMessage(self, accountId, message):
+		participantQueue = self.participants.get( accountId )
+		if participantQueue is None:
+			self.logger.warning( "Failed to send gateway message, accountId:[%s] is not connected message:[%s]" % ( accountId, message ) )
+			return
+		participantQueue.put( message )
+
+	def takeRequests(self):
+		# Waits for a request, then takes whatever else is already queued up to batchSize
+		requests = [ self.requests.get() ]
+		try:
+			while len ( requests ) < self.batchSize and requests[-1] is not None:
+				requests.append( self.requests.get_nowait() )
+		except Queue.Empty:
+			pass
+		return requests
+
+	def run(self):
+		while True:
+			requests = self.takeRequests()
+			stopping = requests[-1] is None
+			self.processRequests( requests[ : -1 ] if stopping else requests )
+			if stopping:
+				return
+
+	def processRequests(self, requests):
+		pendingOrders = []
+		for requestType, requestId, argument in requests:
+			if requestType == ExchangeGateway.SUBMIT_ORDER:
+				pendingOrders.append( ( requestId, argument ) )
+			else:
+				self.submitPendingOrders( pendingOrders )
+				pendingOrders = []
+				self.processCancel( requestId, *argument )
+		self.submitPendingOrders( pendingOrders )
+
+	def submitPendingOrders(self, pendingOrders):
+		if not pendingOrders:
+			return
+		results = self.exchange.submitOrders( [ currentOrder for requestId, currentOrder in pendingOrders ] )
+		for ( requestId, currentOrder ), ( accepted, result ) in zip ( pendingOrders, results ):
+			if accepted:
+				self.requestAccounts[ result ] = ( requestId, currentOrder.getAccountId() )
+				self.sendMessage( currentOrder.getAccountId(), ( GatewayMessageTypes.Ack, requestId, result ) )
+			else:
+				self.sendMessage( currentOrder.getAccountId(), ( GatewayMessageTypes.Reject, requestId, result ) )
+
+		trades = self.pendingTrades[:]
+		del self.pendingTrades[:]
+		for exchangeTrade in trades:
+			requestId, accountId = self.requestAccounts.get( exchangeTrade.orderId, ( None, exchangeTrade.getAccountId() ) )
+			self.sendMessage( accountId, ( GatewayMessageTypes.Fill, requestId, exchangeTrade ) )
+
+		# Forget the orders that can no longer fill
+		for exchangeTrade in trades:
+			if exchangeTrade.orderId in self.requestAccounts and self.exchange.orderBook.getOpenOrderInfo( exchangeTrade.orderId ) is None:
+				del self.requestAccounts[ exchangeTrade.orderId ]
+		for requestId, currentOrder in pendingOrders:
+			if currentOrder.getOrderType() == order.OrderTypes.Market:
+				self.requestAccounts.pop( currentOrder.getOrderId(), None )
+
+	def processCancel(self, requestId, accountId, orderId):
+		orderInfo = self.exchange.orderBook.getOpenOrderInfo( orderId )
+		if orderInfo is None or orderInfo[2] != accountId:
+			self.sendMessage( accountId, ( GatewayMessageTypes.CancelReject, requestId, orderId ) )
+			return
+		self.exchange.cancelOrder( orderId )
+		self.requestAccounts.pop( orderId, None )
+		self.sendMessage( accountId, ( GatewayMessageTypes.CancelAck, requestId, orderId ) )
+
+class TestExchangeGateway():
+
+	@staticmethod
+	def testExchangeGateway():
+		import trading.exchange.exchange as exchange
+
+		symbol = "AA"
+		numberOfClients = 1000
+		testExchange = exchange.Exchange( symbol )
+		gateway = ExchangeGateway( testExchange, batchSize = 64 )
+		clientQueues = dict ( ( accountId, gateway.connect( accountId ) ) for accountId in range ( 1, numberOfClients + 1 ) )
+		slowQueue = gateway.connect( numberOfClients + 1, maxSize = 2 ) # Never read
+		gateway.start()
+
+		# Every client rests a sell, the slow client's buys take them all
+		requestIds = {}
+		for accountId in clientQueues:
+			requestIds[ accountId ] = gateway.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 10 + ( accountId % 5 ) * .01, 1, accountId ) )
+		for i in range ( 0, numberOfClients / 10 ):
+			gateway.submitOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Market, None, 10, numberOfClients + 1 ) )
+		gateway.stop()
+
+		fills = 0
+		for accountId, clientQueue in clientQueues.iteritems():
+			messages = clientQueue.getAll()
+			assert ( messages[0][0] == GatewayMessageTypes.Ack and messages[0][1] == requestIds[ accountId ] )
+			for messageType, requestId, value in messages[ 1 : ]:
+				if messageType == GatewayMessageTypes.Fill:
+					assert ( requestId == requestIds[ accountId ] and value.getAccountId() == accountId )
+					fills += 1
+		assert ( fills == numberOfClients )
+		assert ( slowQueue.droppedCount == numberOfClients / 10 + numberOfClients - 2 ) # Acks and fills of the market orders
+		assert ( [ message[0] for message in slowQueue.getAll() ] == [ GatewayMessageTypes.Fill ] * 2 )
+		assert ( testExchange.orderBook.getTopOfBook().ask is None and len ( gateway.requestAccounts ) == 0 )
+
+	@staticmethod
+	def testGatewayCancel():
+		import trading.exchange.exchange as exchange
+
+		symbol = "AA"
+		gateway = ExchangeGateway( exchange.Exchange( symbol ) )
+		clientQueue = gateway.connect( 1 )
+		otherQueue = gateway.connect( 2 )
+		gateway.start()
+		gateway.submitOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 10, 5, 1 ) )
+		ack = clientQueue.get( timeout = 5 )
+		assert ( ack[0] == GatewayMessageTypes.Ack )
+
+		otherRequestId = gateway.cancelOrder( 2, ack[2] ) # Not the owner
+		requestId = gateway.cancelOrder( 1, ack[2] )
+		invalidRequestId = gateway.submitOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, -1, 5, 1 ) )
+		gateway.stop()
+		assert ( otherQueue.getAll() == [ ( GatewayMessageTypes.CancelReject, otherRequestId, ack[2] ) ] )
+		messages = clientQueue.getAll()
+		assert ( messages[0] == ( GatewayMessageTypes.CancelAck, requestId, ack[2] ) )
+		assert ( messages[1][ : 2 ] == ( GatewayMessageTypes.Reject, invalidRequestId ) and messages[1][2].startswith( 'Invalid Price' ) )
+
+if __name__ == "__main__":
+
+	logger.MyLogger.InitializeLogger()
+	TestExchangeGateway.testExchangeGateway()
+	TestExchangeGateway.testGatewayCancel()
@@ -13,6 +13,10 @@ class ExchangeParticipant( object ):
 
 	def onTrade (self, trade): 
 		print "onTrade :: Trade Occured exchangeAccount:[%s] trade:[%s]" % ( self.exchangeAccount, trade ) 
+
+	def onTrades (self, trades): 
+		for trade in trades: 
+			self.onTrade( trade ) 
 	
 	def __str__(self): 
 		return str ( vars(self) )
@@ -0,0 +1,361 @@
+#!/usr/bin/python
+
+import trading.exchange.exchange as exchange
+import trading.exchange.exchange_account as exchange_account
+import trading.exchange.order as order
+import trading.exchange.quote as quote
+import trading.exchange.trade as trade
+import logger.logger as logger
+import logging
+import multiprocessing
+
+class RoutedExchange( exchange.Exchange ):
+
+	"""
+	Exchange of one symbol owned by an ExchangeRouter.  Trades are collected for the router instead of being published to
+	listeners, the router translates them to its global ids and publishes them.
+	"""
+
+	def __init__(self, symbol, transactionFeePercentage = 0, tickSize = .01, denseBandTicks = None):
+		super(RoutedExchange, self).__init__( symbol, transactionFeePercentage, tickSize, denseBandTicks )
+		self.publishedTrades = []
+
+	def publishTrades(self, trades):
+		self.publishedTrades.extend( exchangeTrade for exchangeTrade in trades if exchangeTrade is not None )
+
+	def publishTradesByAccount(self, trades):
+		self.publishTrades( trades )
+
+	def takePublishedTrades(self):
+		trades = self.publishedTrades
+		self.publishedTrades = []
+		return trades
+
+class ExchangeShard():
+
+	"""
+	This class holds the exchanges of the symbols assigned to one shard and runs the commands the router sends to it.
+	Commands are ( command, symbol, argument ) tuples handled in order, the reply is the result of each command along with
+	the trades and the top of book of every symbol the commands touched.
+	"""
+
+	ADD_SYMBOL = 0
+	SUBMIT_ORDER = 1
+	CANCEL_ORDER = 2
+	CANCEL_ALL_ORDERS = 3
+
+	def __init__(self):
+		self.exchanges = {} # Symbol -> RoutedExchange
+		self.logger = logging.getLogger('MyLogger')
+
+	def handleCommand(self, command, symbol, argument):
+		if command == ExchangeShard.ADD_SYMBOL:
+			self.exchanges[ symbol ] = RoutedExchange( symbol, *argument )
+			return ( True, symbol )
+
+		routedExchange = self.exchanges[ symbol ]
+		if command == ExchangeShard.SUBMIT_ORDER:
+			return routedExchange.submitOrder( argument )
+		elif command == ExchangeShard.CANCEL_ORDER:
+			try:
+				return ( routedExchange.cancelOrder( argument ), argument )
+			except Exception as ex:
+				return ( False, ex.args[0] )
+		elif command == ExchangeShard.CANCEL_ALL_ORDERS:
+			return ( True, routedExchange.cancelAllOrdersForAccount( argument ) )
+
+		self.logger.warning( "Failed to handle shard command:[%s] symbol:[%s]" % ( command, symbol ) )
+		raise Exception( 'Invalid shard command' )
+
+	def handleCommands(self, commands):
+		results = []
+		touchedSymbols = []
+		for command, symbol, argument in commands:
+			results.append( self.handleCommand( command, symbol, argument ) )
+			if symbol not in touchedSymbols:
+				touchedSymbols.append( symbol )
+
+		trades = []
+		for symbol in touchedSymbols:
+			trades.extend( self.exchanges[ symbol ].takePublishedTrades() )
+		quotes = [ self.exchanges[ symbol ].orderBook.getTopOfBook() for symbol in touchedSymbols ]
+		return ( results, trades, quotes )
+
+def runShardProcess( connection, logLevel ):
+	# Worker process loop, module level so it can be the target of a process
+	logging.getLogger('MyLogger').setLevel( logLevel )
+	shard = ExchangeShard()
+	while True:
+		commands = connection.recv()
+		if commands is None:
+			break
+		connection.send( shard.handleCommands( commands ) )
+	connection.close()
+
+class ExchangeRouter():
+
+	"""
+	This class routes orders for many symbols, each symbol has its own RoutedExchange.  Symbols are spread over processes
+	shards ( worker processes ) so the matching of different symbols runs on different cores, with processes = 0 every
+	exchange is kept in the current process.  Order ids returned by the router are global, the symbol index is kept in the
+	high bits ( see SYMBOL_SHIFT ) and the order id of the symbol's exchange in the low bits so cancelOrder finds the
+	exchange from the id alone.  Trade order and trade ids are translated the same way.  Trades and top of book quotes of
+	every shard are published to the listeners registered with the router.  The router works on copies of the submitted
+	orders, fills are reported through the trade listeners.  submitOrders sends the orders of every shard before waiting
+	for any reply so the shards match their orders in parallel.  Every call is one synchronous round trip, with worker
+	processes the commands and replies are pickled through a pipe and the caller waits for the shards, so submitOrder and
+	cancelOrder pay that cost per order.  Orders and cancels that are known together should go through submitOrders and
+	cancelOrders.
+	"""
+
+	SYMBOL_SHIFT = 32
+	LOCAL_ID_MASK = ( 1 << SYMBOL_SHIFT ) - 1
+
+	def __init__(self, processes = 0, workerLogLevel = logging.WARNING):
+		self.processes = processes
+		self.symbolIndexes = {} # Symbol -> symbol index used in the global ids
+		self.symbols = [] # Symbol index -> symbol
+		self.funcOnQuoteListeners = {} # ExchangeAccount -> quoteFuncListener
+		self.funcOnTradeListeners = {} # ExchangeAccount -> tradeFuncListener
+		self.funcOnTradesListeners = {} # ExchangeAccount -> tradesFuncListener
+		self.topOfBook = {} # Symbol -> last published Quote
+		self.logger = logging.getLogger('MyLogger')
+
+		self.localShard = None
+		self.connections = []
+		self.workers = []
+		if processes == 0:
+			self.localShard = ExchangeShard()
+		for i in range ( 0, processes ):
+			parentConnection, workerConnection = multiprocessing.Pipe()
+			worker = multiprocessing.Process( target = runShardProcess, args = ( workerConnection, workerLogLevel ) )
+			worker.daemon = True
+			worker.start()
+			self.connections.append( parentConnection )
+			self.workers.append( worker )
+
+	def __str__(self):
+		return "ExchangeRouter symbols:[%s] processes:[%s]" % ( len ( self.symbols ), self.processes )
+
+	def getShardCount(self):
+		return max ( 1, self.processes )
+
+	def getShardIndex(self, symbol):
+		return self.symbolIndexes[ symbol ] % self.getShardCount()
+
+	def registerQuoteListener(self, exchangeAccount, funcOnQuote ):
+		self.logger.info( "Registering router quote listener for exchangeAccount:[%s]" % exchangeAccount )
+		self.funcOnQuoteListeners[ exchangeAccount.getAccountId() ] = funcOnQuote
+
+	def registerTradeListener(self, exchangeAccount, funcOnTrade ):
+		self.logger.info( "Registering router trade listener for exchangeAccount:[%s]" % exchangeAccount )
+		self.funcOnTradeListeners[ exchangeAccount.getAccountId() ] = funcOnTrade
+
+	def registerTradesListener(self, exchangeAccount, funcOnTrades ):
+		self.logger.info( "Registering router trades listener for exchangeAccount:[%s]" % exchangeAccount )
+		self.funcOnTradesListeners[ exchangeAccount.getAccountId() ] = funcOnTrades
+
+	def toGlobalId(self, symbol, localId):
+		return ( self.symbolIndexes[ symbol ] << ExchangeRouter.SYMBOL_SHIFT ) | localId
+
+	def getSymbolForOrderId(self, globalOrderId):
+		symbolIndex = globalOrderId >> ExchangeRouter.SYMBOL_SHIFT
+		if globalOrderId < 0 or symbolIndex >= len ( self.symbols ):
+			return None
+		return self.symbols[ symbolIndex ]
+
+	def runCommands(self, commands):
+		# Sends the commands grouped by shard, then collects the replies.  Returns the results in the order of commands
+		shardCommands = [ [] for i in range ( 0, self.getShardCount() ) ]
+		for index, ( command, symbol, argument ) in enumerate ( commands ):
+			shardCommands[ self.getShardIndex( symbol ) ].append( ( index, ( command, symbol, argument ) ) )
+
+		if self.localShard is not None:
+			replies = [ self.localShard.handleCommands( [ shardCommand for index, shardCommand in shardCommands[0] ] ) ]
+		else:
+			for connection, commandsForShard in zip ( self.connections, shardCommands ):
+				if commandsForShard:
+					connection.send( [ shardCommand for index, shardCommand in commandsForShard ] )
+			replies = [ connection.recv() if commandsForShard else ( [], [], [] ) for connection, commandsForShard in zip ( self.connections, shardCommands ) ]
+
+		results = [ None ] * len ( commands )
+		trades = []
+		quotes = []
+		for commandsForShard, ( shardResults, shardTrades, shardQuotes ) in zip ( shardCommands, replies ):
+			for ( index, shardCommand ), result in zip ( commandsForShard, shardResults ):
+				results[ index ] = result
+			trades.extend( shardTrades )
+			quotes.extend( shardQuotes )
+
+		self.publishTrades( trades )
+		self.publishQuotes( quotes )
+		return results
+
+	def addSymbol(self, symbol, transactionFeePercentage = 0, tickSize = .01, denseBandTicks = None):
+		if symbol in self.symbolIndexes:
+			self.logger.warning( "Failed to add symbol, symbol already routed symbol:[%s]" % ( symbol ) )
+			raise Exception( 'Symbol already added to the router' )
+		self.logger.info( "Adding symbol:[%s] to router" % ( symbol ) )
+
+		self.symbolIndexes[ symbol ] = len ( self.symbols )
+		self.symbols.append( symbol )
+		self.runCommands( [ ( ExchangeShard.ADD_SYMBOL, symbol, ( transactionFeePercentage, tickSize, denseBandTicks ) ) ] )
+
+	def submitOrder(self, currentOrder):
+		return self.submitOrders( [ currentOrder ] )[0]
+
+	def submitOrders(self, orders):
+		# Returns one ( True, globalOrderId ) or ( False, message ) per order like Exchange.submitOrder
+		self.logger.info( "Routing submitOrders for [%s] orders" % ( len ( orders ) ) )
+
+		results = [ None ] * len ( orders )
+		commands = []
+		commandIndexes = []
+		for i, currentOrder in enumerate ( orders ):
+			if currentOrder.getSymbol() not in self.symbolIndexes:
+				self.logger.warning( "Failed to route order, Invalid symbol for router order:[%s]" % ( currentOrder ) )
+				results[i] = ( False, 'Invalid Symbol for Exchange' )
+				continue
+			commands.append( ( ExchangeShard.SUBMIT_ORDER, currentOrder.getSymbol(), currentOrder.copy() ) )
+			commandIndexes.append( i )
+
+		for i, ( command, symbol, currentOrder ), result in zip ( commandIndexes, commands, self.runCommands( commands ) ):
+			results[i] = ( True, self.toGlobalId( symbol, result[1] ) ) if result[0] else result
+		return results
+
+	def cancelOrder(self, globalOrderId):
+		self.logger.info( "Routing cancel order globalOrderId:[%s]" % ( globalOrderId ) )
+
+		result = self.cancelOrders( [ globalOrderId ] )[0]
+		if not result[0]:
+			raise Exception( result[1] )
+		return True
+
+	def cancelOrders(self, globalOrderIds):
+		# Returns one ( True, globalOrderId ) or ( False, message ) per order id, the cancels of every shard are sent together
+		self.logger.info( "Routing cancelOrders for [%s] orders" % ( len ( globalOrderIds ) ) )
+
+		commands = []
+		for globalOrderId in globalOrderIds:
+			symbol = self.getSymbolForOrderId( globalOrderId )
+			if symbol is not None:
+				commands.append( ( ExchangeShard.CANCEL_ORDER, symbol, globalOrderId & ExchangeRouter.LOCAL_ID_MASK ) )
+		shardResults = iter ( self.runCommands( commands ) )
+
+		results = []
+		for globalOrderId in globalOrderIds:
+			if self.getSymbolForOrderId( globalOrderId ) is not None and shardResults.next()[0]:
+				results.append( ( True, globalOrderId ) )
+				continue
+			self.logger.warning( "Failed to cancel routed order, could not find globalOrderId:[%s]" % ( globalOrderId ) )
+			results.append( ( False, "Failed to remove order from the order book.  Could not find orderId:[%s]. Order was likely already matched" % ( globalOrderId ) ) )
+		return results
+
+	def cancelAllOrdersForAccount(self, accountId):
+		# Cancels the orders of the account in every symbol, returns the global ids of the canceled orders
+		self.logger.info( "Routing cancel all orders for accountId:[%s]" % ( accountId ) )
+
+		results = self.runCommands( [ ( ExchangeShard.CANCEL_ALL_ORDERS, symbol, accountId ) for symbol in self.symbols ] )
+		return [ self.toGlobalId( symbol, localOrderId ) for symbol, result in zip ( self.symbols, results ) for localOrderId in result[1] ]
+
+	def getTopOfBook(self, symbol):
+		return self.topOfBook.get( symbol )
+
+	def publishTrades(self, trades):
+		# Trades are translated to global ids and published grouped by account like Exchange.publishTradesByAccount
+		accountTrades = {}
+		for exchangeTrade in trades:
+			exchangeTrade.orderId = self.toGlobalId( exchangeTrade.symbol, exchangeTrade.orderId )
+			exchangeTrade.tradeId = self.toGlobalId( exchangeTrade.symbol, exchangeTrade.tradeId )
+			accountTrades.setdefault( exchangeTrade.getAccountId(), [] ).append( exchangeTrade )
+
+		for accountId, tradesForAccount in accountTrades.iteritems():
+			if accountId in self.funcOnTradesListeners:
+				self.funcOnTradesListeners[ accountId ]( tradesForAccount )
+			elif accountId in self.funcOnTradeListeners:
+				publishFunc = self.funcOnTradeListeners[ accountId ]
+				for exchangeTrade in tradesForAccount:
+					publishFunc( exchangeTrade )
+			else:
+				self.logger.warning( "Failed to publish [%s] routed trades to listener no listener attached accoutnId:[%s]" % ( len ( tradesForAccount ), accountId ) )
+
+	def publishQuotes(self, quotes):
+		# Only top of book changes are published, every quote listener receives the quotes of every symbol
+		for aQuote in quotes:
+			lastQuote = self.topOfBook.get( aQuote.symbol )
+			if lastQuote is not None and lastQuote == aQuote:
+				continue
+			self.topOfBook[ aQuote.symbol ] = aQuote
+			for accountId, funcOnQuote in self.funcOnQuoteListeners.items():
+				funcOnQuote( aQuote )
+
+	def close(self):
+		for connection, worker in zip ( self.connections, self.workers ):
+			connection.send( None )
+			worker.join()
+			connection.close()
+		self.connections = []
+		self.workers = []
+
+class TestExchangeRouter():
+
+	@staticmethod
+	def runTestScenario( processes ):
+		router = ExchangeRouter( processes = processes )
+		try:
+			for symbol in ( "AA", "BB", "CC" ):
+				router.addSymbol( symbol )
+
+			trades = []
+			quotes = []
+			for accountId in ( 1, 2 ):
+				router.registerTradeListener( exchange_account.ExchangeAccount( accountId ), trades.append )
+			router.registerQuoteListener( exchange_account.ExchangeAccount( 1 ), quotes.append )
+
+			results = router.submitOrders( [ order.Order( "AA", trade.TradeActions.Sell, order.OrderTypes.Limit, 10, 100, 1 ),
+				order.Order( "BB", trade.TradeActions.Sell, order.OrderTypes.Limit, 20, 100, 1 ),
+				order.Order( "CC", trade.TradeActions.Buy, order.OrderTypes.Limit, 30, 100, 1 ),
+				order.Order( "ZZ", trade.TradeActions.Buy, order.OrderTypes.Limit, 30, 100, 1 ),
+				order.Order( "AA", trade.TradeActions.Buy, order.OrderTypes.Limit, 9, 100, 1 ) ] )
+			assert ( [ result[0] for result in results ] == [ True, True, True, False, True ] )
+			orderIds = [ result[1] for result in results if result[0] ]
+			assert ( len ( set ( orderIds ) ) == 4 and [ router.getSymbolForOrderId( orderId ) for orderId in orderIds ] == [ "AA", "BB", "CC", "AA" ] )
+
+			# Fills come back with the global order ids
+			assert ( router.submitOrder( order.Order( "BB", trade.TradeActions.Buy, order.OrderTypes.Market, None, 40, 2 ) )[0] == True )
+			assert ( sorted ( ( t.getAccountId(), t.orderId == orderIds[1], t.qty ) for t in trades ) == [ ( 1, True, 40 ), ( 2, False, 40 ) ] )
+			assert ( router.getTopOfBook( "BB" ) == quote.Quote( "BB", None, 20, 0, 60 ) and quotes[-1].symbol == "BB" )
+
+			# Cancels are routed by the order id alone
+			assert ( router.cancelOrder( orderIds[2] ) == True )
+			assert ( router.getTopOfBook( "CC" ) == quote.Quote( "CC", None, None, 0, 0 ) )
+			for invalidOrderId in ( orderIds[2], 99 << ExchangeRouter.SYMBOL_SHIFT ):
+				try:
+					router.cancelOrder( invalidOrderId )
+					assert ( False )
+				except Exception as ex:
+					assert ( ex.args[0].startswith( 'Failed to remove order' ) )
+
+			assert ( sorted ( router.cancelAllOrdersForAccount( 1 ) ) == sorted ( [ orderIds[0], orderIds[1], orderIds[3] ] ) )
+			assert ( router.getTopOfBook( "AA" ) == quote.Quote( "AA", None, None, 0, 0 ) and len ( quotes ) == 7 )
+
+			# Batched cancels, a failed cancel does not stop the others
+			restingIds = [ result[1] for result in router.submitOrders( [ order.Order( "AA", trade.TradeActions.Buy, order.OrderTypes.Limit, 9, 10, 2 ),
+				order.Order( "BB", trade.TradeActions.Sell, order.OrderTypes.Limit, 25, 10, 2 ) ] ) ]
+			results = router.cancelOrders( [ restingIds[0], 99 << ExchangeRouter.SYMBOL_SHIFT, restingIds[1], restingIds[0] ] )
+			assert ( [ result[0] for result in results ] == [ True, False, True, False ] and results[2][1] == restingIds[1] )
+			assert ( results[3][1].startswith( 'Failed to remove order' ) and router.cancelOrders( [] ) == [] )
+			assert ( router.getTopOfBook( "AA" ) == quote.Quote( "AA", None, None, 0, 0 ) and router.getTopOfBook( "BB" ) == quote.Quote( "BB", None, None, 0, 0 ) )
+			return [ ( t.getAccountId(), t.orderId, t.tradeId, t.qty, t.tradePrice ) for t in trades ]
+		finally:
+			router.close()
+
+	@staticmethod
+	def testExchangeRouter():
+		# The same scenario gives the same trades with every exchange in this process or spread over worker processes
+		assert ( TestExchangeRouter.runTestScenario( 0 ) == TestExchangeRouter.runTestScenario( 2 ) )
+
+if __name__ == "__main__":
+
+	logger.MyLogger.InitializeLogger()
+	TestExchangeRouter.testExchangeRouter()
@@ -9,6 +9,9 @@ import trading.exchange.exchange_participant as exchange_participant
 import trading.exchange.exchange_account as exchange_account
 import logger.logger as logger 
 import logging
+import numpy 
+import heapq 
+import math 
 
 class ExchangeSimulation ( exchange.Exchange ):
 
@@ -19,8 +22,8 @@ class ExchangeSimulation ( exchange.Exchange ):
 	below/above ( buy/sell ) the price are filled.
 	"""
 
-	def __init__(self, symbol, transactionFeePercentage = 0 ):
-		super(ExchangeSimulation, self).__init__( symbol, transactionFeePercentage )
+	def __init__(self, symbol, transactionFeePercentage = 0, tickSize = .01, denseBandTicks = None, tradeTapeDirectory = None, bookSnapshotInterval = None ):
+		super(ExchangeSimulation, self).__init__( symbol, transactionFeePercentage, tickSize, denseBandTicks, tradeTapeDirectory, bookSnapshotInterval )
 
 		# Need a test participant during simulation for creating initial top of market
 		self.exchangeParticipant = exchange_participant.ExchangeParticipant( exchange_account.ExchangeAccount(0) )
@@ -36,24 +39,40 @@ class ExchangeSimulation ( exchange.Exchange ):
 			if exchangeTrade.orderId in self.topOfBookOrders: 
 				del self.topOfBookOrders[ exchangeTrade.orderId ] 
 	
-	def initTopOfBookWithPrice (self, price, spread = .01):
+	def hasParticipantListeners(self):
+		# Trade or trade price listeners other than the simulation's own top of book listener 
+		ownAccountId = self.exchangeParticipant.getAccount().getAccountId() 
+		return bool ( self.funcOnTradePriceListeners or self.funcOnTradesListeners or any ( accountId != ownAccountId for accountId in self.funcOnTradeListeners ) ) 
 
-		self.logger.info ("Creating Top Of Book Quotes during initialization, price:[%s], spread:[%s]" % ( price, spread ) )
+	def fork(self):
+		forkedSimulation = super(ExchangeSimulation, self).fork()
+		forkedSimulation.topOfBookOrders = dict ( self.topOfBookOrders )
+		forkedSimulation.registerTradeListener( forkedSimulation.exchangeParticipant.getAccount(), forkedSimulation.onTradeUpdate )
+		return forkedSimulation 
 
+	def cancelTopOfBookOrders (self):
 		# Remove previous top of book orders if they are there
 		for orderId in self.topOfBookOrders.keys():
 			self.logger.info ("reinitializing top of book for simulation, canceling orderId:[%s]" % orderId ) 
 			try : 
-				self.cancelOrder(orderId, surpressLogging = True )
+				self.cancelOrder( orderId )
 			except :
 				self.logger.info( "Failed to cancel orderId:[%s]" % ( orderId ) )
 		
 		# Delete all entries  
 		self.topOfBookOrders = {}	
+
+	def initTopOfBookWithPrice (self, price, spread = .01):
+
+		self.logger.info ("Creating Top Of Book Quotes during initialization, price:[%s], spread:[%s]" % ( price, spread ) )
+
+		self.cancelTopOfBookOrders() 
 		
 		topOfBookQuote = self.orderBook.getTopOfBook()
 		self.logger.info ("Top Of Book after deleting initialization orders topOfBookQuote:[%s]" % ( topOfBookQuote  ) ) 
 		
+		self.orderBook.setDenseBandCenter( price ) 
+		
 		testOrder = order.Order( self.symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, (price - spread), 1, 0, self.exchangeParticipant.getAccount().getAccountId() ) 
 		result = super(ExchangeSimulation, self).submitOrder(testOrder)
 		if result[0] != True :
@@ -69,40 +88,61 @@ class ExchangeSimulation ( exchange.Exchange ):
 		self.topOfBookOrders[ result[1] ] = testOrder 
 		
 		self.lastTradePoint = price 
+
+	def updateTopOfBookWithQuote (self, aQuote):
+		# Replaces the simulated top of book orders with orders at the quoted prices and sizes, a side without a price or 
+		# size is left empty.  Off tick prices of the replayed data are moved away from the market to the next tick, the bid 
+		# down and the ask up, so the quote stays uncrossed 
+		self.logger.info ("Updating top of book with quote:[%s]" % ( aQuote ) )
+
+		self.cancelTopOfBookOrders() 
+		accountId = self.exchangeParticipant.getAccount().getAccountId() 
+		for tradeAction, price, qty in ( ( trade.TradeActions.Buy, aQuote.bid, aQuote.bidsz ), ( trade.TradeActions.Sell, aQuote.ask, aQuote.asksz ) ): 
+			if price is not None and not self.orderBook.isValidTickPrice( price ): 
+				tick = price / self.orderBook.tickSize 
+				tickPrice = self.orderBook.tickToPrice( int ( math.floor( tick ) if tradeAction == trade.TradeActions.Buy else math.ceil( tick ) ) ) 
+				self.logger.info ("Moving off tick quote price to the tick price:[%s] tickPrice:[%s]" % ( price, tickPrice ) )
+				price = tickPrice 
+			if price is None or not price > 0 or not qty > 0: 
+				continue 
+			quoteOrder = order.Order( self.symbol, tradeAction, order.OrderTypes.Limit, price, qty, accountId ) 
+			result = super(ExchangeSimulation, self).submitOrder( quoteOrder )
+			if result[0] != True :
+				raise Exception("Failed to submit quote order to the order book")
+			if quoteOrder.getQty() > 0: # Not filled against resting orders on submission 
+				self.topOfBookOrders[ result[1] ] = quoteOrder 
 	
-	def runHistoricalTradeAsMarketOrder(self, tradeDataPoint):
+	def fillOrderAtOrderPrice(self, aOrder, trades, timestamp = None):
+		# Historical trades fill resting orders completly at the order price 
+		self.tradeId += 1 
+		transactionFee = aOrder.getPrice() * aOrder.getQty() * self.transactionFeePercentage 
+		aOrder.addFee( transactionFee )
+		trades.append( trade.Trade( aOrder.getAccountId(), self.tradeId, aOrder.getQty(), aOrder.getPrice(), aOrder.getTradeAction(), self.symbol, extraInfo = aOrder.extraInfo, orderId = aOrder.getOrderId(), fee = transactionFee, timestamp = timestamp ))
+		self.tradeTape.appendTrade( trades[-1] ) 
+
+	def runHistoricalTradeAsMarketOrder(self, tradeDataPoint, timestamp = None):
 		self.logger.info ("Running time series data processing data point:[%s]" % ( tradeDataPoint ) ) 
 		#self.logger.debug ("Running time series data processing current order book:[%s]" % ( self.orderBook ) ) 
 
+		# Only the price levels crossed by the move are visited, they come in price order from the order book price index 
 		trades = []
 		if tradeDataPoint > self.lastTradePoint: # Assume all ask orders below that ammount have been filled
-			for priceLevel, aOrderIdDict in sorted( self.orderBook.askOrderBook.items() ): 
-				if priceLevel >= tradeDataPoint:
-					break
-				for aOrderId, aOrder in aOrderIdDict.items(): 
+			for tick in self.orderBook.getAskTicksBelowPrice( tradeDataPoint ): 
+				for aOrder in self.orderBook.getWritablePriceLevel( self.orderBook.askOrderBook, tick ): 
 					self.logger.info ("Matching order price increased aOrder:[%s]" % ( aOrder ) ) 
-					self.tradeId += 1 
-					eInfo = aOrder.extraInfo 
-					eInfo ['transactionFee'] = aOrder.getPrice() * aOrder.getQty() * self.transactionFeePercentage 
-					trades.append( trade.Trade( aOrder.getAccountId(), self.tradeId, aOrder.getQty(), aOrder.getPrice(), aOrder.getTradeAction(), self.symbol, extraInfo = eInfo ))
+					self.fillOrderAtOrderPrice( aOrder, trades, timestamp )
 					self.orderBook.removeSellOrderFromOrderBook ( aOrder.getPrice(), aOrder.getOrderId() ) 
-					del self.deleteOrderDict [ aOrder.getOrderId() ]
 		
 		elif tradeDataPoint < self.lastTradePoint: # Assume all bid orders below that ammount have been filled 
-			for priceLevel, aOrderIdDict in sorted (self.orderBook.bidOrderBook.items(), reverse = True ): 
-				if priceLevel <= tradeDataPoint:
-					break
-				for aOrderId, aOrder in aOrderIdDict.items():  
+			for tick in self.orderBook.getBidTicksAbovePrice( tradeDataPoint ): 
+				for aOrder in self.orderBook.getWritablePriceLevel( self.orderBook.bidOrderBook, tick ):  
 					self.logger.info ("Matching order price decreased aOrder:[%s]" % ( aOrder ) ) 
-					self.tradeId += 1  
-					eInfo = aOrder.extraInfo 
-					eInfo ['transactionFee'] = aOrder.getPrice() * aOrder.getQty() * self.transactionFeePercentage 
-					trades.append( trade.Trade( aOrder.getAccountId(), self.tradeId, aOrder.getQty(), aOrder.getPrice(), aOrder.getTradeAction(), self.symbol, extraInfo = eInfo ))
+					self.fillOrderAtOrderPrice( aOrder, trades, timestamp )
 					self.orderBook.removeBuyOrderFromOrderBook ( aOrder.getPrice(), aOrder.getOrderId() ) 
-					del self.deleteOrderDict [ aOrder.getOrderId() ]
 
 		if len (trades) > 0:
 			self.publishTrades(trades)
+		self.publishBookDeltas() 
 
 		for accountId, funcOnTradePrice in self.funcOnTradePriceListeners.items(): 
 			funcOnTradePrice(tradeDataPoint) 
@@ -112,18 +152,129 @@ class ExchangeSimulation ( exchange.Exchange ):
 	def runTimeSeriesAsMarketOrderTrades (self, aTimeSeries ):
 		
 		self.logger.info ("Running time series data as trades aTimeSerise:[%s]" % ( aTimeSeries ) ) 
+
+		# TimeSeries or CsvTickReader, streamed chunk by chunk, fills get the tick timestamps.  Fills are still published tick by 
+		# tick while participants listen to trades or prices ( see runPriceArrayAsMarketOrderTrades ) 
+		if hasattr ( aTimeSeries, 'iterChunks' ): 
+			for timestamps, prices in aTimeSeries.iterChunks( withTimestamps = True ): 
+				self.runPriceArrayAsMarketOrderTrades( prices, timestamps = timestamps ) 
+			return 
 			
 		for tradeDataPoint in aTimeSeries:
 			self.runHistoricalTradeAsMarketOrder( tradeDataPoint )
+
+	@staticmethod
+	def iterStreamEvents (aStream, priority, streamIndex):
+		# ( timestamp, priority, streamIndex, event ) for each ( timestamp, event ) of a stream, a TimeSeries is read chunk by chunk 
+		if hasattr ( aStream, 'iterChunks' ): 
+			for timestamps, prices in aStream.iterChunks( withTimestamps = True ): 
+				for timestamp, price in zip ( timestamps.tolist(), prices.tolist() ): 
+					yield ( timestamp, priority, streamIndex, price ) 
+		else: 
+			for timestamp, event in aStream: 
+				yield ( timestamp, priority, streamIndex, event ) 
+
+	def runQuoteAndTradeStreams (self, quoteStreams = (), tradeStreams = () ):
+		# Replays any number of quote streams of ( timestamp, Quote ) and trade streams of ( timestamp, price ) or TimeSeries in 
+		# timestamp order.  Each stream must already be in timestamp order, they are merged lazily with a heap holding one event 
+		# per stream.  At equal timestamps quotes are applied before trades.  Quotes move the simulated top of book, trades are 
+		# run as market orders 
+		self.logger.info ("Running merged streams quoteStreams:[%s] tradeStreams:[%s]" % ( len ( quoteStreams ), len ( tradeStreams ) ) ) 
+
+		streams = [ ExchangeSimulation.iterStreamEvents( aStream, 0, i ) for i, aStream in enumerate ( quoteStreams ) ] 
+		streams += [ ExchangeSimulation.iterStreamEvents( aStream, 1, i ) for i, aStream in enumerate ( tradeStreams ) ] 
+		for timestamp, priority, streamIndex, event in heapq.merge( *streams ): 
+			if priority == 0: 
+				self.updateTopOfBookWithQuote( event ) 
+			else: 
+				self.runHistoricalTradeAsMarketOrder( event, timestamp ) 
+
+	def runPriceArrayAsMarketOrderTrades (self, prices, callbackIndices = None, timestamps = None ):
+		# Vectorized version of runTimeSeriesAsMarketOrderTrades.  The replay is split after each tick index in callbackIndices,
+		# that is where trade listeners and trade price listeners are called so strategies can add or cancel orders.  Between
+		# split points the book does not change so the crossing tick of every resting order is found with array operations.
+		# By default the replay is split after every tick when participants listen to trades or trade prices so they see the 
+		# book of each tick, otherwise it runs in one go.  With a strategy attached the default is therefore the per tick loop 
+		# and gets none of the vectorized speed up ( see ExchangeBenchmark.benchmarkSimulationReplay ), passing callbackIndices 
+		# opts in to publishing the fills of a whole segment at once after it has been matched.  Indices outside of prices are 
+		# ignored.
+		# Segments of a single tick go through runHistoricalTradeAsMarketOrder, the array setup costs more than it saves there.
+		# timestamps of the ticks are optional, they are set on the fills 
+		prices = numpy.asarray( prices, dtype = numpy.float64 )
+		self.logger.info ("Running price array as trades ticks:[%s]" % ( len ( prices ) ) ) 
+
+		if callbackIndices is None: 
+			callbackIndices = xrange ( 0, len ( prices ) ) if self.hasParticipantListeners() else [] 
+		else: 
+			callbackIndices = sorted ( set ( index for index in callbackIndices if 0 <= index < len ( prices ) ) ) 
+
+		tickPrices = prices.tolist() 
+		tickTimestamps = [ None ] * len ( prices ) if timestamps is None else numpy.asarray( timestamps, dtype = numpy.float64 ).tolist() 
+		start = 0 
+		for end in callbackIndices: 
+			if end == start: 
+				self.runHistoricalTradeAsMarketOrder( tickPrices[ start ], tickTimestamps[ start ] ) 
+				start = end + 1 
+			elif end > start: 
+				self.runPriceArraySegment( prices[ start : end + 1 ], None if timestamps is None else timestamps[ start : end + 1 ] ) 
+				start = end + 1 
+		if start < len ( prices ): 
+			self.runPriceArraySegment( prices[ start : ], None if timestamps is None else timestamps[ start : ] ) 
+
+	def runPriceArraySegment (self, prices, timestamps = None ):
+		# Same fills as calling runHistoricalTradeAsMarketOrder for each price, without visiting ticks where nothing is crossed.
+		# An ask is filled on the first up tick above its price, a bid on the first down tick below its price 
+		previousPrices = numpy.empty( len ( prices ) )
+		previousPrices[0] = -numpy.inf if self.lastTradePoint is None else self.lastTradePoint 
+		previousPrices[1:] = prices[:-1]
+		highestUpTick = numpy.maximum.accumulate( numpy.where( prices > previousPrices, prices, -numpy.inf ) )
+		lowestDownTick = numpy.minimum.accumulate( numpy.where( prices < previousPrices, prices, numpy.inf ) )
+
+		# Only levels crossed by the highest up tick / lowest down tick of the segment are looked at 
+		crossedLevels = [] # ( tick index, is ask, price level tick ) 
+		if highestUpTick[-1] != -numpy.inf: 
+			askTicks = self.orderBook.getAskTicksBelowPrice( highestUpTick[-1] ) 
+			askPrices = numpy.array( [ self.orderBook.askOrderBook[ tick ].price for tick in askTicks ] ) 
+			for tick, crossIndex in zip ( askTicks, numpy.searchsorted( highestUpTick, askPrices, side = 'right' ) ): 
+				crossedLevels.append( ( crossIndex, True, tick ) ) 
+
+		if lowestDownTick[-1] != numpy.inf: 
+			bidTicks = self.orderBook.getBidTicksAbovePrice( lowestDownTick[-1] ) 
+			bidPrices = numpy.array( [ self.orderBook.bidOrderBook[ tick ].price for tick in bidTicks ] ) 
+			for tick, crossIndex in zip ( bidTicks, numpy.searchsorted( -lowestDownTick, -bidPrices, side = 'right' ) ): 
+				crossedLevels.append( ( crossIndex, False, tick ) ) 
+
+		# A tick is either an up or a down tick so sorting by tick index keeps the price order of each side 
+		crossedLevels.sort( key = lambda crossedLevel: crossedLevel[0] ) 
+		trades = [] 
+		for crossIndex, isAsk, tick in crossedLevels: 
+			if isAsk: 
+				matchOrders = self.orderBook.removeAskPriceLevel( tick, updateTopOfBook = False ) 
+			else: 
+				matchOrders = self.orderBook.removeBidPriceLevel( tick, updateTopOfBook = False ) 
+			timestamp = None if timestamps is None else float ( timestamps[ crossIndex ] ) 
+			for aOrder in matchOrders: 
+				self.fillOrderAtOrderPrice( aOrder, trades, timestamp ) 
+		if crossedLevels: 
+			self.orderBook.updateTopOfBook() 
+
+		if len (trades) > 0:
+			self.publishTrades(trades)
+		self.publishBookDeltas() 
+
+		for accountId, funcOnTradePrice in self.funcOnTradePriceListeners.items(): 
+			funcOnTradePrice( float ( prices[-1] ) ) 
+
+		self.lastTradePoint = float ( prices[-1] ) 
 		
 	
 class TestExchangeSimulation():
 	
 	@staticmethod
-	def testCreateQuoteList(): 
+	def testCreateQuoteList( symbol ): 
 		quoteTimeList = [ ] # Prepare quotes to send to client for controlled testing
-		quoteTimeList.append ( quote.Quote( symbol, 12.00, 12.01, 1, 1 ) ) 
-		quoteTimeList.append ( quote.Quote( symbol, 12.00, 12.05, 1, 1 ) ) 
+		quoteTimeList.append ( ( 1, quote.Quote( symbol, 12.00, 12.01, 1, 1 ) ) ) 
+		quoteTimeList.append ( ( 4, quote.Quote( symbol, 12.00, 12.05, 1, 1 ) ) ) 
 		return quoteTimeList 
 	
 	@staticmethod
@@ -140,7 +291,7 @@ class TestExchangeSimulation():
 		tradeTimeSeries = TestExchangeSimulation.testCreateTradeList()
 
 		# This can be merged with the trade data to replicate changes in the order book from the exchange if data is available
-		#quoteTimeSeries = TestExchangeSimulation.testCreateQuoteList()  
+		#quoteTimeSeries = TestExchangeSimulation.testCreateQuoteList( symbol ) , see testSimulationWithQuoteAndTradeStreams 
 
 		testExchangeSimulation = ExchangeSimulation( symbol )
 		
@@ -155,9 +306,171 @@ class TestExchangeSimulation():
 		# Test Simulation
 		testExchangeSimulation.runTimeSeriesAsMarketOrderTrades( timeSeriesArray ) 
 		
+	@staticmethod
+	def testSimulationFork(): 
+
+		# Replays from one point in time branched with fork give the same fills as replays from the start 
+		symbol = "TEST_SYMBOL" 
+		prices = [ 10.05, 10.1, 10.02, 9.95, 9.91, 9.99, 10.15, 10.12 ] 
+		def createSimulation(): 
+			testExchangeSimulation = ExchangeSimulation( symbol )
+			testExchangeSimulation.initTopOfBookWithPrice( 10.0 ) 
+			for i in range ( 2, 21 ): 
+				testExchangeSimulation.submitOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 10 - i * .01, i, 1 ) ) 
+				testExchangeSimulation.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 10 + i * .01, i, 1 ) ) 
+			return testExchangeSimulation 
+
+		baseSimulation = createSimulation() 
+		baseSimulation.runTimeSeriesAsMarketOrderTrades( prices[ : 3 ] ) 
+		for continuation in ( prices[ 3 : ], [ 10.2, 9.8 ] ): 
+			forkedSimulation = baseSimulation.fork() 
+			forkedSimulation.runTimeSeriesAsMarketOrderTrades( continuation ) 
+
+			referenceSimulation = createSimulation() 
+			referenceSimulation.runTimeSeriesAsMarketOrderTrades( prices[ : 3 ] + continuation ) 
+			referenceTape = referenceSimulation.tradeTape 
+			assert ( list ( forkedSimulation.tradeTape.getColumn( 'price' ) ) == list ( referenceTape.getColumn( 'price' ) )[ len ( baseSimulation.tradeTape ) : ] ) 
+			assert ( forkedSimulation.orderBook.getTopOfBook() == referenceSimulation.orderBook.getTopOfBook() ) 
+			assert ( forkedSimulation.topOfBookOrders == referenceSimulation.topOfBookOrders ) 
+
+		# The replays of the forks did not change the base simulation
+		assert ( baseSimulation.orderBook.getTopOfBook() == quote.Quote( symbol, 9.99, 10.1, 1, 10 ) and len ( baseSimulation.tradeTape ) == 9 ) 
+
+	@staticmethod
+	def testSimulationVectorizedReplay(): 
+
+		symbol = "TEST_SYMBOL" 
+		prices = [ 10.05, 10.1, 10.02, 9.95, 9.91, 9.99, 10.15, 10.12, 10.2, 9.85, 9.9, 9.88, 10.25 ] 
+
+		def createSimulation(): 
+			testExchangeSimulation = ExchangeSimulation( symbol )
+			testExchangeSimulation.lastTradePoint = 10.0 
+			for i in range ( 1, 31 ): 
+				testExchangeSimulation.submitOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 10 - i * .01, i, 1 ) ) 
+				testExchangeSimulation.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 10 + i * .01, i, 1 ) ) 
+			return testExchangeSimulation 
+
+		def getFills( testExchangeSimulation ): 
+			return zip ( testExchangeSimulation.tradeTape.getColumn( 'price' ), testExchangeSimulation.tradeTape.getColumn( 'qty' ) ) 
+
+		loopSimulation = createSimulation() 
+		loopSimulation.runTimeSeriesAsMarketOrderTrades( prices ) 
+
+		# Whole array in one go, split at callback points ( unsorted, repeated and past the end are ignored ), and split after 
+		# every tick because of a trade price listener 
+		for callbackIndices in ( None, [ 3, 4, 8 ], [ 8, 3, 3, 4, 12, 13, 50 ] ): 
+			vectorizedSimulation = createSimulation() 
+			vectorizedSimulation.runPriceArrayAsMarketOrderTrades( prices, callbackIndices ) 
+			assert ( getFills( vectorizedSimulation ) == getFills( loopSimulation ) ) 
+			assert ( vectorizedSimulation.orderBook.getTopOfBook() == loopSimulation.orderBook.getTopOfBook() ) 
+
+		seenPrices = [] 
+		vectorizedSimulation = createSimulation() 
+		vectorizedSimulation.funcOnTradePriceListeners[ 1 ] = seenPrices.append 
+		vectorizedSimulation.runPriceArrayAsMarketOrderTrades( prices, timestamps = numpy.arange( 1000, 1000 + len ( prices ) ) ) 
+		assert ( seenPrices == prices and getFills( vectorizedSimulation ) == getFills( loopSimulation ) ) 
+		timestampSimulation = createSimulation() 
+		timestampSimulation.runPriceArrayAsMarketOrderTrades( prices, timestamps = numpy.arange( 1000, 1000 + len ( prices ) ) ) 
+		assert ( list ( vectorizedSimulation.tradeTape.getColumn( 'timestamp' ) ) == list ( timestampSimulation.tradeTape.getColumn( 'timestamp' ) ) ) 
+
+		# A strategy order added at a split point is filled by the rest of the replay 
+		vectorizedSimulation = createSimulation() 
+		vectorizedSimulation.runPriceArrayAsMarketOrderTrades( prices[ : 5 ], [ 4 ] ) 
+		vectorizedSimulation.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 10.13, 7, 2 ) ) 
+		vectorizedSimulation.runPriceArrayAsMarketOrderTrades( prices[ 5 : ] ) 
+		assert ( list ( vectorizedSimulation.tradeTape.getColumn( 'accountId' ) ).count( 2 ) == 1 ) 
+		assert ( ( 10.13, 7 ) in getFills( vectorizedSimulation ) ) 
+
+	@staticmethod
+	def testSimulationWithMemoryMappedTimeSeries(): 
+		import tempfile
+		import shutil
+
+		symbol = "TEST_SYMBOL" 
+		prices = [ 10.05, 10.1, 10.02, 9.95, 9.91, 9.99, 10.15, 10.12, 10.2, 9.85, 9.9, 9.88, 10.25 ] 
+		directory = tempfile.mkdtemp()
+		try: 
+			time_series.TimeSeries( prices, timestamps = range ( 1000, 1000 + len ( prices ) ) ).save( directory ) 
+			aTimeSeries = time_series.TimeSeries.open( directory ) 
+
+			simulations = [] 
+			for timeSeriesData in ( prices, aTimeSeries ): 
+				testExchangeSimulation = ExchangeSimulation( symbol )
+				testExchangeSimulation.lastTradePoint = 10.0 
+				for i in range ( 1, 31 ): 
+					testExchangeSimulation.submitOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 10 - i * .01, i, 1 ) ) 
+					testExchangeSimulation.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 10 + i * .01, i, 1 ) ) 
+				testExchangeSimulation.runTimeSeriesAsMarketOrderTrades( timeSeriesData ) 
+				simulations.append( testExchangeSimulation ) 
+
+			listTape, timeSeriesTape = simulations[0].tradeTape, simulations[1].tradeTape 
+			assert ( list ( listTape.getColumn( 'price' ) ) == list ( timeSeriesTape.getColumn( 'price' ) ) ) 
+			assert ( timeSeriesTape.getColumn( 'timestamp' )[0] == 1000 and timeSeriesTape.getColumn( 'timestamp' )[-1] == 1012 ) 
+
+			# A trade listener sees each fill with the book of its tick, as with the list replay 
+			booksAtFills = [] 
+			for timeSeriesData in ( prices, aTimeSeries ): 
+				testExchangeSimulation = ExchangeSimulation( symbol )
+				testExchangeSimulation.lastTradePoint = 10.0 
+				for i in range ( 1, 31 ): 
+					testExchangeSimulation.submitOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 10 - i * .01, i, 1 ) ) 
+					testExchangeSimulation.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 10 + i * .01, i, 1 ) ) 
+				seenBooks = [] 
+				testExchangeSimulation.registerTradeListener( exchange_account.ExchangeAccount( 1 ), lambda exchangeTrade, testExchangeSimulation = testExchangeSimulation, seenBooks = seenBooks : seenBooks.append( str ( testExchangeSimulation.orderBook.getTopOfBook() ) ) ) 
+				testExchangeSimulation.runTimeSeriesAsMarketOrderTrades( timeSeriesData ) 
+				booksAtFills.append( seenBooks ) 
+			assert ( len ( booksAtFills[0] ) == len ( listTape.getColumn( 'price' ) ) and booksAtFills[0] == booksAtFills[1] ) 
+		finally: 
+			shutil.rmtree( directory ) 
+
+	@staticmethod
+	def testSimulationWithQuoteAndTradeStreams(): 
+
+		symbol = "TEST_SYMBOL" 
+		testExchangeSimulation = ExchangeSimulation( symbol )
+		strategyAccountId = 7 
+		testExchangeSimulation.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 12.03, 5, strategyAccountId ) ) 
+
+		quoteStream = TestExchangeSimulation.testCreateQuoteList( symbol ) 
+		tradeStream = [ ( 2, 12.01 ), ( 3, 12.02 ), ( 4, 12.04 ), ( 6, 11.99 ) ] 
+		secondTradeStream = time_series.TimeSeries( [ 12.05 ], timestamps = [ 5 ] ) 
+
+		quotesSeen = [] 
+		updateTopOfBookWithQuote = testExchangeSimulation.updateTopOfBookWithQuote 
+		def recordQuote( aQuote ): 
+			quotesSeen.append( ( testExchangeSimulation.lastTradePoint, aQuote.ask ) ) 
+			updateTopOfBookWithQuote( aQuote ) 
+		testExchangeSimulation.updateTopOfBookWithQuote = recordQuote 
+
+		testExchangeSimulation.runQuoteAndTradeStreams( [ quoteStream ], [ tradeStream, secondTradeStream ] ) 
+
+		# The quote at time 4 is applied before the trade at time 4 
+		assert ( quotesSeen == [ ( None, 12.01 ), ( 12.02, 12.05 ) ] ) 
+		tape = testExchangeSimulation.tradeTape 
+		fills = zip ( tape.getColumn( 'timestamp' ).tolist(), tape.getColumn( 'accountId' ).tolist(), tape.getColumn( 'price' ).tolist() ) 
+		assert ( fills == [ ( 3, 0, 12.01 ), ( 4, strategyAccountId, 12.03 ), ( 6, 0, 12.0 ) ] ) 
+		assert ( testExchangeSimulation.orderBook.getTopOfBook() == quote.Quote( symbol, None, 12.05, 0, 1 ) ) 
+
+	@staticmethod
+	def testSimulationWithOffTickQuotes(): 
+
+		symbol = "TEST_SYMBOL" 
+		testExchangeSimulation = ExchangeSimulation( symbol )
+		testExchangeSimulation.updateTopOfBookWithQuote( quote.Quote( symbol, 10.005, 10.006, 3, 4 ) ) 
+		assert ( testExchangeSimulation.orderBook.getTopOfBook() == quote.Quote( symbol, 10.0, 10.01, 3, 4 ) ) 
+
+		# A bid that rounds down to zero is left out 
+		testExchangeSimulation.updateTopOfBookWithQuote( quote.Quote( symbol, .004, 10.02, 3, 4 ) ) 
+		assert ( testExchangeSimulation.orderBook.getTopOfBook() == quote.Quote( symbol, None, 10.02, 0, 4 ) ) 
+
 if __name__ == "__main__":
 	
 	logger.MyLogger.InitializeLogger()
 	
 	TestExchangeSimulation.testWithPredeterminedTimeSeries()
+	TestExchangeSimulation.testSimulationFork()
+	TestExchangeSimulation.testSimulationVectorizedReplay()
+	TestExchangeSimulation.testSimulationWithMemoryMappedTimeSeries()
+	TestExchangeSimulation.testSimulationWithQuoteAndTradeStreams()
+	TestExchangeSimulation.testSimulationWithOffTickQuotes()
 
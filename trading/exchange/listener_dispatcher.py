@@ -0,0 +1,192 @@
+#!/usr/bin/python
+
+import trading.exchange.participant_queue as participant_queue
+import logger.logger as logger
+import logging
+import threading
+import Queue
+
+class ListenerQueue( participant_queue.ParticipantQueue ):
+
+	"""
+	The bounded queue of calls waiting for one listener of a ListenerDispatcher, each message is the tuple of arguments of a
+	call.  The queue is put on the dispatcher's ready queue when its first call arrives and stays scheduled until a worker
+	finds it empty, so at most one worker calls a listener at a time and its calls keep their order.
+	"""
+
+	def __init__(self, listener, readyQueue, maxSize, policy, conflationKey):
+		participant_queue.ParticipantQueue.__init__( self, maxSize, policy, conflationKey )
+		self.listener = listener
+		self.readyQueue = readyQueue
+		self.scheduled = False
+
+	def __call__(self, *args):
+		# Replaces the listener in the exchange, called by the matching thread
+		with self.condition:
+			self.put( args )
+			if not self.scheduled:
+				self.scheduled = True
+				self.readyQueue.put( self )
+
+	def __str__(self):
+		return "ListenerQueue listener:[%s] waiting:[%s] policy:[%s] dropped:[%s] conflated:[%s]" % ( self.listener, len ( self ), self.policy, self.droppedCount, self.conflatedCount )
+
+class ListenerDispatcher():
+
+	"""
+	This class moves listener calls off the matching thread.  wrap returns a ListenerQueue that is registered with the
+	exchange in place of the listener ( see Exchange.setListenerDispatcher ), calling it only queues the arguments.
+	numberOfThreads workers take scheduled queues from the ready queue and call the listener with every waiting call.
+	When a listener queue is full its policy decides, Block makes the matching thread wait, DropOldest drops the oldest
+	call and Conflate keeps only the latest call per conflationKey( args ), e.g. the latest trade price.  The policy, maxSize
+	and conflationKey can be given per listener when it is registered, trade listeners can not be conflated since every fill
+	has to be delivered.  Listener exceptions are logged and do not stop the worker.  The workers run next to the matching
+	thread and the exchange takes no locks, so a listener must not call back into the exchange, orders it places go through
+	an ExchangeGateway.
+	"""
+
+	def __init__(self, numberOfThreads = 2, maxSize = 1024, policy = participant_queue.BackpressurePolicies.DropOldest):
+		self.numberOfThreads = numberOfThreads
+		self.maxSize = maxSize
+		self.policy = policy
+		self.readyQueue = Queue.Queue()
+		self.listenerQueues = []
+		self.workers = []
+		self.logger = logging.getLogger('MyLogger')
+
+	def wrap(self, listener, maxSize = None, policy = None, conflationKey = None):
+		listenerQueue = ListenerQueue( listener, self.readyQueue, maxSize or self.maxSize, self.policy if policy is None else policy, conflationKey )
+		self.logger.info( "Dispatching listener:[%s] maxSize:[%s] policy:[%s]" % ( listener, listenerQueue.maxSize, listenerQueue.policy ) )
+		self.listenerQueues.append( listenerQueue )
+		return listenerQueue
+
+	def start(self):
+		for i in range ( 0, self.numberOfThreads ):
+			worker = threading.Thread( target = self.run )
+			worker.daemon = True
+			worker.start()
+			self.workers.append( worker )
+
+	def flush(self):
+		# Waits until every call queued so far has been delivered
+		self.readyQueue.join()
+
+	def stop(self):
+		# Delivers the waiting calls before the workers exit
+		self.flush()
+		for worker in self.workers:
+			self.readyQueue.put( None )
+		for worker in self.workers:
+			worker.join()
+		self.workers = []
+		for listenerQueue in self.listenerQueues:
+			listenerQueue.close()
+
+	def run(self):
+		while True:
+			listenerQueue = self.readyQueue.get()
+			if listenerQueue is None:
+				self.readyQueue.task_done()
+				return
+			try:
+				for args in listenerQueue.getAll():
+					try:
+						listenerQueue.listener( *args )
+					except Exception as ex:
+						self.logger.warning( "Failed to deliver listener call listenerQueue:[%s] exception:[%s]" % ( listenerQueue, ex ) )
+			finally:
+				with listenerQueue.condition:
+					if len ( listenerQueue ) > 0:
+						self.readyQueue.put( listenerQueue )
+					else:
+						listenerQueue.scheduled = False
+				self.readyQueue.task_done()
+
+class TestListenerDispatcher():
+
+	@staticmethod
+	def testListenerDispatcher():
+		import time
+
+		dispatcher = ListenerDispatcher( numberOfThreads = 3, maxSize = 4 )
+		calls = []
+		orderedListener = dispatcher.wrap( lambda value : calls.append( value ), maxSize = 1000 )
+		failingListener = dispatcher.wrap( lambda value : 1 / value )
+		gate = threading.Event()
+		slowCalls = []
+		def onSlowCall( value ):
+			gate.wait()
+			slowCalls.append( value )
+		slowListener = dispatcher.wrap( onSlowCall )
+		prices = []
+		priceListener = dispatcher.wrap( lambda price : ( gate.wait(), prices.append( price ) ), policy = participant_queue.BackpressurePolicies.Conflate )
+		dispatcher.start()
+
+		# The caller never waits for the slow listeners, the other listeners keep being served
+		startTime = time.time()
+		for i in range ( 0, 100 ):
+			orderedListener( i )
+			failingListener( i )
+			slowListener( i )
+			priceListener( 10 + i )
+		assert ( time.time() - startTime < 1 )
+		deadline = time.time() + 5
+		while len ( calls ) < 100 and time.time() < deadline:
+			time.sleep( .01 )
+		assert ( calls == range ( 0, 100 ) )
+
+		gate.set()
+		dispatcher.stop()
+		assert ( slowCalls[ -4 : ] == [ 96, 97, 98, 99 ] and slowListener.droppedCount == 100 - len ( slowCalls ) )
+		assert ( prices[-1] == 109 and len ( prices ) <= 2 and priceListener.conflatedCount == 100 - len ( prices ) )
+
+	@staticmethod
+	def testDispatchedExchange():
+		import trading.exchange.exchange as exchange
+		import trading.exchange.exchange_account as exchange_account
+		import trading.exchange.order as order
+		import trading.exchange.trade as trade
+
+		symbol = "AA"
+		testExchange = exchange.Exchange( symbol )
+		dispatcher = ListenerDispatcher( numberOfThreads = 2, policy = participant_queue.BackpressurePolicies.Block )
+		testExchange.setListenerDispatcher( dispatcher )
+		trades1 = []
+		trades2 = []
+		testExchange.registerTradeListener( exchange_account.ExchangeAccount( 1 ), trades1.append )
+		testExchange.registerTradesListener( exchange_account.ExchangeAccount( 2 ), trades2.extend )
+		assert ( isinstance ( testExchange.funcOnTradeListeners[ 1 ], ListenerQueue ) )
+		dispatcher.start()
+
+		testExchange.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 10, 5, 1 ) )
+		testExchange.submitOrder( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 11, 5, 1 ) )
+		testExchange.submitOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Market, None, 7, 1 ) )
+		testExchange.submitOrders( [ order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 11, 1, 2 ) ] )
+		dispatcher.stop()
+		assert ( [ ( exchangeTrade.qty, exchangeTrade.tradePrice, exchangeTrade.tradeAction ) for exchangeTrade in trades1 ] == [ ( 5, 10, trade.TradeActions.Buy ), ( 5, 10, trade.TradeActions.Sell ), ( 2, 11, trade.TradeActions.Buy ), ( 2, 11, trade.TradeActions.Sell ), ( 1, 11, trade.TradeActions.Sell ) ] )
+		assert ( [ ( exchangeTrade.qty, exchangeTrade.tradePrice ) for exchangeTrade in trades2 ] == [ ( 1, 11 ) ] )
+
+		# Listeners can pick their own policy, trade listeners are never conflated
+		conflatingDispatcher = ListenerDispatcher( policy = participant_queue.BackpressurePolicies.Conflate )
+		testExchange.setListenerDispatcher( conflatingDispatcher )
+		testExchange.registerTradePriceListener( exchange_account.ExchangeAccount( 3 ), lambda price : None, conflationKey = lambda args : 0 )
+		testExchange.registerTradeListener( exchange_account.ExchangeAccount( 4 ), lambda exchangeTrade : None, maxSize = 8, policy = participant_queue.BackpressurePolicies.Block )
+		assert ( testExchange.funcOnTradeListeners[ 4 ].policy == participant_queue.BackpressurePolicies.Block and testExchange.funcOnTradeListeners[ 4 ].maxSize == 8 )
+		for registerListener in [ testExchange.registerTradeListener, testExchange.registerTradesListener ]:
+			try:
+				registerListener( exchange_account.ExchangeAccount( 5 ), lambda exchangeTrades : None )
+				assert ( False )
+			except AssertionError:
+				raise
+			except Exception:
+				pass
+		assert ( 5 not in testExchange.funcOnTradeListeners and 5 not in testExchange.funcOnTradesListeners )
+
+		# A fork delivers inline again
+		assert ( testExchange.fork().listenerDispatcher is None )
+
+if __name__ == "__main__":
+
+	logger.MyLogger.InitializeLogger()
+	TestListenerDispatcher.testListenerDispatcher()
+	TestListenerDispatcher.testDispatchedExchange()
@@ -24,8 +24,12 @@ class OrderTypes():
 	def __init__(self):
 		pass
  
-class Order():
-	def __init__(self, symbol, tradeAction, orderType, price, qty, acctId, orderId=None, extraInfo = {} ):
+class Order( object ):
+
+	# Fixed attributes instead of a per instance __dict__, resting orders are the largest population of objects in the exchange 
+	__slots__ = ( 'symbol', 'tradeAction', 'orderType', 'price', 'qty', 'originalQty', 'orderId', 'acctId', 'state', 'fee', 'extraInfo' )
+
+	def __init__(self, symbol, tradeAction, orderType, price, qty, acctId, orderId=None, extraInfo = None ):
 		self.symbol = symbol  
 		self.tradeAction = tradeAction 
 		self.orderType = orderType 
@@ -35,7 +39,8 @@ class Order():
 		self.orderId = orderId 
 		self.acctId = acctId 
 		self.state = None 
-		self.extraInfo = extraInfo 
+		self.fee = 0 # Total transaction fees charged to this order 
+		self.extraInfo = extraInfo # Only allocated when used, see getExtraInfo 
 		
 	def getSymbol (self):
 		return self.symbol  
@@ -64,9 +69,28 @@ class Order():
 
 	def getAccountId(self):
 		return self.acctId
+
+	def getFee(self):
+		return self.fee 
+	def addFee(self, fee):
+		self.fee += fee 
+
+	def copy(self):
+		# Independent copy, e.g. when a forked order book changes an order it shares with another book 
+		copiedOrder = Order( self.symbol, self.tradeAction, self.orderType, self.price, self.qty, self.acctId, self.orderId, 
+			dict ( self.extraInfo ) if self.extraInfo is not None else None )
+		copiedOrder.originalQty = self.originalQty 
+		copiedOrder.state = self.state 
+		copiedOrder.fee = self.fee 
+		return copiedOrder 
+
+	def getExtraInfo(self):
+		if self.extraInfo is None: 
+			self.extraInfo = {} 
+		return self.extraInfo 
 	
 	def __str__(self): 
-		return str ( vars(self) )
+		return str ( dict ( ( key, getattr( self, key ) ) for key in self.__slots__ ) )
 	
 	def __repr__(self): 
 		return self.__str__() 
@@ -87,6 +111,22 @@ class TestOrder():
 		l_aOrder.getOrderId()
 		l_aOrder.getAccountId()
 		
+		# extraInfo is not shared between orders and is only created when it is used 
+		l_aOrder2 = Order( "AA", trade.TradeActions.Buy, OrderTypes.Limit, 100, 0, 0, 2 ) 
+		assert ( l_aOrder.extraInfo is None ) 
+		l_aOrder.getExtraInfo()['note'] = 1 
+		assert ( l_aOrder2.extraInfo is None ) 
+		assert ( not hasattr ( l_aOrder, '__dict__' ) ) 
+
+		l_aOrder.addFee( .5 ) 
+		assert ( l_aOrder.getFee() == .5 and l_aOrder2.getFee() == 0 ) 
+
+		l_aOrderCopy = l_aOrder.copy() 
+		l_aOrderCopy.setQty( 5 ) 
+		l_aOrderCopy.getExtraInfo()['note'] = 2 
+		assert ( l_aOrderCopy.getFee() == .5 and l_aOrderCopy.getOrderId() == 1 ) 
+		assert ( l_aOrder.getQty() == 0 and l_aOrder.getExtraInfo()['note'] == 1 ) 
+		
 		print l_aOrder
 
 if __name__ == "__main__":
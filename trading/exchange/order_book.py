@@ -3,8 +3,12 @@
 import trading.exchange.order as order 
 import trading.exchange.quote as quote 
 import trading.exchange.trade as trade 
+import trading.exchange.depth_index as depth_index 
+import trading.exchange.order_slab as order_slab 
 import logger.logger as logger 
 import logging 
+import heapq 
+import copy 
 
 class CondencedOrderBook():
 
@@ -12,22 +16,47 @@ class CondencedOrderBook():
 	This class represents a condenced order book.  The condensed order book does not contain information for specific orders 
 	for each price level but rather provides the quanity of limit orders at each price.  This can more easily be used to view 
 	the total quantity available at a price level and determine the average price you will obtain from a market order that 
-	depletes mutliple price levels. 
+	depletes mutliple price levels.  The cumulative depth of each side is indexed on the first query so repeated queries 
+	against the same snapshot are O(log n). 
 	"""
 
-	def __init__(self, symbol, bidOrderBook, askOrderBook, highestBidPrc = None, lowestAskPrc = None ):
+	def __init__(self, symbol, bidOrderBook, askOrderBook, highestBidPrc = None, lowestAskPrc = None, tickSize = .01 ):
 		self.symbol = symbol 
 		self.bidOrderBook = bidOrderBook # Price Level -> condenced order ( sum of all orders at that price level ) 
 		self.askOrderBook = askOrderBook # Price Level -> condenced order ( sum of all orders at that price level ) 
 		self.highestBidPrc = highestBidPrc 
 		self.lowestAskPrc = lowestAskPrc 
+		self.tickSize = tickSize 
+		self.bidDepthIndex = None # Built on first depth query 
+		self.askDepthIndex = None 
 		self.logger = logging.getLogger('MyLogger')		
 
+	def getBidDepthIndex ( self ):
+		if self.bidDepthIndex is None: 
+			self.bidDepthIndex = depth_index.DepthIndex( self.tickSize, highestIsBest = True )
+			for priceLevel, bidQuote in self.bidOrderBook.iteritems(): 
+				self.bidDepthIndex.addQty( priceLevel, bidQuote.bidsz )
+		return self.bidDepthIndex 
+	
+	def getAskDepthIndex ( self ):
+		if self.askDepthIndex is None: 
+			self.askDepthIndex = depth_index.DepthIndex( self.tickSize, highestIsBest = False )
+			for priceLevel, askQuote in self.askOrderBook.iteritems(): 
+				self.askDepthIndex.addQty( priceLevel, askQuote.asksz )
+		return self.askDepthIndex 
+
 	def getTotalAskQtyBelowPrice ( self, price ):
-		return sum ( askQuote.asksz for priceLevel, askQuote in self.askOrderBook.iteritems() if priceLevel <= price ) 
+		return self.getAskDepthIndex().getQtyThroughPrice( price )
 	
 	def getTotalBidQtyAbovePrice (self, price ):
-		return sum ( bidQuote.bidsz for priceLevel, bidQuote in self.bidOrderBook.iteritems() if priceLevel >= price ) 
+		return self.getBidDepthIndex().getQtyThroughPrice( price )
+	
+	def getAverageFillPrice (self, tradeAction, qty ):
+		# Average price a market order of qty would obtain, None if the book can not fill the quantity 
+		if tradeAction == trade.TradeActions.Buy: 
+			return self.getAskDepthIndex().getAverageFillPrice( qty )
+		elif tradeAction == trade.TradeActions.Sell: 
+			return self.getBidDepthIndex().getAverageFillPrice( qty )
 	
 	def __str__ ( self ):
 		returnStr = " ------------------- Printing Condenced Order Book for symbol:[%s] ------------------- \n" % ( self.symbol )  
@@ -43,61 +72,630 @@ class CondencedOrderBook():
 		return returnStr 
 		
 
+class PriceLevel():
+
+	"""
+	This class holds the queue of orders resting at a single price level in time priority.  The orders live in the order book's 
+	OrderSlab and the queue is a doubly linked list through the slab's prevSlots / nextSlots arrays, so appending, filling 
+	from the front and canceling from anywhere in the queue are array updates without searching or sorting.  The total quantity 
+	resting at the level is kept up to date as orders are added, partially filled and removed.
+	"""
+
+	def __init__(self, price, tick, orderSlab):
+		self.price = price 
+		self.tick = tick # Integer tick of the price in the order book 
+		self.orderSlab = orderSlab 
+		self.headSlot = order_slab.OrderSlab.EMPTY_SLOT # Oldest order, first to be filled 
+		self.tailSlot = order_slab.OrderSlab.EMPTY_SLOT # Newest order 
+		self.orderCount = 0 
+		self.totalQty = 0 # Sum of the remaining quantity of every order at this price level 
+
+	def __len__(self):
+		return self.orderCount 
+
+	def getSlot(self, orderId):
+		# Slot of orderId if it is resting at this price level
+		slot = self.orderSlab.getSlot( orderId )
+		if slot != order_slab.OrderSlab.EMPTY_SLOT and self.orderSlab.priceTicks[ slot ] != self.tick: 
+			return order_slab.OrderSlab.EMPTY_SLOT
+		return slot 
+
+	def __contains__(self, orderId):
+		return self.getSlot( orderId ) != order_slab.OrderSlab.EMPTY_SLOT
+
+	def __getitem__(self, orderId):
+		slot = self.getSlot( orderId )
+		if slot == order_slab.OrderSlab.EMPTY_SLOT: 
+			raise KeyError( orderId )
+		return self.orderSlab.orders[ slot ]
+
+	def __iter__(self):
+		# Next slot is read before yielding so the yielded order can be removed by the caller during iteration 
+		orderSlab = self.orderSlab 
+		slot = self.headSlot 
+		while slot != order_slab.OrderSlab.EMPTY_SLOT: 
+			currentOrder = orderSlab.orders[ slot ]
+			slot = orderSlab.nextSlots[ slot ]
+			yield currentOrder 
+
+	def getFrontOrder(self):
+		if self.headSlot == order_slab.OrderSlab.EMPTY_SLOT: 
+			return None 
+		return self.orderSlab.orders[ self.headSlot ]
+
+	def getTotalQty(self):
+		return self.totalQty 
+
+	def getOrderCount(self):
+		return self.orderCount 
+
+	def reduceOrderQty(self, currentOrder, qty):
+		# The order held by this level is changed, after a fork currentOrder may be the copy still held by the other book 
+		slot = self.orderSlab.getSlot( currentOrder.getOrderId() )
+		restingOrder = self.orderSlab.orders[ slot ] 
+		restingOrder.setQty( restingOrder.getQty() - qty )
+		self.orderSlab.qtys[ slot ] -= qty 
+		self.totalQty -= qty 
+
+	def appendOrder(self, currentOrder):
+		orderSlab = self.orderSlab 
+		slot = orderSlab.addOrder( currentOrder, self.tick )
+		orderSlab.prevSlots[ slot ] = self.tailSlot 
+		if self.tailSlot == order_slab.OrderSlab.EMPTY_SLOT: 
+			self.headSlot = slot 
+		else: 
+			orderSlab.nextSlots[ self.tailSlot ] = slot 
+		self.tailSlot = slot 
+		self.orderCount += 1 
+		self.totalQty += currentOrder.getQty()
+
+	def removeOrder(self, orderId):
+		orderSlab = self.orderSlab 
+		slot = self.getSlot( orderId )
+		if slot == order_slab.OrderSlab.EMPTY_SLOT: 
+			raise KeyError( orderId )
+
+		prevSlot = orderSlab.prevSlots[ slot ]
+		nextSlot = orderSlab.nextSlots[ slot ]
+		if prevSlot == order_slab.OrderSlab.EMPTY_SLOT: 
+			self.headSlot = nextSlot 
+		else: 
+			orderSlab.nextSlots[ prevSlot ] = nextSlot 
+		if nextSlot == order_slab.OrderSlab.EMPTY_SLOT: 
+			self.tailSlot = prevSlot 
+		else: 
+			orderSlab.prevSlots[ nextSlot ] = prevSlot 
+
+		currentOrder = orderSlab.orders[ slot ]
+		self.totalQty -= orderSlab.qtys[ slot ]
+		self.orderCount -= 1 
+		orderSlab.removeSlot( slot )
+		return currentOrder 
+
+	def removeAllOrders(self):
+		# Empties the price level in one pass and returns its orders in time priority, the orders keep their remaining quantity 
+		orderSlab = self.orderSlab 
+		removedOrders = [] 
+		slot = self.headSlot 
+		while slot != order_slab.OrderSlab.EMPTY_SLOT: 
+			nextSlot = orderSlab.nextSlots[ slot ]
+			removedOrders.append( orderSlab.orders[ slot ] )
+			orderSlab.removeSlot( slot )
+			slot = nextSlot 
+
+		self.headSlot = order_slab.OrderSlab.EMPTY_SLOT 
+		self.tailSlot = order_slab.OrderSlab.EMPTY_SLOT 
+		self.orderCount = 0 
+		self.totalQty = 0 
+		return removedOrders 
+
+	def copyTo(self, orderSlab):
+		# Copy of this level holding copies of its orders in orderSlab, used by a forked order book before it changes a shared level 
+		copiedLevel = PriceLevel( self.price, self.tick, orderSlab )
+		for currentOrder in self: 
+			copiedLevel.appendOrder( currentOrder.copy() )
+		return copiedLevel 
+
+	def popFrontOrder(self):
+		if self.headSlot == order_slab.OrderSlab.EMPTY_SLOT: 
+			return None 
+		return self.removeOrder( self.orderSlab.orderIds[ self.headSlot ] )
+
+class PriceLevelIndex():
+
+	"""
+	This class keeps the price levels of one side of the order book in a heap so the best price never has to be searched 
+	for.  Prices are stored so that the best price is always the smallest element of the heap ( bids are stored negated ), 
+	adding a level is a heap push and finding the best price a constant time lookup.  A removed level that is not the best 
+	one is only marked stale and stays in the heap until it reaches the top, so removing any level is O(log n) instead of a 
+	list shift.  The heap is rebuilt from the live prices once the stale entries outnumber them. 
+	"""
+
+	def __init__(self, highestIsBest):
+		self.sign = -1 if highestIsBest else 1 
+		self.keys = [] # Heap of sign * price, best price is keys[0] 
+		self.prices = set() # Live prices 
+		self.stalePrices = set() # Removed prices that are still in keys 
+
+	def __len__(self):
+		return len( self.prices )
+
+	def addPriceLevel(self, price):
+		self.prices.add( price )
+		if price in self.stalePrices: # Still in the heap from before it was removed 
+			self.stalePrices.discard( price )
+		else: 
+			heapq.heappush( self.keys, self.sign * price )
+
+	def removePriceLevel(self, price):
+		if price not in self.prices: 
+			return 
+		self.prices.discard( price )
+		self.stalePrices.add( price )
+		while self.keys and self.sign * self.keys[0] in self.stalePrices: # Keep the best price live 
+			self.stalePrices.discard( self.sign * heapq.heappop( self.keys ) )
+		if len( self.stalePrices ) > len( self.prices ) + 64: 
+			self.keys = [ self.sign * livePrice for livePrice in self.prices ]
+			heapq.heapify( self.keys )
+			self.stalePrices = set() 
+
+	def getBestPrice(self):
+		if not self.keys: 
+			return None 
+		return self.sign * self.keys[0]
+
+	def getPricesBetterThan(self, price):
+		# Prices strictly better than price, best first.  Only the heap entries better than price and their children are visited 
+		limitKey = self.sign * price 
+		keys = [] 
+		positions = [ 0 ] 
+		while positions: 
+			position = positions.pop()
+			if position < len( self.keys ) and self.keys[ position ] < limitKey: 
+				if self.sign * self.keys[ position ] not in self.stalePrices: 
+					keys.append( self.keys[ position ] )
+				positions.append( 2 * position + 1 )
+				positions.append( 2 * position + 2 )
+		keys.sort()
+		return [ self.sign * key for key in keys ]
+
+	def fork(self):
+		forkedIndex = copy.copy( self )
+		forkedIndex.keys = list ( self.keys )
+		forkedIndex.prices = set ( self.prices )
+		forkedIndex.stalePrices = set ( self.stalePrices )
+		return forkedIndex 
+
+	def clear(self):
+		self.keys = [] 
+		self.prices = set() 
+		self.stalePrices = set() 
+
+class SparsePriceLevels():
+
+	"""
+	This class holds the price levels of one side of the order book keyed by integer price tick.  Levels are stored in a dict 
+	and the PriceLevelIndex keeps the ticks in a heap so the best tick is always known. 
+	"""
+
+	def __init__(self, highestIsBest):
+		self.levels = {} # tick -> PriceLevel 
+		self.priceIndex = PriceLevelIndex( highestIsBest ) 
+
+	def __len__(self):
+		return len( self.levels )
+
+	def __contains__(self, tick):
+		return tick in self.levels 
+
+	def __getitem__(self, tick):
+		return self.levels[ tick ]
+
+	def get(self, tick):
+		return self.levels.get( tick )
+
+	def iteritems(self):
+		return self.levels.iteritems()
+
+	def items(self):
+		return self.levels.items()
+
+	def addPriceLevel(self, tick, priceLevel):
+		self.levels[ tick ] = priceLevel 
+		self.priceIndex.addPriceLevel( tick )
+
+	def removePriceLevel(self, tick):
+		del self.levels[ tick ] 
+		self.priceIndex.removePriceLevel( tick )
+
+	def getBestTick(self):
+		return self.priceIndex.getBestPrice()
+
+	def replacePriceLevel(self, tick, priceLevel):
+		self.levels[ tick ] = priceLevel 
+
+	def fork(self):
+		# Copies the dict and index, the price levels themselves are shared 
+		forkedLevels = copy.copy( self )
+		forkedLevels.levels = dict ( self.levels )
+		forkedLevels.priceIndex = self.priceIndex.fork()
+		return forkedLevels 
+
+	def getTicksBetterThan(self, limitTick):
+		# Ticks of the levels strictly better than limitTick, best first 
+		return self.priceIndex.getPricesBetterThan( limitTick )
+
+	def clear(self):
+		self.levels = {} 
+		self.priceIndex.clear()
+
+class DensePriceLevels():
+
+	"""
+	This class holds the price levels of one side of the order book with the levels inside a band of ticks around a center 
+	price stored in a preallocated list indexed by tick offset.  Looking up a level in the band is a list index and finding 
+	the next best level after the best one is depleted is a scan of the list from that position.  Levels outside of the band 
+	are kept in a SparsePriceLevels so orders far from the market are still accepted.  The band can be moved with setCenterTick 
+	when the market drifts. 
+	"""
+
+	def __init__(self, highestIsBest, bandTicks):
+		self.sign = 1 if highestIsBest else -1 
+		self.bandTicks = bandTicks 
+		self.size = 2 * bandTicks + 1 
+		self.baseTick = None # Tick of levels[0], set by setCenterTick 
+		self.levels = [ None ] * self.size 
+		self.levelCount = 0 # Number of levels inside the band 
+		self.bestTick = None 
+		self.bestTickStale = False # Best level was removed, bestTick is a bound that no level is better than 
+		self.outOfBandLevels = SparsePriceLevels( highestIsBest )
+
+	def __len__(self):
+		return self.levelCount + len( self.outOfBandLevels )
+
+	def __contains__(self, tick):
+		return self.get( tick ) is not None 
+
+	def __getitem__(self, tick):
+		priceLevel = self.get( tick )
+		if priceLevel is None: 
+			raise KeyError( tick )
+		return priceLevel 
+
+	def isInBand(self, tick):
+		return self.baseTick is not None and 0 <= tick - self.baseTick < self.size 
+
+	def get(self, tick):
+		if self.isInBand( tick ): 
+			return self.levels[ tick - self.baseTick ]
+		return self.outOfBandLevels.get( tick )
+
+	def iteritems(self):
+		if self.levelCount > 0: 
+			for position, priceLevel in enumerate( self.levels ): 
+				if priceLevel is not None: 
+					yield ( self.baseTick + position, priceLevel )
+		for tick, priceLevel in self.outOfBandLevels.iteritems(): 
+			yield ( tick, priceLevel )
+
+	def items(self):
+		return list( self.iteritems() )
+
+	def setCenterTick(self, centerTick):
+		# Moves the band, levels are re-inserted so they end up in the list or the out of band levels as appropriate 
+		existingLevels = self.items()
+		self.clear()
+		self.baseTick = centerTick - self.bandTicks 
+		for tick, priceLevel in existingLevels: 
+			self.addPriceLevel( tick, priceLevel )
+
+	def addPriceLevel(self, tick, priceLevel):
+		if self.baseTick is None: 
+			self.setCenterTick( tick )
+
+		if self.isInBand( tick ): 
+			self.levels[ tick - self.baseTick ] = priceLevel 
+			self.levelCount += 1 
+		else: 
+			self.outOfBandLevels.addPriceLevel( tick, priceLevel )
+
+		if self.bestTick is None or self.sign * tick >= self.sign * self.bestTick: 
+			self.bestTick = tick 
+			self.bestTickStale = False 
+
+	def removePriceLevel(self, tick):
+		if self.isInBand( tick ): 
+			self.levels[ tick - self.baseTick ] = None 
+			self.levelCount -= 1 
+		else: 
+			self.outOfBandLevels.removePriceLevel( tick )
+
+		if tick == self.bestTick: # The next best level is only searched for when it is asked for 
+			self.bestTickStale = True 
+
+	def replacePriceLevel(self, tick, priceLevel):
+		if self.isInBand( tick ): 
+			self.levels[ tick - self.baseTick ] = priceLevel 
+		else: 
+			self.outOfBandLevels.replacePriceLevel( tick, priceLevel )
+
+	def fork(self):
+		# Copies the band list and out of band levels, the price levels themselves are shared 
+		forkedLevels = copy.copy( self )
+		forkedLevels.levels = list ( self.levels )
+		forkedLevels.outOfBandLevels = self.outOfBandLevels.fork()
+		return forkedLevels 
+
+	def findBestTick(self, removedBestTick):
+		# Every level better than removedBestTick is empty, so the band is only scanned from that point towards worse prices 
+		bestTick = self.outOfBandLevels.getBestTick()
+		if self.levelCount > 0: 
+			step = -self.sign 
+			if self.isInBand( removedBestTick ): 
+				position = removedBestTick - self.baseTick 
+			else: 
+				position = self.size - 1 if self.sign == 1 else 0 
+			while self.levels[ position ] is None: 
+				position += step 
+			denseBestTick = self.baseTick + position 
+			if bestTick is None or self.sign * denseBestTick > self.sign * bestTick: 
+				bestTick = denseBestTick 
+		return bestTick 
+
+	def getBestTick(self):
+		if self.bestTickStale: 
+			self.bestTick = self.findBestTick( self.bestTick )
+			self.bestTickStale = False 
+		return self.bestTick 
+
+	def getTicksBetterThan(self, limitTick):
+		# Ticks of the levels strictly better than limitTick, best first.  The band is scanned from the best tick to limitTick 
+		ticks = self.outOfBandLevels.getTicksBetterThan( limitTick )
+		bestTick = self.getBestTick()
+		if self.levelCount == 0 or bestTick is None or self.sign * bestTick <= self.sign * limitTick: 
+			return ticks 
+
+		step = -self.sign 
+		if self.sign == 1: 
+			position = min ( bestTick - self.baseTick, self.size - 1 )
+			endPosition = max ( limitTick - self.baseTick, -1 )
+		else: 
+			position = max ( bestTick - self.baseTick, 0 )
+			endPosition = min ( limitTick - self.baseTick, self.size )
+		denseTicks = [ self.baseTick + p for p in xrange ( position, endPosition, step ) if self.levels[ p ] is not None ]
+		if not ticks: 
+			return denseTicks 
+		return sorted ( ticks + denseTicks, key = lambda tick: -self.sign * tick ) 
+
+	def clear(self):
+		self.levels = [ None ] * self.size 
+		self.levelCount = 0 
+		self.bestTick = None 
+		self.bestTickStale = False 
+		self.outOfBandLevels.clear()
+
 class OrderBook():
 
 	"""
 	This class organizes all of the orders current submited to the market that have not be filled.  The order book contains 
 	the orders via price lookup and organizes a queue of orders at an individual price levels to be filled.  It currently contains 
 	the logic to add limit orders to both the bid and ask side of the market along with removing orders during market order fills or cancelations.
+	Prices are stored internally as integer ticks of tickSize.  If denseBandTicks is given the price levels within that many ticks 
+	of the center price are kept in preallocated lists ( see DensePriceLevels ). 
 	"""
 
-	def __init__(self, symbol):
+	FORK_SLAB_CAPACITY = 64 # Initial slab capacity after a fork, most forks only change a few levels 
+	MAX_SHARED_ORDER_SLABS = 8 # Forking a book with this many shared slabs first compacts its orders into one slab 
+
+	def __init__(self, symbol, tickSize = .01, denseBandTicks = None):
 		self.symbol = symbol 
-		self.bidOrderBook = {} # Price Level -> dict[orderId] current bid orders for that price level
-		self.askOrderBook = {} # Price Level -> dict[orderId] current ask orders for that price level
+		self.tickSize = tickSize 
+		self.priceDecimals = 0 # Number of decimals used to convert a tick back to a price without float noise 
+		while self.priceDecimals < 12 and abs ( round ( tickSize * 10 ** self.priceDecimals ) - tickSize * 10 ** self.priceDecimals ) > 1e-9: 
+			self.priceDecimals += 1 
+		self.denseBandTicks = denseBandTicks 
+		self.bidOrderBook = self.createPriceLevels( highestIsBest = True ) # Price tick -> PriceLevel queue of current bid orders for that price level
+		self.askOrderBook = self.createPriceLevels( highestIsBest = False ) # Price tick -> PriceLevel queue of current ask orders for that price level
+		self.bidOrderBookShared = False # The level containers are shared with a forked book until this book changes that side 
+		self.askOrderBookShared = False 
+		self.bidDepthIndex = depth_index.DepthIndex( tickSize, highestIsBest = True ) # Cumulative bid quantity by price tick, None until queried in a forked book 
+		self.askDepthIndex = depth_index.DepthIndex( tickSize, highestIsBest = False ) # Cumulative ask quantity by price tick 
+		self.orderSlab = order_slab.OrderSlab() # Every resting order of both sides indexed by orderId 
+		self.sharedOrderSlabs = [] # Read only slabs of the price levels shared with forked order books, newest first 
+		self.changedBidTicks = set() # Ticks of the levels changed since the last takeChangedLevels, see Exchange.publishBookDeltas 
+		self.changedAskTicks = set() 
+		self.highestBidTick = None 
+		self.lowestAskTick = None 
 		self.highestBidPrc = None # Keeps track of the top of the book for bids
 		self.lowestAskPrc = None # Keeps track of the top of the book for asks 
 		self.logger = logging.getLogger('MyLogger')		
 
+	def createPriceLevels(self, highestIsBest):
+		if self.denseBandTicks: 
+			return DensePriceLevels( highestIsBest, self.denseBandTicks )
+		return SparsePriceLevels( highestIsBest )
+
+	def priceToTick(self, price):
+		return int ( round ( price / self.tickSize ) )
+
+	def tickToPrice(self, tick):
+		if tick is None: 
+			return None 
+		return round ( tick * self.tickSize, self.priceDecimals )
+
+	def isValidTickPrice(self, price):
+		return abs ( price / self.tickSize - round ( price / self.tickSize ) ) < 1e-6 
+
+	def setDenseBandCenter(self, price):
+		# Moves the dense price level band of both sides to be centered on price, has no effect if the book is not in dense mode
+		if self.denseBandTicks: 
+			self.logger.info( "Centering dense order book band on price:[%s]" % ( price ) )
+			self.getWritablePriceLevels( self.bidOrderBook ).setCenterTick( self.priceToTick( price ) )
+			self.getWritablePriceLevels( self.askOrderBook ).setCenterTick( self.priceToTick( price ) )
+
+	def fork(self):
+		# Logical copy of the book that changes independently of this one.  The existing price levels and orders become read 
+		# only and are shared by both books, each book gets a new slab and copies a shared level into it the first time it 
+		# changes that level.  The level containers of each side are shared the same way and copied the first time a book 
+		# changes that side, the forked book rebuilds its depth indexes from its levels when they are first queried.  Once a 
+		# book has MAX_SHARED_ORDER_SLABS shared slabs its next fork first compacts its orders into one slab 
+		self.logger.info( "Forking order book symbol:[%s] orders:[%s]" % ( self.symbol, len ( self.orderSlab ) ) )
+
+		if len ( self.sharedOrderSlabs ) >= OrderBook.MAX_SHARED_ORDER_SLABS: 
+			self.compactOrderSlabs()
+		if len ( self.orderSlab ) > 0: 
+			self.sharedOrderSlabs = [ self.orderSlab ] + self.sharedOrderSlabs 
+			self.orderSlab = order_slab.OrderSlab( OrderBook.FORK_SLAB_CAPACITY )
+		self.bidOrderBookShared = True 
+		self.askOrderBookShared = True 
+		forkedOrderBook = copy.copy( self )
+		forkedOrderBook.sharedOrderSlabs = list ( self.sharedOrderSlabs )
+		forkedOrderBook.orderSlab = order_slab.OrderSlab( OrderBook.FORK_SLAB_CAPACITY )
+		forkedOrderBook.bidDepthIndex = None 
+		forkedOrderBook.askDepthIndex = None 
+		forkedOrderBook.changedBidTicks = set ( self.changedBidTicks )
+		forkedOrderBook.changedAskTicks = set ( self.changedAskTicks )
+		return forkedOrderBook 
+
+	def compactOrderSlabs(self):
+		# Copies every level into one new slab so order lookups no longer walk the chain of shared slabs 
+		self.logger.info( "Compacting order slabs symbol:[%s] sharedOrderSlabs:[%s]" % ( self.symbol, len ( self.sharedOrderSlabs ) ) )
+		compactedOrderSlab = order_slab.OrderSlab( OrderBook.FORK_SLAB_CAPACITY )
+		for priceLevels in ( self.getWritablePriceLevels( self.bidOrderBook ), self.getWritablePriceLevels( self.askOrderBook ) ): 
+			for tick, priceLevel in priceLevels.items(): 
+				priceLevels.replacePriceLevel( tick, priceLevel.copyTo( compactedOrderSlab ) )
+		self.orderSlab = compactedOrderSlab 
+		self.sharedOrderSlabs = [] 
+
+	def getWritablePriceLevels(self, priceLevels):
+		# Level container of priceLevels' side that this book can change, a container shared with a forked book is copied first 
+		if priceLevels is self.bidOrderBook and self.bidOrderBookShared: 
+			self.bidOrderBook = priceLevels = priceLevels.fork()
+			self.bidOrderBookShared = False 
+		elif priceLevels is self.askOrderBook and self.askOrderBookShared: 
+			self.askOrderBook = priceLevels = priceLevels.fork()
+			self.askOrderBookShared = False 
+		return priceLevels 
+
+	def getWritablePriceLevel(self, priceLevels, tick):
+		# Price level at tick that this book can change, a level shared with a forked book is copied into this book's slab first 
+		priceLevels = self.getWritablePriceLevels( priceLevels )
+		priceLevel = priceLevels.get( tick )
+		if priceLevel is not None and priceLevel.orderSlab is not self.orderSlab: 
+			priceLevel = priceLevel.copyTo( self.orderSlab )
+			priceLevels.replacePriceLevel( tick, priceLevel )
+		return priceLevel 
+
+	def getBidDepthIndex(self):
+		# Built from the price levels the first time it is queried after a fork 
+		if self.bidDepthIndex is None: 
+			self.bidDepthIndex = depth_index.DepthIndex( self.tickSize, highestIsBest = True )
+			for tick, priceLevel in self.bidOrderBook.iteritems(): 
+				self.bidDepthIndex.addQty( priceLevel.price, priceLevel.getTotalQty() )
+		return self.bidDepthIndex 
+
+	def getAskDepthIndex(self):
+		if self.askDepthIndex is None: 
+			self.askDepthIndex = depth_index.DepthIndex( self.tickSize, highestIsBest = False )
+			for tick, priceLevel in self.askOrderBook.iteritems(): 
+				self.askDepthIndex.addQty( priceLevel.price, priceLevel.getTotalQty() )
+		return self.askDepthIndex 
+
+	def findOrderSlab(self, orderId):
+		# Slab holding the live order orderId for this book or None.  An order in a shared slab is only live for this book 
+		# while its price level is still shared, once the level is copied the live order is in this book's slab 
+		if orderId in self.orderSlab: 
+			return self.orderSlab 
+		for sharedOrderSlab in self.sharedOrderSlabs: 
+			slot = sharedOrderSlab.getSlot( orderId )
+			if slot != order_slab.OrderSlab.EMPTY_SLOT: 
+				priceLevels = self.bidOrderBook if sharedOrderSlab.sides[ slot ] == trade.TradeActions.Buy else self.askOrderBook 
+				priceLevel = priceLevels.get( sharedOrderSlab.priceTicks[ slot ] )
+				if priceLevel is not None and priceLevel.orderSlab is sharedOrderSlab: 
+					return sharedOrderSlab 
+				return None 
+		return None 
+
+	def getOrderIdsForAccount(self, accountId):
+		if not self.sharedOrderSlabs: 
+			return self.orderSlab.getOrderIdsForAccount( accountId )
+		orderIds = set ( self.orderSlab.getOrderIdsForAccount( accountId ) )
+		for sharedOrderSlab in self.sharedOrderSlabs: 
+			orderIds.update( orderId for orderId in sharedOrderSlab.getOrderIdsForAccount( accountId ) if self.findOrderSlab( orderId ) is sharedOrderSlab )
+		return orderIds 
+
+	def getOpenOrderInfo(self, orderId):
+		# Returns ( tradeAction, price, accountId ) for an order resting in the book or None 
+		orderSlab = self.findOrderSlab( orderId )
+		if orderSlab is None: 
+			return None 
+		slot = orderSlab.getSlot( orderId )
+		return ( orderSlab.sides[ slot ], self.tickToPrice( orderSlab.priceTicks[ slot ] ), orderSlab.accountIds[ slot ] )
+
+	def getBidPriceLevel(self, price):
+		return self.bidOrderBook.get( self.priceToTick( price ) )
+
+	def getAskPriceLevel(self, price):
+		return self.askOrderBook.get( self.priceToTick( price ) )
+
 	def createCondencedOrderBook(self):
 		
 		self.logger.info('Creating Condenced Order Book') 
 	
 		condencedBidOrderBook = {}	
-		for bidPrice, orderDict in sorted( self.bidOrderBook.items() ):
-			bidsz = sum ( map (  lambda x: x.getQty(), self.bidOrderBook[ bidPrice ].values() ) )  
-			q = quote.Quote ( self.symbol, bidPrice, None, bidsz, None )
-			condencedBidOrderBook [ bidPrice ] = q 
+		for bidTick, priceLevel in self.bidOrderBook.iteritems():
+			q = quote.Quote ( self.symbol, priceLevel.price, None, priceLevel.getTotalQty(), None )
+			condencedBidOrderBook [ priceLevel.price ] = q 
 		
 		condencedAskOrderBook = {}	
-		for askPrice, orderDict in sorted( self.askOrderBook.items() ):
-			asksz = sum ( map (  lambda x: x.getQty(), self.askOrderBook[ askPrice ].values() ) )  
-			q = quote.Quote (self.symbol, None, askPrice, None, asksz )
-			condencedAskOrderBook [ askPrice ] = q 
+		for askTick, priceLevel in self.askOrderBook.iteritems():
+			q = quote.Quote (self.symbol, None, priceLevel.price, None, priceLevel.getTotalQty() )
+			condencedAskOrderBook [ priceLevel.price ] = q 
 		
-		return CondencedOrderBook( self.symbol, condencedBidOrderBook, condencedAskOrderBook )
+		return CondencedOrderBook( self.symbol, condencedBidOrderBook, condencedAskOrderBook, self.highestBidPrc, self.lowestAskPrc, self.tickSize )
+
+	def getLevels(self):
+		# ( side, price, total qty ) of every level, bids highest first then asks lowest first 
+		levels = [ ( trade.TradeActions.Buy, priceLevel.price, priceLevel.getTotalQty() ) for tick, priceLevel in sorted ( self.bidOrderBook.items(), reverse = True ) ]
+		levels += [ ( trade.TradeActions.Sell, priceLevel.price, priceLevel.getTotalQty() ) for tick, priceLevel in sorted ( self.askOrderBook.items() ) ]
+		return levels 
+
+	def takeChangedLevels(self):
+		# ( side, price, total qty ) of the levels changed since the last call in the order of getLevels, a removed level has 
+		# qty 0.  The cost is proportional to the number of changed levels 
+		levels = [] 
+		for side, priceLevels, changedTicks, reverse in ( ( trade.TradeActions.Buy, self.bidOrderBook, self.changedBidTicks, True ), ( trade.TradeActions.Sell, self.askOrderBook, self.changedAskTicks, False ) ): 
+			for tick in sorted ( changedTicks, reverse = reverse ): 
+				priceLevel = priceLevels.get( tick )
+				levels.append( ( side, self.tickToPrice( tick ), 0 if priceLevel is None else priceLevel.getTotalQty() ) )
+			changedTicks.clear()
+		return levels 
+
+	def clearChangedLevels(self):
+		self.changedBidTicks.clear()
+		self.changedAskTicks.clear()
 	
 	def __str__ ( self ):
 
 		returnStr = " ------------------- Printing Order Book for symbol:[%s] ------------------- \n" % ( self.symbol )  
 
 		returnStr += " ----- BIDS ------ \n" 
-		for price, orderDict in sorted( self.bidOrderBook.items() ):
+		for tick, priceLevel in sorted( self.bidOrderBook.items() ):
 
-			if not orderDict :
-				returnStr+= " Empty Order Dict for price:[%s] \n" % ( price )
+			if not priceLevel :
+				returnStr+= " Empty Price Level for price:[%s] \n" % ( priceLevel.price )
 
-			for orderId, order in sorted( orderDict.items() ): 
-				returnStr+= " price:[%s] orderId:[%s] tradeAction:[%s] orderQty:[%s] \n" % ( price, orderId, order.tradeAction, order.qty ) 
+			for order in priceLevel: # Iterates in time priority 
+				returnStr+= " price:[%s] orderId:[%s] tradeAction:[%s] orderQty:[%s] \n" % ( priceLevel.price, order.orderId, order.tradeAction, order.qty ) 
 		
 		returnStr += " ----- ASKS ------ \n" 
-		for price, orderDict in sorted( self.askOrderBook.items() ):
+		for tick, priceLevel in sorted( self.askOrderBook.items() ):
 
-			if not orderDict :
-				returnStr+= " Empty Order Dict for price:[%s] \n" % ( price )
+			if not priceLevel :
+				returnStr+= " Empty Price Level for price:[%s] \n" % ( priceLevel.price )
 
-			for orderId, order in sorted( orderDict.items() ): 
-				returnStr+= " price:[%s] orderId:[%s] tradeAction:[%s] orderQty:[%s] \n" % ( price, orderId, order.tradeAction, order.qty ) 
+			for order in priceLevel: # Iterates in time priority 
+				returnStr+= " price:[%s] orderId:[%s] tradeAction:[%s] orderQty:[%s] \n" % ( priceLevel.price, order.orderId, order.tradeAction, order.qty ) 
 
 		return returnStr 
 		
@@ -105,38 +703,115 @@ class OrderBook():
 		bidsz = 0 
 		asksz = 0 
 
-		if self.highestBidPrc is not None :  
-			bidsz = sum ( map (  lambda x: x.getQty(), self.bidOrderBook[ self.highestBidPrc ].values() ) )  
+		if self.highestBidTick is not None :  
+			bidsz = self.bidOrderBook[ self.highestBidTick ].getTotalQty()
 		
-		if self.lowestAskPrc is not None :  
-			asksz = sum ( map (  lambda x: x.getQty(), self.askOrderBook[ self.lowestAskPrc].values() ) )  
+		if self.lowestAskTick is not None :  
+			asksz = self.askOrderBook[ self.lowestAskTick ].getTotalQty()
 
 		return quote.Quote (self.symbol, self.highestBidPrc, self.lowestAskPrc, bidsz, asksz)
 	
-	def removeOrderFromOrderBook( self, tradeAction, priceLevel, orderId ):
+	def reduceOrderQty( self, currentOrder, qty ):
+		# Partial fill of an order resting in the book, keeps the price level total quantity in sync with the order 
+		if currentOrder.getTradeAction() == trade.TradeActions.Buy: 
+			priceLevel = self.getWritablePriceLevel( self.bidOrderBook, self.priceToTick( currentOrder.getPrice() ) )
+			priceLevel.reduceOrderQty( currentOrder, qty )
+			if self.bidDepthIndex is not None: 
+				self.bidDepthIndex.addQty( priceLevel.price, -qty )
+			self.changedBidTicks.add( priceLevel.tick )
+		elif currentOrder.getTradeAction() == trade.TradeActions.Sell: 
+			priceLevel = self.getWritablePriceLevel( self.askOrderBook, self.priceToTick( currentOrder.getPrice() ) )
+			priceLevel.reduceOrderQty( currentOrder, qty )
+			if self.askDepthIndex is not None: 
+				self.askDepthIndex.addQty( priceLevel.price, -qty )
+			self.changedAskTicks.add( priceLevel.tick )
+	
+	def removeOrderFromOrderBook( self, tradeAction, priceLevel, orderId, updateTopOfBook = True ):
 		if tradeAction == trade.TradeActions.Buy: 
-			self.removeBuyOrderFromOrderBook( priceLevel, orderId )
+			self.removeBuyOrderFromOrderBook( priceLevel, orderId, updateTopOfBook )
 		elif tradeAction == trade.TradeActions.Sell: 
-			self.removeSellOrderFromOrderBook( priceLevel, orderId )
+			self.removeSellOrderFromOrderBook( priceLevel, orderId, updateTopOfBook )
+	
+	def updateTopOfBook( self ):
+		# Used after removing a batch of orders with updateTopOfBook = False 
+		self.highestBidTick = self.bidOrderBook.getBestTick()
+		self.highestBidPrc = self.tickToPrice( self.highestBidTick )
+		self.lowestAskTick = self.askOrderBook.getBestTick()
+		self.lowestAskPrc = self.tickToPrice( self.lowestAskTick )
+		self.logger.info( "resetting top of book self.highestBidPrc:[%s] self.lowestAskPrc:[%s]" % ( self.highestBidPrc, self.lowestAskPrc ) ) 
 	
-	def removeBuyOrderFromOrderBook( self, priceLevel, orderId ):
+	def removeBuyOrderFromOrderBook( self, priceLevel, orderId, updateTopOfBook = True ):
 		self.logger.info( "removing buy order priceLevel:[%s], orderId:[%s]" % ( priceLevel, orderId ) )
 
-		del self.bidOrderBook[ priceLevel ][ orderId ] 
-		if not self.bidOrderBook[ priceLevel ]: # Check for empty dict and delete empty dict 
-			del self.bidOrderBook[ priceLevel ] # delete none existent price level 
-			self.highestBidPrc = self.getNewHighestBidPrice()
+		tick = self.priceToTick( priceLevel )
+		bidPriceLevel = self.getWritablePriceLevel( self.bidOrderBook, tick )
+		removedOrder = bidPriceLevel.removeOrder( orderId ) 
+		if self.bidDepthIndex is not None: 
+			self.bidDepthIndex.addQty( bidPriceLevel.price, -removedOrder.getQty() )
+		self.changedBidTicks.add( tick )
+		if not bidPriceLevel: # Check for empty price level and delete it 
+			self.bidOrderBook.removePriceLevel( tick ) # delete none existent price level 
+			if not updateTopOfBook: 
+				return 
+			self.highestBidTick = self.bidOrderBook.getBestTick()
+			self.highestBidPrc = self.tickToPrice( self.highestBidTick )
 			self.logger.info( "resetting highest bid price self.highestBidPrc:[%s]" % ( self.highestBidPrc ) ) 
 	
-	def removeSellOrderFromOrderBook( self, priceLevel, orderId ):
+	def removeSellOrderFromOrderBook( self, priceLevel, orderId, updateTopOfBook = True ):
 		self.logger.info( "removing sell order priceLevel:[%s], orderId:[%s]" % ( priceLevel, orderId ) )
 
-		del self.askOrderBook[ priceLevel ][ orderId ] 
-		if not self.askOrderBook[ priceLevel ]: # Check for empty dict and delete empty dict 
-			del self.askOrderBook[ priceLevel ] # delete none existent price level 
-			self.lowestAskPrc = self.getNewLowestAskPrice()
+		tick = self.priceToTick( priceLevel )
+		askPriceLevel = self.getWritablePriceLevel( self.askOrderBook, tick )
+		removedOrder = askPriceLevel.removeOrder( orderId ) 
+		if self.askDepthIndex is not None: 
+			self.askDepthIndex.addQty( askPriceLevel.price, -removedOrder.getQty() )
+		self.changedAskTicks.add( tick )
+		if not askPriceLevel: # Check for empty price level and delete it 
+			self.askOrderBook.removePriceLevel( tick ) # delete none existent price level 
+			if not updateTopOfBook: 
+				return 
+			self.lowestAskTick = self.askOrderBook.getBestTick()
+			self.lowestAskPrc = self.tickToPrice( self.lowestAskTick )
 			self.logger.info( "resetting lowest ask price self.lowestAskPrc:[%s]" % ( self.lowestAskPrc ) ) 
 	
+	def removeBidPriceLevel( self, tick, updateTopOfBook = True ):
+		# Removes a whole bid price level in one step ( e.g. when it is fully consumed by a sweep ) and returns its orders 
+		bidPriceLevel = self.bidOrderBook[ tick ]
+		self.logger.info( "removing bid price level price:[%s] orderCount:[%s]" % ( bidPriceLevel.price, bidPriceLevel.getOrderCount() ) )
+
+		if self.bidDepthIndex is not None: 
+			self.bidDepthIndex.addQty( bidPriceLevel.price, -bidPriceLevel.getTotalQty() )
+		self.getWritablePriceLevels( self.bidOrderBook ).removePriceLevel( tick )
+		self.changedBidTicks.add( tick )
+		if updateTopOfBook: 
+			self.highestBidTick = self.bidOrderBook.getBestTick()
+			self.highestBidPrc = self.tickToPrice( self.highestBidTick )
+		if bidPriceLevel.orderSlab is not self.orderSlab: # Shared with a forked book, its orders are left untouched 
+			return [ currentOrder.copy() for currentOrder in bidPriceLevel ]
+		return bidPriceLevel.removeAllOrders()
+
+	def removeAskPriceLevel( self, tick, updateTopOfBook = True ):
+		# Removes a whole ask price level in one step ( e.g. when it is fully consumed by a sweep ) and returns its orders 
+		askPriceLevel = self.askOrderBook[ tick ]
+		self.logger.info( "removing ask price level price:[%s] orderCount:[%s]" % ( askPriceLevel.price, askPriceLevel.getOrderCount() ) )
+
+		if self.askDepthIndex is not None: 
+			self.askDepthIndex.addQty( askPriceLevel.price, -askPriceLevel.getTotalQty() )
+		self.getWritablePriceLevels( self.askOrderBook ).removePriceLevel( tick )
+		self.changedAskTicks.add( tick )
+		if updateTopOfBook: 
+			self.lowestAskTick = self.askOrderBook.getBestTick()
+			self.lowestAskPrc = self.tickToPrice( self.lowestAskTick )
+		if askPriceLevel.orderSlab is not self.orderSlab: 
+			return [ currentOrder.copy() for currentOrder in askPriceLevel ]
+		return askPriceLevel.removeAllOrders()
+
+	def removeBestBidPriceLevel( self ):
+		return self.removeBidPriceLevel( self.highestBidTick )
+
+	def removeBestAskPriceLevel( self ):
+		return self.removeAskPriceLevel( self.lowestAskTick )
+
 	def appendOrderToOrderBook( self, currentOrder ):
 		if currentOrder.getTradeAction() == trade.TradeActions.Buy: 
 			self.appendBuyOfferToOrderBook( currentOrder )
@@ -144,29 +819,47 @@ class OrderBook():
 			self.appendSellOfferToOrderBook( currentOrder )
 	
 	def appendBuyOfferToOrderBook( self, currentOrder ):
-		if currentOrder.getPrice() not in self.bidOrderBook : # If price doesnt already exist in bidOrderBook
-			self.bidOrderBook[ currentOrder.getPrice() ] = {} 
+		tick = self.priceToTick( currentOrder.getPrice() )
+		bidPriceLevel = self.getWritablePriceLevel( self.bidOrderBook, tick )
+		if bidPriceLevel is None : # If price doesnt already exist in bidOrderBook
+			if self.denseBandTicks and self.bidOrderBook.baseTick is None: # First order centers the dense band for both sides 
+				self.setDenseBandCenter( currentOrder.getPrice() )
+			bidPriceLevel = PriceLevel( self.tickToPrice( tick ), tick, self.orderSlab ) 
+			self.bidOrderBook.addPriceLevel( tick, bidPriceLevel )
 
-		self.bidOrderBook[ currentOrder.getPrice() ] [ currentOrder.getOrderId() ] = currentOrder 
+		bidPriceLevel.appendOrder( currentOrder ) 
+		if self.bidDepthIndex is not None: 
+			self.bidDepthIndex.addQty( bidPriceLevel.price, currentOrder.getQty() )
+		self.changedBidTicks.add( tick )
 	
-		if self.highestBidPrc < currentOrder.getPrice() or self.highestBidPrc is None: # Updates Top price of the Quote Book
-			self.highestBidPrc = currentOrder.getPrice()
+		if self.highestBidTick < tick or self.highestBidTick is None: # Updates Top price of the Quote Book
+			self.highestBidTick = tick 
+			self.highestBidPrc = bidPriceLevel.price 
 
 		return
 	
 	def appendSellOfferToOrderBook( self, currentOrder ):
-		if currentOrder.getPrice() not in self.askOrderBook : # If price doesnt already exist in bidOrderBook
-			self.askOrderBook[ currentOrder.getPrice() ] = {} 
+		tick = self.priceToTick( currentOrder.getPrice() )
+		askPriceLevel = self.getWritablePriceLevel( self.askOrderBook, tick )
+		if askPriceLevel is None : # If price doesnt already exist in askOrderBook
+			if self.denseBandTicks and self.askOrderBook.baseTick is None: # First order centers the dense band for both sides 
+				self.setDenseBandCenter( currentOrder.getPrice() )
+			askPriceLevel = PriceLevel( self.tickToPrice( tick ), tick, self.orderSlab ) 
+			self.askOrderBook.addPriceLevel( tick, askPriceLevel )
 
-		self.askOrderBook[ currentOrder.getPrice() ] [ currentOrder.getOrderId() ] = currentOrder 
+		askPriceLevel.appendOrder( currentOrder ) 
+		if self.askDepthIndex is not None: 
+			self.askDepthIndex.addQty( askPriceLevel.price, currentOrder.getQty() )
+		self.changedAskTicks.add( tick )
 		
-		if self.lowestAskPrc > currentOrder.getPrice() or self.lowestAskPrc is None: # Updates Top price of the Quote Book
-			self.lowestAskPrc = currentOrder.getPrice()
+		if self.lowestAskTick > tick or self.lowestAskTick is None: # Updates Top price of the Quote Book
+			self.lowestAskTick = tick 
+			self.lowestAskPrc = askPriceLevel.price 
 		
 		return
 
 	def visitBidOrders(self, funcToProcess, data ):
-		for orderId, bidOrderInBook in sorted( self.bidOrderBook[ self.highestBidPrc ].iteritems() ): # Sorted by OrderID for price book position 
+		for bidOrderInBook in self.getWritablePriceLevel( self.bidOrderBook, self.highestBidTick ): # Price level queue is already in time priority 
 			self.logger.info( 'visiting order book bid order for bidOrderInBook:[%s]' % ( bidOrderInBook ) )
 			continueIteration = funcToProcess ( bidOrderInBook, data )
 			if continueIteration == False:
@@ -177,7 +870,7 @@ class OrderBook():
 		return
 	
 	def visitAskOrders(self, funcToProcess, data ):
-		for orderId, askOrderInBook in sorted( self.askOrderBook[self.lowestAskPrc].iteritems() ): # Sorted by OrderID for price book position 
+		for askOrderInBook in self.getWritablePriceLevel( self.askOrderBook, self.lowestAskTick ): # Price level queue is already in time priority 
 			self.logger.info( 'visiting order book ask order for askOrderInBook:[%s]' % ( askOrderInBook ) )
 			continueIteration = funcToProcess ( askOrderInBook, data )
 			if continueIteration == False:
@@ -187,6 +880,33 @@ class OrderBook():
 		self.logger.info( 'Finished visiting ask offers' ) 
 		return
 
+	def getAskTicksBelowPrice ( self, price ):
+		# Ticks of the ask levels priced strictly below price, lowest first.  price does not need to be a multiple of the tick size 
+		limitTick = self.priceToTick( price )
+		if self.tickToPrice( limitTick ) < price and not self.isValidTickPrice( price ): 
+			limitTick += 1 
+		return self.askOrderBook.getTicksBetterThan( limitTick )
+
+	def getBidTicksAbovePrice ( self, price ):
+		# Ticks of the bid levels priced strictly above price, highest first 
+		limitTick = self.priceToTick( price )
+		if self.tickToPrice( limitTick ) > price and not self.isValidTickPrice( price ): 
+			limitTick -= 1 
+		return self.bidOrderBook.getTicksBetterThan( limitTick )
+
+	def getTotalAskQtyBelowPrice ( self, price ):
+		return self.getAskDepthIndex().getQtyThroughPrice( price )
+	
+	def getTotalBidQtyAbovePrice (self, price ):
+		return self.getBidDepthIndex().getQtyThroughPrice( price )
+	
+	def getAverageFillPrice (self, tradeAction, qty ):
+		# Average price a market order of qty would obtain against the live book, None if the book can not fill the quantity 
+		if tradeAction == trade.TradeActions.Buy: 
+			return self.getAskDepthIndex().getAverageFillPrice( qty )
+		elif tradeAction == trade.TradeActions.Sell: 
+			return self.getBidDepthIndex().getAverageFillPrice( qty )
+
 	def getLowestAskPrice(self):
 		return self.lowestAskPrc 
 	
@@ -194,28 +914,34 @@ class OrderBook():
 		return self.highestBidPrc
 	
 	def getNewLowestAskPrice(self):
-		if len ( self.askOrderBook ) == 0: 
-			return None 
-		else :
-			return min ( self.askOrderBook.keys(), key=float )
+		return self.tickToPrice( self.askOrderBook.getBestTick() )
 	
 	def getNewHighestBidPrice(self):
-		if len ( self.bidOrderBook ) == 0: 
-			return None 
-		else :
-			return max ( self.bidOrderBook.keys(), key=float )
+		return self.tickToPrice( self.bidOrderBook.getBestTick() )
 	
 	def clearOrderBook ( self ): 
-		self.bidOrderBook = {} 
-		self.askOrderBook = {} 
+		self.changedBidTicks.update( tick for tick, priceLevel in self.bidOrderBook.iteritems() )
+		self.changedAskTicks.update( tick for tick, priceLevel in self.askOrderBook.iteritems() )
+		self.getWritablePriceLevels( self.bidOrderBook ).clear()
+		self.getWritablePriceLevels( self.askOrderBook ).clear()
+		if self.bidDepthIndex is not None: 
+			self.bidDepthIndex.clear()
+		if self.askDepthIndex is not None: 
+			self.askDepthIndex.clear()
+		self.orderSlab.clear()
+		self.sharedOrderSlabs = [] 
+		self.highestBidTick = None 
+		self.lowestAskTick = None 
+		self.highestBidPrc = None 
+		self.lowestAskPrc = None 
 	
 class TestOrderBook():
 	
 	@staticmethod
-	def createTestOrderBook( symbol, bidMinPrice, bidMaxPrice, askMinPrice, askMaxPrice, qty, ordersAtBidPriceLevel = 1, ordersAtAskPriceLeve = 1 ):
+	def createTestOrderBook( symbol, bidMinPrice, bidMaxPrice, askMinPrice, askMaxPrice, qty, ordersAtBidPriceLevel = 1, ordersAtAskPriceLeve = 1, denseBandTicks = None ):
 		accountId = 1 
 		orderId = 1 
-		testOrderBook = OrderBook(symbol)
+		testOrderBook = OrderBook(symbol, tickSize = 1, denseBandTicks = denseBandTicks)
 		
 		for samplePrice in range ( askMinPrice, askMaxPrice + 1 ): 
 			for i in range (0, ordersAtAskPriceLeve) : 
@@ -238,6 +964,147 @@ class TestOrderBook():
 		assert ( testOrderBook.getLowestAskPrice() == 101 ) 
 		assert ( testOrderBook.getHighestBidPrice() == 99 ) 
 	
+	@staticmethod
+	def testPriceLevelIndex(): 
+		symbol = "AA"
+		testOrderBook = TestOrderBook.createTestOrderBook( symbol, 1, 1000, 1001, 2000, 10 ) 
+		assert ( testOrderBook.getLowestAskPrice() == 1001 ) 
+		assert ( testOrderBook.getHighestBidPrice() == 1000 ) 
+
+		# Remove a level in the middle of the book, top of book should not change 
+		testOrderBook.removeSellOrderFromOrderBook( 1500, testOrderBook.getAskPriceLevel(1500).getFrontOrder().getOrderId() )
+		assert ( testOrderBook.getLowestAskPrice() == 1001 ) 
+		
+		# Deplete the top levels one by one 
+		for price in range ( 1001, 1600 ): 
+			if price == 1500: 
+				continue 
+			testOrderBook.removeSellOrderFromOrderBook( price, testOrderBook.getAskPriceLevel(price).getFrontOrder().getOrderId() )
+			assert ( testOrderBook.getLowestAskPrice() == ( price + 1 if price != 1499 else 1501 ) ) 
+		
+		for price in range ( 1000, 0, -1 ): 
+			testOrderBook.removeBuyOrderFromOrderBook( price, testOrderBook.getBidPriceLevel(price).getFrontOrder().getOrderId() )
+			assert ( testOrderBook.getHighestBidPrice() == ( price - 1 if price > 1 else None ) ) 
+		
+		# Re-adding a price level after it was depleted 
+		testOrderBook.appendOrderToOrderBook( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 5, 10, 1, 5000 ) ) 
+		assert ( testOrderBook.getHighestBidPrice() == 5 ) 
+
+		# Levels removed below the top stay in the heap as stale entries, every query skips them 
+		import random 
+		random.seed( 7 )
+		for highestIsBest in ( True, False ): 
+			priceIndex = PriceLevelIndex( highestIsBest )
+			prices = set() 
+			for i in range ( 0, 5000 ): 
+				price = random.randint( 1, 300 )
+				if price in prices: 
+					priceIndex.removePriceLevel( price )
+					prices.discard( price )
+				else: 
+					priceIndex.addPriceLevel( price )
+					prices.add( price )
+				bestPrices = sorted ( prices, reverse = highestIsBest )
+				assert ( len ( priceIndex ) == len ( prices ) and priceIndex.getBestPrice() == ( bestPrices[0] if bestPrices else None ) ) 
+				if i % 100 == 0: 
+					assert ( priceIndex.getPricesBetterThan( 150 ) == [ p for p in bestPrices if ( p > 150 if highestIsBest else p < 150 ) ] ) 
+			assert ( len ( priceIndex.keys ) <= 2 * len ( prices ) + 64 ) 
+	
+	@staticmethod
+	def testTickPrices(): 
+		symbol = "AA"
+		testOrderBook = OrderBook( symbol, tickSize = .01 ) 
+		
+		# Prices that differ only by float error end up in the same price level 
+		testOrderBook.appendOrderToOrderBook( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 11 - .01, 10, 1, 1 ) ) 
+		testOrderBook.appendOrderToOrderBook( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 10.99, 10, 1, 2 ) ) 
+		testOrderBook.appendOrderToOrderBook( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 10.98 + .01, 10, 1, 3 ) ) 
+		assert ( len ( testOrderBook.bidOrderBook ) == 1 ) 
+		assert ( testOrderBook.getTopOfBook() == quote.Quote (symbol, 10.99, None, 30, 0 ) ) 
+		assert ( testOrderBook.getBidPriceLevel( 10.99 ).tick == 1099 ) 
+		
+		testOrderBook.removeOrderFromOrderBook( trade.TradeActions.Buy, 10.98 + .01, 1 ) 
+		assert ( testOrderBook.getTopOfBook() == quote.Quote (symbol, 10.99, None, 20, 0 ) ) 
+		assert ( testOrderBook.isValidTickPrice( 10.99 ) and not testOrderBook.isValidTickPrice( 10.995 ) ) 
+
+	@staticmethod
+	def testDenseOrderBook(): 
+		symbol = "AA"
+		sparseOrderBook = TestOrderBook.createTestOrderBook( symbol, 90, 99, 101, 110, 10, 2, 2 ) 
+		denseOrderBook = TestOrderBook.createTestOrderBook( symbol, 90, 99, 101, 110, 10, 2, 2, denseBandTicks = 5 ) 
+		assert ( isinstance ( denseOrderBook.bidOrderBook, DensePriceLevels ) ) 
+		assert ( len ( denseOrderBook.askOrderBook.outOfBandLevels ) > 0 ) # Some levels are outside of the band 
+		
+		# Deplete both books from the top, the best prices should always agree including when crossing the band edge 
+		for price in range ( 101, 111 ): 
+			for book in ( sparseOrderBook, denseOrderBook ): 
+				while book.getAskPriceLevel( price ): 
+					book.removeSellOrderFromOrderBook( price, book.getAskPriceLevel( price ).getFrontOrder().getOrderId() )
+			assert ( sparseOrderBook.getTopOfBook() == denseOrderBook.getTopOfBook() ) 
+		
+		for price in range ( 99, 89, -1 ): 
+			for book in ( sparseOrderBook, denseOrderBook ): 
+				book.removeBuyOrderFromOrderBook( price, book.getBidPriceLevel( price ).getFrontOrder().getOrderId() )
+			assert ( sparseOrderBook.getTopOfBook() == denseOrderBook.getTopOfBook() ) 
+		
+		# Moving the band keeps every level 
+		denseOrderBook.setDenseBandCenter( 80 ) 
+		assert ( denseOrderBook.getHighestBidPrice() == 99 and len ( denseOrderBook.bidOrderBook ) == 10 ) 
+		levelTotals = lambda book : sorted ( ( tick, priceLevel.getTotalQty() ) for tick, priceLevel in book.bidOrderBook.iteritems() ) 
+		assert ( levelTotals( denseOrderBook ) == levelTotals( sparseOrderBook ) ) 
+		
+		# Order better than the band becomes the best price, removing it falls back to the band 
+		denseOrderBook.appendOrderToOrderBook( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 200, 10, 1, 9000 ) ) 
+		assert ( denseOrderBook.getHighestBidPrice() == 200 ) 
+		denseOrderBook.removeBuyOrderFromOrderBook( 200, 9000 ) 
+		assert ( denseOrderBook.getHighestBidPrice() == 99 ) 
+
+	@staticmethod
+	def testPriceLevelQueue(): 
+		symbol = "AA"
+		testPriceLevel = PriceLevel( 100, 100, order_slab.OrderSlab() ) 
+		for orderId in range ( 1, 6 ): 
+			testPriceLevel.appendOrder( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 100, 10, 1, orderId ) ) 
+		assert ( [ o.getOrderId() for o in testPriceLevel ] == [ 1, 2, 3, 4, 5 ] ) 
+
+		# Cancel from the middle, front and back of the queue 
+		testPriceLevel.removeOrder( 3 ) 
+		assert ( [ o.getOrderId() for o in testPriceLevel ] == [ 1, 2, 4, 5 ] ) 
+		assert ( testPriceLevel.popFrontOrder().getOrderId() == 1 ) 
+		testPriceLevel.removeOrder( 5 ) 
+		assert ( [ o.getOrderId() for o in testPriceLevel ] == [ 2, 4 ] ) 
+
+		# Removing the current order while iterating continues with the next order in the queue
+		visited = [] 
+		for o in testPriceLevel: 
+			visited.append( o.getOrderId() )
+			testPriceLevel.removeOrder( o.getOrderId() )
+		assert ( visited == [ 2, 4 ] ) 
+		assert ( len( testPriceLevel ) == 0 and testPriceLevel.getFrontOrder() is None ) 
+		assert ( testPriceLevel.getTotalQty() == 0 ) 
+	
+	@staticmethod
+	def testPriceLevelTotals(): 
+		symbol = "AA"
+		testOrderBook = TestOrderBook.createTestOrderBook( symbol, 97, 99, 101, 103, 10, 3, 2) 
+		assert ( testOrderBook.getBidPriceLevel(99).getTotalQty() == 30 and testOrderBook.getBidPriceLevel(99).getOrderCount() == 3 ) 
+
+		# Partial fill of the front order then cancel of another order at the top of the book 
+		frontOrder = testOrderBook.getBidPriceLevel(99).getFrontOrder() 
+		testOrderBook.reduceOrderQty( frontOrder, 4 ) 
+		assert ( frontOrder.getQty() == 6 ) 
+		assert ( testOrderBook.getTopOfBook() == quote.Quote (symbol, 99, 101, 26, 20 ) ) 
+
+		testOrderBook.removeOrderFromOrderBook( trade.TradeActions.Buy, 99, list( testOrderBook.getBidPriceLevel(99) )[1].getOrderId() ) 
+		assert ( testOrderBook.getTopOfBook() == quote.Quote (symbol, 99, 101, 16, 20 ) ) 
+		assert ( testOrderBook.getBidPriceLevel(99).getOrderCount() == 2 ) 
+		assert ( testOrderBook.getOpenOrderInfo( frontOrder.getOrderId() ) == ( trade.TradeActions.Buy, 99, 1 ) ) 
+		assert ( len ( testOrderBook.orderSlab ) == 3 * 3 + 3 * 2 - 1 ) 
+
+		condencedOrderBook = testOrderBook.createCondencedOrderBook()
+		assert ( condencedOrderBook.bidOrderBook[99].bidsz == 16 ) 
+		assert ( condencedOrderBook.getTotalBidQtyAbovePrice ( 90 ) == 76 ) 
+	
 	@staticmethod
 	def testCondencedOrderBook(): 
 		symbol = "AA"
@@ -250,10 +1117,119 @@ class TestOrderBook():
 
 		assert ( condencedOrderBook.getTotalAskQtyBelowPrice ( 110 ) == 60 ) 
 		assert ( condencedOrderBook.getTotalBidQtyAbovePrice ( 90 ) == 60 ) 
+		assert ( condencedOrderBook.getTotalAskQtyBelowPrice ( 102 ) == 40 ) 
+		assert ( condencedOrderBook.getAverageFillPrice ( trade.TradeActions.Buy, 30 ) == ( 101 * 20 + 102 * 10 ) / 30.0 ) 
+	
+	@staticmethod
+	def testLiveDepthQueries(): 
+		symbol = "AA"
+		testOrderBook = TestOrderBook.createTestOrderBook( symbol, 97, 99, 101, 103, 10, 2, 2) 
+		assert ( testOrderBook.getTotalAskQtyBelowPrice ( 110 ) == 60 ) 
+		assert ( testOrderBook.getTotalBidQtyAbovePrice ( 98 ) == 40 ) 
+		
+		# Depth follows partial fills, cancels and depleted levels 
+		testOrderBook.reduceOrderQty( testOrderBook.getAskPriceLevel(101).getFrontOrder(), 5 )
+		frontOrder = testOrderBook.getAskPriceLevel(101).getFrontOrder()
+		testOrderBook.removeOrderFromOrderBook( trade.TradeActions.Sell, 101, list( testOrderBook.getAskPriceLevel(101) )[1].getOrderId() )
+		assert ( testOrderBook.getTotalAskQtyBelowPrice ( 101 ) == 5 ) 
+		assert ( testOrderBook.getAverageFillPrice ( trade.TradeActions.Buy, 15 ) == ( 101 * 5 + 102 * 10 ) / 15.0 ) 
+		assert ( testOrderBook.getAverageFillPrice ( trade.TradeActions.Sell, 25 ) == ( 99 * 20 + 98 * 5 ) / 25.0 ) 
+		assert ( testOrderBook.getAverageFillPrice ( trade.TradeActions.Sell, 61 ) is None ) 
+		
+		condencedOrderBook = testOrderBook.createCondencedOrderBook()
+		for price in range ( 95, 106 ): 
+			assert ( condencedOrderBook.getTotalAskQtyBelowPrice( price ) == testOrderBook.getTotalAskQtyBelowPrice( price ) ) 
+			assert ( condencedOrderBook.getTotalBidQtyAbovePrice( price ) == testOrderBook.getTotalBidQtyAbovePrice( price ) ) 
+
+	@staticmethod
+	def testChangedLevels(): 
+		symbol = "AA"
+		testOrderBook = TestOrderBook.createTestOrderBook( symbol, 97, 99, 101, 103, 10, 2, 2) 
+		assert ( testOrderBook.getLevels() == [ ( trade.TradeActions.Buy, 99, 20 ), ( trade.TradeActions.Buy, 98, 20 ), ( trade.TradeActions.Buy, 97, 20 ), 
+			( trade.TradeActions.Sell, 101, 20 ), ( trade.TradeActions.Sell, 102, 20 ), ( trade.TradeActions.Sell, 103, 20 ) ] ) 
+		assert ( len ( testOrderBook.takeChangedLevels() ) == 6 ) 
+
+		# Only the changed levels are reported, a removed level with qty 0 
+		testOrderBook.reduceOrderQty( testOrderBook.getAskPriceLevel(101).getFrontOrder(), 5 )
+		testOrderBook.removeBestBidPriceLevel() 
+		testOrderBook.appendSellOfferToOrderBook( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 104, 3, 2, 1000 ) ) 
+		assert ( testOrderBook.takeChangedLevels() == [ ( trade.TradeActions.Buy, 99, 0 ), ( trade.TradeActions.Sell, 101, 15 ), ( trade.TradeActions.Sell, 104, 3 ) ] ) 
+		assert ( testOrderBook.takeChangedLevels() == [] ) 
+
+		testOrderBook.clearOrderBook() 
+		assert ( [ qty for side, price, qty in testOrderBook.takeChangedLevels() ] == [ 0 ] * 6 ) 
+
+	@staticmethod
+	def testCrossedPriceLevels(): 
+		symbol = "AA"
+		for denseBandTicks in ( None, 3 ): 
+			testOrderBook = TestOrderBook.createTestOrderBook( symbol, 90, 99, 101, 110, 10, denseBandTicks = denseBandTicks ) 
+			testOrderBook.removeSellOrderFromOrderBook( 103, testOrderBook.getAskPriceLevel(103).getFrontOrder().getOrderId() )
+
+			assert ( testOrderBook.getAskTicksBelowPrice( 105 ) == [ 101, 102, 104 ] ) 
+			assert ( testOrderBook.getAskTicksBelowPrice( 104.5 ) == [ 101, 102, 104 ] ) 
+			assert ( testOrderBook.getAskTicksBelowPrice( 101 ) == [] ) 
+			assert ( testOrderBook.getAskTicksBelowPrice( 1000 ) == [ 101, 102 ] + range ( 104, 111 ) ) 
+			assert ( testOrderBook.getBidTicksAbovePrice( 96 ) == [ 99, 98, 97 ] ) 
+			assert ( testOrderBook.getBidTicksAbovePrice( 96.5 ) == [ 99, 98, 97 ] ) 
+			assert ( testOrderBook.getBidTicksAbovePrice( 0 ) == range ( 99, 89, -1 ) ) 
+
+	@staticmethod
+	def testForkOrderBook(): 
+		symbol = "AA"
+		for denseBandTicks in ( None, 3 ): 
+			testOrderBook = TestOrderBook.createTestOrderBook( symbol, 90, 99, 101, 110, 10, denseBandTicks = denseBandTicks ) 
+			frontOrderId = testOrderBook.getAskPriceLevel(101).getFrontOrder().getOrderId() 
+			forkedOrderBook = testOrderBook.fork() 
+			assert ( forkedOrderBook.askOrderBook is testOrderBook.askOrderBook and forkedOrderBook.askDepthIndex is None ) 
+
+			# Untouched levels and their orders are shared, changed levels are copied into the book that changed them 
+			forkedOrderBook.removeSellOrderFromOrderBook( 101, frontOrderId ) 
+			forkedOrderBook.removeBestBidPriceLevel() 
+			forkedOrderBook.reduceOrderQty( forkedOrderBook.getAskPriceLevel(102).getFrontOrder(), 4 ) 
+			assert ( forkedOrderBook.getAskPriceLevel(103) is testOrderBook.getAskPriceLevel(103) ) 
+			assert ( forkedOrderBook.getAskPriceLevel(102) is not testOrderBook.getAskPriceLevel(102) ) 
+			assert ( testOrderBook.getTopOfBook() == quote.Quote( symbol, 99, 101, 10, 10 ) ) 
+			assert ( testOrderBook.getAskPriceLevel(102).getTotalQty() == 10 and testOrderBook.getTotalBidQtyAbovePrice( 0 ) == 100 ) 
+			assert ( testOrderBook.getAskPriceLevel(102).getFrontOrder().getQty() == 10 ) 
+			assert ( forkedOrderBook.getTopOfBook() == quote.Quote( symbol, 98, 102, 10, 6 ) ) 
+			assert ( forkedOrderBook.getTotalAskQtyBelowPrice( 102 ) == 6 and forkedOrderBook.getTotalBidQtyAbovePrice( 0 ) == 90 ) 
+
+			# Orders are found in whichever slab holds the live copy for the book 
+			assert ( testOrderBook.getOpenOrderInfo( frontOrderId ) == ( trade.TradeActions.Sell, 101, 1 ) ) 
+			assert ( forkedOrderBook.getOpenOrderInfo( frontOrderId ) is None ) 
+			assert ( len ( forkedOrderBook.getOrderIdsForAccount( 1 ) ) == len ( testOrderBook.getOrderIdsForAccount( 1 ) ) - 2 ) 
+
+			# A fork of a fork only sees the changes made before it was forked 
+			secondForkedOrderBook = forkedOrderBook.fork() 
+			secondForkedOrderBook.appendSellOfferToOrderBook( order.Order( symbol, trade.TradeActions.Sell, order.OrderTypes.Limit, 101, 3, 2, 1000 ) ) 
+			forkedOrderBook.removeBestAskPriceLevel() 
+			assert ( secondForkedOrderBook.getTopOfBook() == quote.Quote( symbol, 98, 101, 10, 3 ) ) 
+			assert ( secondForkedOrderBook.getAskPriceLevel(102).getTotalQty() == 6 and forkedOrderBook.getLowestAskPrice() == 103 ) 
+			assert ( secondForkedOrderBook.getOrderIdsForAccount( 2 ) == set ( [ 1000 ] ) and testOrderBook.getOpenOrderInfo( 1000 ) is None ) 
+
+			# Forking a book that keeps changing compacts its shared slabs instead of growing the chain 
+			forkedOrderBooks = [] 
+			for orderId in range ( 2000, 2020 ): 
+				testOrderBook.appendBuyOfferToOrderBook( order.Order( symbol, trade.TradeActions.Buy, order.OrderTypes.Limit, 98, 1, 3, orderId ) ) 
+				forkedOrderBooks.append( testOrderBook.fork() ) 
+				assert ( len ( testOrderBook.sharedOrderSlabs ) <= OrderBook.MAX_SHARED_ORDER_SLABS ) 
+			assert ( testOrderBook.getOrderIdsForAccount( 3 ) == set ( range ( 2000, 2020 ) ) and testOrderBook.getOpenOrderInfo( frontOrderId ) == ( trade.TradeActions.Sell, 101, 1 ) ) 
+			assert ( forkedOrderBooks[0].getOrderIdsForAccount( 3 ) == set ( [ 2000 ] ) and forkedOrderBooks[0].getBidPriceLevel(98).getTotalQty() == 11 ) 
+			assert ( testOrderBook.getBidPriceLevel(98).getTotalQty() == 30 and testOrderBook.getTotalBidQtyAbovePrice( 97.5 ) == 40 ) 
 
 if __name__ == "__main__":
 	
 	logger.MyLogger.InitializeLogger()
 	TestOrderBook.testOrderBook()
+	TestOrderBook.testPriceLevelIndex()
+	TestOrderBook.testTickPrices()
+	TestOrderBook.testDenseOrderBook()
+	TestOrderBook.testPriceLevelQueue()
+	TestOrderBook.testPriceLevelTotals()
 	TestOrderBook.testCondencedOrderBook()
+	TestOrderBook.testLiveDepthQueries()
+	TestOrderBook.testChangedLevels()
+	TestOrderBook.testCrossedPriceLevels()
+	TestOrderBook.testForkOrderBook()
 	
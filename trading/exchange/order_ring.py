@@ -0,0 +1,385 @@
+#!/usr/bin/python
+
+import trading.exchange.exchange_account as exchange_account
+import trading.exchange.order as order
+import trading.exchange.trade as trade
+import logger.logger as logger
+import logging
+import multiprocessing
+import struct
+import mmap
+import time
+
+class RecordTypes():
+	NewOrder = 1
+	CancelOrder = 2
+	Ack = 3 # Order accepted, orderId is the exchange order id
+	Reject = 4
+	Fill = 5
+	CancelAck = 6
+	CancelReject = 7
+
+	def __init__(self):
+		pass
+
+class EgressPolicies():
+	Block = 0 # The matching process waits for room, only for producers that are trusted to keep up
+	Drop = 1 # The record that does not fit is dropped and counted for the producer
+	Disconnect = 2 # The producer is disconnected, its orders are cancelled and its further records ignored
+
+	def __init__(self):
+		pass
+
+class RecordRing():
+
+	"""
+	This class is a bounded queue of fixed size binary records in shared memory.  The memory is an anonymous shared mmap
+	so it has to be created before the producer and consumer processes are started.  Records are packed straight into the
+	shared slots with struct, nothing is pickled or sent through a pipe.  Every slot starts with a sequence number, a
+	producer claims the next position under a lock, writes the record and then sets the sequence to publish it.  The single
+	consumer reads the slots whose sequence shows they are published and sets the sequence again to hand the slot back to
+	the producers.  Without multiProducer there is no lock, e.g. for the egress ring written only by the matching process.
+
+	Record fields : ( recordType, tradeAction, orderType, producerId, price, qty, accountId, clientOrderId, orderId )
+	"""
+
+	SEQUENCE = struct.Struct( '<q' )
+	RECORD = struct.Struct( '<BBBB4xddqqq' )
+	SLOT_SIZE = 64 # Sequence and record padded to a cache line
+	HEADER_SIZE = 64 # Next position to claim by the producers
+
+	def __init__(self, capacity = 1 << 14, multiProducer = True):
+		if capacity & ( capacity - 1 ):
+			raise Exception( 'Invalid capacity, ring capacity must be a power of two' )
+		self.capacity = capacity
+		self.mask = capacity - 1
+		self.buffer = mmap.mmap( -1, RecordRing.HEADER_SIZE + capacity * RecordRing.SLOT_SIZE )
+		for position in xrange ( 0, capacity ):
+			RecordRing.SEQUENCE.pack_into( self.buffer, self.getSlotOffset( position ), position )
+		RecordRing.SEQUENCE.pack_into( self.buffer, 0, 0 )
+		self.lock = multiprocessing.Lock() if multiProducer else None
+		self.head = 0 # Next position to read, only used by the consumer
+		self.logger = logging.getLogger('MyLogger')
+
+	def getSlotOffset(self, position):
+		return RecordRing.HEADER_SIZE + ( position & self.mask ) * RecordRing.SLOT_SIZE
+
+	def tryPut(self, recordType, tradeAction = 0, orderType = 0, producerId = 0, price = 0.0, qty = 0.0, accountId = 0, clientOrderId = 0, orderId = 0):
+		# Returns False when the ring is full
+		buffer = self.buffer
+		if self.lock is not None:
+			self.lock.acquire()
+		try:
+			position = RecordRing.SEQUENCE.unpack_from( buffer, 0 )[0]
+			slotOffset = self.getSlotOffset( position )
+			if RecordRing.SEQUENCE.unpack_from( buffer, slotOffset )[0] != position: # Slot not read yet by the consumer
+				return False
+			RecordRing.SEQUENCE.pack_into( buffer, 0, position + 1 )
+		finally:
+			if self.lock is not None:
+				self.lock.release()
+
+		RecordRing.RECORD.pack_into( buffer, slotOffset + 8, recordType, tradeAction, orderType, producerId, price, qty, accountId, clientOrderId, orderId )
+		RecordRing.SEQUENCE.pack_into( buffer, slotOffset, position + 1 )
+		return True
+
+	def put(self, *record):
+		# Waits while the ring is full
+		wait = 0
+		while not self.tryPut( *record ):
+			time.sleep( wait )
+			wait = min ( .001, wait * 2 or .00001 )
+
+	def drain(self, maxRecords = 1024):
+		# Published records in order, at most maxRecords.  Only called by the consumer process
+		buffer = self.buffer
+		records = []
+		head = self.head
+		while len ( records ) < maxRecords:
+			slotOffset = self.getSlotOffset( head )
+			if RecordRing.SEQUENCE.unpack_from( buffer, slotOffset )[0] != head + 1:
+				break
+			records.append( RecordRing.RECORD.unpack_from( buffer, slotOffset + 8 ) )
+			RecordRing.SEQUENCE.pack_into( buffer, slotOffset, head + self.capacity )
+			head += 1
+		self.head = head
+		return records
+
+class OrderRingProducer():
+
+	"""
+	This class writes the order and cancel records of one producer process to the ingress ring and reads the
+	acknowledgements and fills the matching process sends back on the egress ring of that producer.  clientOrderId is
+	the producer's own sequence number, the Ack for it carries the exchange order id used to cancel.
+	"""
+
+	def __init__(self, ingressRing, egressRing, producerId):
+		self.ingressRing = ingressRing
+		self.egressRing = egressRing
+		self.producerId = producerId
+		self.clientOrderId = 0
+
+	def submitOrder(self, tradeAction, orderType, price, qty, accountId):
+		self.clientOrderId += 1
+		self.ingressRing.put( RecordTypes.NewOrder, tradeAction, orderType, self.producerId, price or 0.0, qty, accountId, self.clientOrderId, 0 )
+		return self.clientOrderId
+
+	def cancelOrder(self, orderId, accountId):
+		self.ingressRing.put( RecordTypes.CancelOrder, 0, 0, self.producerId, 0.0, 0.0, accountId, 0, orderId )
+
+	def drainEgress(self, maxRecords = 1024):
+		return self.egressRing.drain( maxRecords )
+
+class OrderRingConsumer():
+
+	"""
+	This class runs in the matching process.  It drains the ingress ring in batches into the Exchange, runs of new orders
+	go through submitOrders and cancels are applied between them in arrival order.  Acks, rejects and fills are written
+	to the egress ring of the producer that sent the order.  Fills are published by the exchange before submitOrders
+	returns the order ids so they are held until the acks of the batch are written.  Egress writes never wait on a full
+	ring unless egressPolicy is Block, a producer that stops reading its egress ring otherwise only loses its own records
+	( Drop ) or is disconnected ( Disconnect ), so it cannot stall matching for the other producers.
+	"""
+
+	def __init__(self, exchange, ingressRing, egressRings, egressPolicy = EgressPolicies.Disconnect):
+		self.exchange = exchange
+		self.ingressRing = ingressRing
+		self.egressRings = egressRings # Producer id -> RecordRing
+		self.egressPolicy = egressPolicy
+		self.orderOwners = {} # Exchange orderId -> ( producerId, clientOrderId, Order ) while the order can still fill
+		self.listenedAccountIds = set()
+		self.pendingTrades = []
+		self.droppedCounts = {} # Producer id -> egress records dropped because the ring was full
+		self.disconnectedProducers = set()
+		self.logger = logging.getLogger('MyLogger')
+
+	def onTrades(self, trades):
+		self.pendingTrades.extend( trades )
+
+	def listenToAccount(self, accountId):
+		if accountId not in self.listenedAccountIds:
+			self.listenedAccountIds.add( accountId )
+			self.exchange.registerTradesListener( exchange_account.ExchangeAccount( accountId ), self.onTrades )
+
+	def sendEgress(self, producerId, *record):
+		# False when the record was not written, the producer is then disconnected with the Disconnect policy
+		if producerId in self.disconnectedProducers:
+			return False
+		egressRing = self.egressRings[ producerId ]
+		if egressRing.tryPut( *record ):
+			return True
+		if self.egressPolicy == EgressPolicies.Block:
+			egressRing.put( *record )
+			return True
+		self.droppedCounts[ producerId ] = self.droppedCounts.get( producerId, 0 ) + 1
+		if self.egressPolicy == EgressPolicies.Disconnect:
+			self.disconnectProducer( producerId )
+		return False
+
+	def cancelRestingOrder(self, orderId):
+		if self.exchange.orderBook.getOpenOrderInfo( orderId ) is not None:
+			self.exchange.cancelOrder( orderId )
+
+	def disconnectProducer(self, producerId):
+		self.logger.warning( "Disconnecting producer, egress ring is full producerId:[%s]" % ( producerId ) )
+		self.disconnectedProducers.add( producerId )
+		for orderId, owner in self.orderOwners.items():
+			if owner[0] == producerId:
+				del self.orderOwners[ orderId ]
+				self.cancelRestingOrder( orderId )
+
+	def submitPendingOrders(self, pendingOrders):
+		if not pendingOrders:
+			return
+		orders = [ currentOrder for producerId, clientOrderId, currentOrder in pendingOrders ]
+		for ( producerId, clientOrderId, currentOrder ), ( accepted, result ) in zip ( pendingOrders, self.exchange.submitOrders( orders ) ):
+			if accepted and producerId in self.disconnectedProducers: # Disconnected earlier in this batch
+				self.cancelRestingOrder( result )
+			elif accepted:
+				self.orderOwners[ result ] = ( producerId, clientOrderId, currentOrder )
+				self.sendEgress( producerId, RecordTypes.Ack, currentOrder.getTradeAction(), currentOrder.getOrderType(), producerId, currentOrder.getPrice() or 0.0, currentOrder.originalQty, currentOrder.getAccountId(), clientOrderId, result )
+			else:
+				self.sendEgress( producerId, RecordTypes.Reject, currentOrder.getTradeAction(), currentOrder.getOrderType(), producerId, 0.0, currentOrder.originalQty, currentOrder.getAccountId(), clientOrderId, 0 )
+
+		self.publishFills()
+		for producerId, clientOrderId, currentOrder in pendingOrders:
+			if currentOrder.getOrderType() == order.OrderTypes.Market: # Market orders never rest in the book
+				self.orderOwners.pop( currentOrder.getOrderId(), None )
+
+	def publishFills(self):
+		trades = self.pendingTrades
+		self.pendingTrades = []
+		for exchangeTrade in trades:
+			owner = self.orderOwners.get( exchangeTrade.orderId )
+			if owner is None:
+				continue
+			producerId, clientOrderId, currentOrder = owner
+			self.sendEgress( producerId, RecordTypes.Fill, exchangeTrade.tradeAction, currentOrder.getOrderType(), producerId, exchangeTrade.tradePrice, exchangeTrade.qty, exchangeTrade.accountId, clientOrderId, exchangeTrade.orderId )
+
+		# Forget the orders that can no longer fill, only once every fill of the batch is sent
+		for exchangeTrade in trades:
+			if exchangeTrade.orderId in self.orderOwners and self.exchange.orderBook.getOpenOrderInfo( exchangeTrade.orderId ) is None:
+				del self.orderOwners[ exchangeTrade.orderId ]
+
+	def cancelOrder(self, producerId, accountId, orderId):
+		owner = self.orderOwners.get( orderId )
+		if owner is None or owner[2].getAccountId() != accountId:
+			self.sendEgress( producerId, RecordTypes.CancelReject, 0, 0, producerId, 0.0, 0.0, accountId, 0, orderId )
+			return
+		try:
+			self.exchange.cancelOrder( orderId )
+		except Exception as ex:
+			self.sendEgress( producerId, RecordTypes.CancelReject, 0, 0, producerId, 0.0, 0.0, accountId, owner[1], orderId )
+			return
+		del self.orderOwners[ orderId ]
+		self.sendEgress( producerId, RecordTypes.CancelAck, 0, 0, producerId, 0.0, 0.0, accountId, owner[1], orderId )
+
+	def processBatch(self, maxRecords = 1024):
+		# Returns the number of records handled, 0 when the ingress ring was empty
+		records = self.ingressRing.drain( maxRecords )
+		pendingOrders = []
+		for recordType, tradeAction, orderType, producerId, price, qty, accountId, clientOrderId, orderId in records:
+			if producerId in self.disconnectedProducers:
+				continue
+			if recordType == RecordTypes.NewOrder:
+				self.listenToAccount( accountId )
+				price = price if orderType == order.OrderTypes.Limit else None
+				pendingOrders.append( ( producerId, clientOrderId, order.Order( self.exchange.symbol, tradeAction, orderType, price, qty, accountId ) ) )
+			elif recordType == RecordTypes.CancelOrder:
+				self.submitPendingOrders( pendingOrders )
+				pendingOrders = []
+				self.cancelOrder( producerId, accountId, orderId )
+			else:
+				self.logger.warning( "Failed to handle ingress record type:[%s] producerId:[%s]" % ( recordType, producerId ) )
+		self.submitPendingOrders( pendingOrders )
+		return len ( records )
+
+	def run(self, stopEvent, idleSleep = .0001):
+		# Matching loop, returns once stopEvent is set and the ingress ring is empty
+		while True:
+			if self.processBatch() == 0:
+				if stopEvent.is_set():
+					return
+				time.sleep( idleSleep )
+
+class TestOrderRing():
+
+	@staticmethod
+	def testRecordRing():
+		testRing = RecordRing( capacity = 4 )
+		for i in range ( 0, 4 ):
+			assert ( testRing.tryPut( RecordTypes.NewOrder, trade.TradeActions.Buy, order.OrderTypes.Limit, 0, 10 + i, 5, 1, i + 1 ) )
+		assert ( testRing.tryPut( RecordTypes.NewOrder ) == False ) # Full
+		records = testRing.drain( maxRecords = 3 )
+		assert ( [ record[7] for record in records ] == [ 1, 2, 3 ] and records[0][4] == 10.0 and records[0][1] == trade.TradeActions.Buy )
+		assert ( testRing.tryPut( RecordTypes.CancelOrder, orderId = 9 ) and testRing.tryPut( RecordTypes.CancelOrder, orderId = 10 ) )
+		assert ( [ record[8] for record in testRing.drain() ] == [ 0, 9, 10 ] and testRing.drain() == [] )
+		try:
+			RecordRing( capacity = 6 )
+			assert ( False )
+		except Exception as ex:
+			assert ( ex.args[0].startswith( 'Invalid capacity' ) )
+
+	@staticmethod
+	def runTestProducer( ingressRing, egressRing, producerId, numberOfOrders ):
+		producer = OrderRingProducer( ingressRing, egressRing, producerId )
+		for i in range ( 0, numberOfOrders ):
+			tradeAction = trade.TradeActions.Buy if ( i + producerId ) % 2 == 0 else trade.TradeActions.Sell
+			producer.submitOrder( tradeAction, order.OrderTypes.Limit, 100 + ( i % 3 - 1 ) * .01, 10, producerId )
+
+	@staticmethod
+	def testOrderRingIngress():
+		import trading.exchange.exchange as exchange
+		import threading
+
+		numberOfProducers = 3
+		numberOfOrders = 200
+		ingressRing = RecordRing( capacity = 64 )
+		egressRings = dict ( ( producerId, RecordRing( capacity = 1 << 12, multiProducer = False ) ) for producerId in range ( 1, numberOfProducers + 1 ) )
+		producers = [ multiprocessing.Process( target = TestOrderRing.runTestProducer, args = ( ingressRing, egressRings[ producerId ], producerId, numberOfOrders ) ) for producerId in egressRings ]
+		for producer in producers:
+			producer.start()
+
+		testExchange = exchange.Exchange( "AA" )
+		consumer = OrderRingConsumer( testExchange, ingressRing, egressRings )
+		stopEvent = threading.Event()
+		matchingThread = threading.Thread( target = consumer.run, args = ( stopEvent, ) )
+		matchingThread.start()
+		for producer in producers:
+			producer.join()
+		stopEvent.set()
+		matchingThread.join()
+
+		# Every order is acked to its producer and every fill reaches the producer of the order that traded
+		filledQty = 0
+		exchangeOrderIds = set()
+		for producerId, egressRing in egressRings.iteritems():
+			records = egressRing.drain( maxRecords = 1 << 12 )
+			acks = [ record for record in records if record[0] == RecordTypes.Ack ]
+			assert ( sorted ( record[7] for record in acks ) == range ( 1, numberOfOrders + 1 ) )
+			assert ( all ( record[3] == producerId and record[6] == producerId for record in records ) )
+			exchangeOrderIds.update( record[8] for record in acks )
+			filledQty += sum ( record[5] for record in records if record[0] == RecordTypes.Fill )
+		assert ( len ( exchangeOrderIds ) == numberOfProducers * numberOfOrders )
+		assert ( filledQty > 0 and filledQty == testExchange.tradeTape.getColumn( 'qty' ).sum() )
+
+		# Cancels come back on the egress ring of the producer that sent them
+		producer = OrderRingProducer( ingressRing, egressRings[1], 1 )
+		producer.submitOrder( trade.TradeActions.Buy, order.OrderTypes.Limit, 50, 10, 1 )
+		consumer.processBatch()
+		restingOrderId = producer.drainEgress()[0][8]
+		producer.cancelOrder( restingOrderId, 1 )
+		producer.cancelOrder( restingOrderId, 1 )
+		consumer.processBatch()
+		assert ( [ ( record[0], record[8] ) for record in producer.drainEgress() ] == [ ( RecordTypes.CancelAck, restingOrderId ), ( RecordTypes.CancelReject, restingOrderId ) ] )
+
+		# A resting order filled by several orders of one batch gets a Fill for each of them
+		consumer = OrderRingConsumer( exchange.Exchange( "AA" ), ingressRing, egressRings )
+		producer.submitOrder( trade.TradeActions.Sell, order.OrderTypes.Limit, 60, 10, 1 )
+		consumer.processBatch()
+		restingOrderId = producer.drainEgress()[0][8]
+		producer.submitOrder( trade.TradeActions.Buy, order.OrderTypes.Limit, 60, 5, 1 )
+		producer.submitOrder( trade.TradeActions.Buy, order.OrderTypes.Market, 0, 5, 1 )
+		consumer.processBatch()
+		fills = [ record for record in producer.drainEgress() if record[0] == RecordTypes.Fill ]
+		assert ( [ record[5] for record in fills if record[8] == restingOrderId ] == [ 5, 5 ] and len ( fills ) == 4 )
+		assert ( restingOrderId not in consumer.orderOwners and len ( consumer.orderOwners ) == 0 )
+
+	@staticmethod
+	def testEgressNotDrained():
+		import trading.exchange.exchange as exchange
+		import threading
+
+		# Producer 1 never reads its egress ring, the matching process keeps going and producer 2 is unaffected
+		for egressPolicy in ( EgressPolicies.Drop, EgressPolicies.Disconnect ):
+			ingressRing = RecordRing( capacity = 64 )
+			egressRings = { 1 : RecordRing( capacity = 4, multiProducer = False ), 2 : RecordRing( capacity = 64, multiProducer = False ) }
+			testExchange = exchange.Exchange( "AA" )
+			consumer = OrderRingConsumer( testExchange, ingressRing, egressRings, egressPolicy = egressPolicy )
+			slowProducer = OrderRingProducer( ingressRing, egressRings[1], 1 )
+			producer = OrderRingProducer( ingressRing, egressRings[2], 2 )
+			for i in range ( 0, 10 ):
+				slowProducer.submitOrder( trade.TradeActions.Buy, order.OrderTypes.Limit, 50 - i * .01, 10, 1 )
+			producer.submitOrder( trade.TradeActions.Sell, order.OrderTypes.Limit, 60, 10, 2 )
+			matchingThread = threading.Thread( target = consumer.processBatch )
+			matchingThread.daemon = True
+			matchingThread.start()
+			matchingThread.join( 5 )
+			assert ( not matchingThread.is_alive() )
+			assert ( consumer.droppedCounts == { 1 : 6 if egressPolicy == EgressPolicies.Drop else 1 } )
+			assert ( [ record[0] for record in producer.drainEgress() ] == [ RecordTypes.Ack ] )
+			if egressPolicy == EgressPolicies.Drop:
+				assert ( len ( testExchange.orderBook.getOrderIdsForAccount( 1 ) ) == 10 )
+			else:
+				# The orders acked before the disconnect are cancelled, later records of the producer are ignored
+				assert ( consumer.disconnectedProducers == set ( [ 1 ] ) and len ( testExchange.orderBook.getOrderIdsForAccount( 1 ) ) == 0 )
+				assert ( all ( owner[0] == 2 for owner in consumer.orderOwners.itervalues() ) )
+				slowProducer.submitOrder( trade.TradeActions.Buy, order.OrderTypes.Limit, 50, 10, 1 )
+				assert ( consumer.processBatch() == 1 and len ( testExchange.orderBook.getOrderIdsForAccount( 1 ) ) == 0 )
+
+if __name__ == "__main__":
+
+	logger.MyLogger.InitializeLogger()
+	TestOrderRing.testRecordRing()
+	TestOrderRing.testOrderRingIngress()
+	TestOrderRing.testEgressNotDrained()
@@ -0,0 +1,160 @@
+#!/usr/bin/python
+
+import logger.logger as logger
+import logging
+import array
+
+class OrderSlab():
+
+	"""
+	This class is the table of orders resting in the order book.  Each live order is stored in a slot of parallel typed arrays
+	holding its order id, side, price tick, remaining quantity and the previous / next slots of its price level queue, with
+	its account and order object in list columns.  Order ids map to slots through a dict and the slots of filled or canceled
+	orders go on a free list to be reused, so the capacity follows the number of live orders no matter how old the oldest
+	one is.  When no slot is free the capacity doubles by extending the columns, slots never move so nothing is rehashed.
+	The live order ids of each account are indexed as orders are added and removed.  Account ids can be any hashable value.
+	"""
+
+	EMPTY_SLOT = -1 # Also used as the empty slot for queue links
+
+	def __init__(self, initialCapacity = 1024):
+		self.slotsByOrderId = {} # orderId -> slot of every live order
+		self.freeSlots = [] # Slots that are not in use, reused last freed first
+		self.accountOrderIds = {} # accountId -> set of live order ids
+		self.capacity = 0
+		self.orderIds = array.array( 'l' ) # Order id occupying the slot
+		self.sides = array.array( 'b' )
+		self.priceTicks = array.array( 'l' )
+		self.qtys = array.array( 'd' ) # Remaining quantity
+		self.accountIds = [] # Any hashable account id
+		self.prevSlots = array.array( 'l' ) # Price level queue links
+		self.nextSlots = array.array( 'l' )
+		self.orders = [] # Order objects, used when publishing trades
+		self.logger = logging.getLogger('MyLogger')
+		self.grow( initialCapacity )
+
+	def __len__(self):
+		return len( self.slotsByOrderId )
+
+	def __contains__(self, orderId):
+		return orderId in self.slotsByOrderId
+
+	def getSlot(self, orderId):
+		return self.slotsByOrderId.get( orderId, OrderSlab.EMPTY_SLOT )
+
+	def grow(self, requiredCapacity):
+		newCapacity = max ( self.capacity, 1 )
+		while newCapacity < requiredCapacity:
+			newCapacity *= 2
+		addedSlots = newCapacity - self.capacity
+
+		if self.capacity > 0:
+			self.logger.info( "Growing order slab capacity:[%s] -> [%s]" % ( self.capacity, newCapacity ) )
+
+		self.orderIds.extend( array.array( 'l', [ OrderSlab.EMPTY_SLOT ] ) * addedSlots )
+		self.sides.extend( array.array( 'b', [0] ) * addedSlots )
+		self.priceTicks.extend( array.array( 'l', [0] ) * addedSlots )
+		self.qtys.extend( array.array( 'd', [0.0] ) * addedSlots )
+		self.accountIds.extend( [ None ] * addedSlots )
+		self.prevSlots.extend( array.array( 'l', [ OrderSlab.EMPTY_SLOT ] ) * addedSlots )
+		self.nextSlots.extend( array.array( 'l', [ OrderSlab.EMPTY_SLOT ] ) * addedSlots )
+		self.orders.extend( [ None ] * addedSlots )
+		self.freeSlots.extend( xrange ( newCapacity - 1, self.capacity - 1, -1 ) ) # Lowest slots are used first
+		self.capacity = newCapacity
+
+	def addOrder(self, currentOrder, priceTick):
+		if not self.freeSlots:
+			self.grow( self.capacity + 1 )
+
+		orderId = currentOrder.getOrderId()
+		slot = self.freeSlots.pop()
+		self.slotsByOrderId[ orderId ] = slot
+		self.orderIds[ slot ] = orderId
+		self.sides[ slot ] = currentOrder.getTradeAction()
+		self.priceTicks[ slot ] = priceTick
+		self.qtys[ slot ] = currentOrder.getQty()
+		self.accountIds[ slot ] = currentOrder.getAccountId()
+		self.prevSlots[ slot ] = OrderSlab.EMPTY_SLOT
+		self.nextSlots[ slot ] = OrderSlab.EMPTY_SLOT
+		self.orders[ slot ] = currentOrder
+
+		accountOrderIds = self.accountOrderIds.get( currentOrder.getAccountId() )
+		if accountOrderIds is None:
+			accountOrderIds = self.accountOrderIds[ currentOrder.getAccountId() ] = set()
+		accountOrderIds.add( orderId )
+		return slot
+
+	def removeSlot(self, slot):
+		orderId = self.orderIds[ slot ]
+		accountId = self.accountIds[ slot ]
+		del self.slotsByOrderId[ orderId ]
+		self.orderIds[ slot ] = OrderSlab.EMPTY_SLOT
+		self.accountIds[ slot ] = None
+		self.orders[ slot ] = None
+		self.freeSlots.append( slot )
+
+		accountOrderIds = self.accountOrderIds[ accountId ]
+		accountOrderIds.discard( orderId )
+		if not accountOrderIds:
+			del self.accountOrderIds[ accountId ]
+
+	def getOrderIdsForAccount(self, accountId):
+		return self.accountOrderIds.get( accountId, () )
+
+	def iterSlots(self):
+		# Live slots in order id order
+		for orderId in sorted ( self.slotsByOrderId ):
+			yield self.slotsByOrderId[ orderId ]
+
+	def clear(self):
+		self.__init__( self.capacity )
+
+class TestOrderSlab():
+
+	@staticmethod
+	def testOrderSlab():
+		import trading.exchange.order as order
+		import trading.exchange.trade as trade
+
+		testSlab = OrderSlab( initialCapacity = 4 )
+		for orderId in range ( 1, 5 ):
+			testSlab.addOrder( order.Order( "AA", trade.TradeActions.Buy, order.OrderTypes.Limit, 10, orderId, 7, orderId ), 1000 )
+		assert ( len ( testSlab ) == 4 and testSlab.capacity == 4 )
+		testSlab.nextSlots[ testSlab.getSlot( 1 ) ] = testSlab.getSlot( 3 )
+		testSlab.prevSlots[ testSlab.getSlot( 3 ) ] = testSlab.getSlot( 1 )
+
+		# Freed slots are reused even while an older order is still live
+		testSlab.removeSlot( testSlab.getSlot( 2 ) )
+		testSlab.removeSlot( testSlab.getSlot( 4 ) )
+		testSlab.addOrder( order.Order( "AA", trade.TradeActions.Sell, order.OrderTypes.Limit, 11, 5, 7, 5 ), 1100 )
+		testSlab.addOrder( order.Order( "AA", trade.TradeActions.Sell, order.OrderTypes.Limit, 11, 6, 7, 6 ), 1100 )
+		assert ( testSlab.capacity == 4 and 2 not in testSlab and 4 not in testSlab )
+		testSlab.addOrder( order.Order( "AA", trade.TradeActions.Sell, order.OrderTypes.Limit, 11, 7, 7, 7 ), 1100 )
+		assert ( testSlab.capacity == 8 )
+
+		# Queue links survive growing the slab
+		assert ( testSlab.nextSlots[ testSlab.getSlot( 1 ) ] == testSlab.getSlot( 3 ) )
+		assert ( testSlab.prevSlots[ testSlab.getSlot( 3 ) ] == testSlab.getSlot( 1 ) )
+		assert ( testSlab.qtys[ testSlab.getSlot( 3 ) ] == 3 and testSlab.priceTicks[ testSlab.getSlot( 6 ) ] == 1100 )
+		assert ( [ testSlab.orderIds[ s ] for s in testSlab.iterSlots() ] == [ 1, 3, 5, 6, 7 ] )
+
+		assert ( testSlab.getOrderIdsForAccount( 7 ) == set ( [ 1, 3, 5, 6, 7 ] ) )
+
+		testSlab.removeSlot( testSlab.getSlot( 1 ) )
+		assert ( 1 not in testSlab and 3 in testSlab )
+		assert ( testSlab.getOrderIdsForAccount( 7 ) == set ( [ 3, 5, 6, 7 ] ) and testSlab.getOrderIdsForAccount( 8 ) == () )
+
+		# One old resting order does not make the slab grow with every order submitted after it
+		for orderId in xrange ( 100, 100000 ):
+			slot = testSlab.addOrder( order.Order( "AA", trade.TradeActions.Sell, order.OrderTypes.Limit, 11, 1, 7, orderId ), 1100 )
+			testSlab.removeSlot( slot )
+		assert ( testSlab.capacity == 8 and len ( testSlab ) == 4 )
+
+		# Account ids do not have to be integers
+		testSlab.addOrder( order.Order( "AA", trade.TradeActions.Buy, order.OrderTypes.Limit, 10, 1, "ACME", 100000 ), 1000 )
+		assert ( testSlab.getOrderIdsForAccount( "ACME" ) == set ( [ 100000 ] ) and testSlab.accountIds[ testSlab.getSlot( 100000 ) ] == "ACME" )
+
+if __name__ == "__main__":
+
+	logger.MyLogger.InitializeLogger()
+	TestOrderSlab.testOrderSlab()
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+import logger.logger as logger
+import collections
+import threading
+import time
+
+class BackpressurePolicies():
+	Block = 0 # The matching thread waits for room, only for participants that are trusted to keep up
+	DropOldest = 1 # The oldest waiting message is dropped and counted
+	Conflate = 2 # A message replaces the waiting message with the same conflation key, e.g. only the latest price is kept
+
+	def __init__(self):
+		pass
+
+class ParticipantQueue():
+
+	"""
+	This class is the bounded queue of messages for one participant of the ExchangeGateway, the listener_dispatcher queues
+	listener calls with it too.  Gateway messages are ( messageType, requestId, value ) where value is the exchange order
+	id of an Ack or cancel, the reason of a Reject and the Trade of a Fill.  When the
+	queue is full the policy decides whether the matching thread waits ( Block ) or the oldest message is dropped
+	( DropOldest ), so a participant that does not keep up only delays matching if it was connected with Block.  With
+	Conflate a message replaces the waiting message that has the same conflationKey( message ), all messages share one
+	key when conflationKey is None, and the oldest is dropped when the queue is full of other keys.
+	"""
+
+	def __init__(self, maxSize = 1024, policy = BackpressurePolicies.DropOldest, conflationKey = None):
+		self.maxSize = maxSize
+		self.policy = policy
+		self.conflationKey = conflationKey
+		self.messages = collections.deque() # Conflation keys in arrival order for Conflate
+		self.conflatedMessages = {} # Conflation key -> waiting message, Conflate only
+		self.condition = threading.Condition()
+		self.droppedCount = 0
+		self.conflatedCount = 0
+		self.closed = False
+
+	def __len__(self):
+		return len ( self.messages )
+
+	def popMessage(self):
+		# Called with the condition held
+		if self.policy == BackpressurePolicies.Conflate:
+			return self.conflatedMessages.pop( self.messages.popleft() )
+		return self.messages.popleft()
+
+	def put(self, message):
+		with self.condition:
+			if self.policy == BackpressurePolicies.Conflate:
+				key = self.conflationKey( message ) if self.conflationKey is not None else None
+				if key in self.conflatedMessages:
+					self.conflatedMessages[ key ] = message
+					self.conflatedCount += 1
+					return
+				if len ( self.messages ) >= self.maxSize:
+					self.popMessage()
+					self.droppedCount += 1
+				self.conflatedMessages[ key ] = message
+				message = key
+			elif len ( self.messages ) >= self.maxSize:
+				if self.policy == BackpressurePolicies.Block:
+					while len ( self.messages ) >= self.maxSize and not self.closed:
+						self.condition.wait()
+				else:
+					self.messages.popleft()
+					self.droppedCount += 1
+			self.messages.append( message )
+			self.condition.notify_all()
+
+	def get(self, timeout = None):
+		# Next message, None if there is none within timeout
+		with self.condition:
+			if not self.messages and timeout != 0:
+				deadline = None if timeout is None else time.time() + timeout
+				while not self.messages and not self.closed:
+					remaining = None if deadline is None else deadline - time.time()
+					if remaining is not None and remaining <= 0:
+						break
+					self.condition.wait( remaining )
+			if not self.messages:
+				return None
+			message = self.popMessage()
+			self.condition.notify_all()
+			return message
+
+	def getAll(self):
+		# Every waiting message without waiting
+		with self.condition:
+			messages = [ self.popMessage() for i in xrange ( 0, len ( self.messages ) ) ]
+			self.condition.notify_all()
+			return messages
+
+	def close(self):
+		with self.condition:
+			self.closed = True
+			self.condition.notify_all()
+
+class TestParticipantQueue():
+
+	@staticmethod
+	def testParticipantQueue():
+		dropQueue = ParticipantQueue( maxSize = 2 )
+		for i in range ( 0, 5 ):
+			dropQueue.put( i )
+		assert ( dropQueue.getAll() == [ 3, 4 ] and dropQueue.droppedCount == 3 and dropQueue.get( timeout = 0 ) is None )
+
+		# A blocked put continues once the participant reads
+		blockQueue = ParticipantQueue( maxSize = 1, policy = BackpressurePolicies.Block )
+		blockQueue.put( 1 )
+		writer = threading.Thread( target = blockQueue.put, args = ( 2, ) )
+		writer.start()
+		writer.join( .05 )
+		assert ( writer.is_alive() and len ( blockQueue ) == 1 )
+		assert ( blockQueue.get() == 1 and blockQueue.get( timeout = 1 ) == 2 )
+		writer.join()
+
+		# Only the latest message of each key is delivered, in the order the keys first arrived
+		conflateQueue = ParticipantQueue( maxSize = 2, policy = BackpressurePolicies.Conflate, conflationKey = lambda message : message[0] )
+		for message in [ ( 'a', 1 ), ( 'b', 1 ), ( 'a', 2 ), ( 'b', 2 ), ( 'a', 3 ) ]:
+			conflateQueue.put( message )
+		assert ( conflateQueue.getAll() == [ ( 'a', 3 ), ( 'b', 2 ) ] and conflateQueue.conflatedCount == 3 )
+		conflateQueue.put( ( 'a', 4 ) )
+		conflateQueue.put( ( 'b', 3 ) )
+		conflateQueue.put( ( 'c', 1 ) )
+		assert ( conflateQueue.droppedCount == 1 and conflateQueue.get() == ( 'b', 3 ) and conflateQueue.get() == ( 'c', 1 ) )
+
+if __name__ == "__main__":
+
+	logger.MyLogger.InitializeLogger()
+	TestParticipantQueue.testParticipantQueue()
@@ -3,7 +3,10 @@
 import logging
 import logger.logger as logger
 
-class Quote():
+class Quote( object ):
+
+	__slots__ = ( 'symbol', 'bid', 'ask', 'bidsz', 'asksz' )
+
 	def __init__(self, symbol, bid, ask, bidsz, asksz):
 		self.symbol = symbol
 		self.bid = bid
@@ -21,8 +24,11 @@ class Quote():
 		else: 
 			return True 
 
+	def __ne__(self, other):
+		return not self.__eq__( other )
+
 	def __str__(self): 
-		return str ( vars(self) )
+		return str ( dict ( ( key, getattr( self, key ) ) for key in self.__slots__ ) )
 
 class TestQuote():
 
@@ -0,0 +1,169 @@
+#!/usr/bin/python
+
+import logger.logger as logger
+import logging
+import numpy
+import fcntl
+import os
+
+class ResultCache( object ):
+
+	"""
+	This class stores the NumPy arrays of a run on disk under a key, typically a content hash of everything the run depends
+	on ( see BacktestSpec.getFingerprint ).  Each entry is one .npz file written to a temporary file and renamed into place
+	so a reader never sees a partial entry.  Reads take a shared lock and writes an exclusive lock on a lock file in the
+	directory, which makes the cache safe to use from several processes on one machine.  The modification time of an entry
+	is its last use, when the entries grow past maxBytes the least recently used ones are removed.  The object only holds
+	the directory and size cap so it can be pickled and sent to worker processes.
+	"""
+
+	FILE_EXTENSION = '.npz'
+	LOCK_FILE_NAME = '.lock'
+
+	def __init__(self, directory, maxBytes = 1 << 30):
+		self.directory = directory
+		self.maxBytes = maxBytes
+		self.hits = 0 # Counters of this process only
+		self.misses = 0
+		self.logger = logging.getLogger('MyLogger')
+		if not os.path.isdir( directory ):
+			try:
+				os.makedirs( directory )
+			except OSError: # Created by another process in the meantime
+				if not os.path.isdir( directory ):
+					raise
+
+	def __getstate__(self):
+		return ( self.directory, self.maxBytes )
+
+	def __setstate__(self, state):
+		self.__init__( *state )
+
+	def __str__(self):
+		return "ResultCache directory:[%s] maxBytes:[%s] hits:[%s] misses:[%s]" % ( self.directory, self.maxBytes, self.hits, self.misses )
+
+	def getFileName(self, key):
+		return os.path.join( self.directory, key + ResultCache.FILE_EXTENSION )
+
+	def lock(self, lockType):
+		# Returns the open lock file, closing it releases the lock
+		lockFile = open( os.path.join( self.directory, ResultCache.LOCK_FILE_NAME ), 'a' )
+		fcntl.flock( lockFile.fileno(), lockType )
+		return lockFile
+
+	def get(self, key):
+		# Dict of the arrays stored under key or None, a hit marks the entry as most recently used
+		fileName = self.getFileName( key )
+		lockFile = self.lock( fcntl.LOCK_SH )
+		try:
+			if not os.path.exists( fileName ):
+				self.misses += 1
+				return None
+			with numpy.load( fileName ) as entry:
+				arrays = dict ( ( name, entry[ name ] ) for name in entry.files )
+			os.utime( fileName, None )
+		finally:
+			lockFile.close()
+
+		self.hits += 1
+		self.logger.info( "Result cache hit key:[%s]" % ( key ) )
+		return arrays
+
+	def put(self, key, arrays):
+		fileName = self.getFileName( key )
+		temporaryFileName = "%s.%s.tmp" % ( fileName, os.getpid() )
+		with open( temporaryFileName, 'wb' ) as temporaryFile:
+			numpy.savez( temporaryFile, **arrays )
+
+		lockFile = self.lock( fcntl.LOCK_EX )
+		try:
+			os.rename( temporaryFile.name, fileName )
+			self.evict( keepFileName = fileName )
+		finally:
+			lockFile.close()
+		self.logger.info( "Result cache stored key:[%s]" % ( key ) )
+
+	def getEntries(self):
+		# ( last use, bytes, file name ) of every entry, least recently used first
+		entries = []
+		for name in os.listdir( self.directory ):
+			if not name.endswith( ResultCache.FILE_EXTENSION ):
+				continue
+			fileName = os.path.join( self.directory, name )
+			try:
+				fileStat = os.stat( fileName )
+			except OSError:
+				continue
+			entries.append( ( fileStat.st_mtime, fileStat.st_size, fileName ) )
+		entries.sort()
+		return entries
+
+	def getTotalBytes(self):
+		return sum ( entryBytes for lastUse, entryBytes, fileName in self.getEntries() )
+
+	def evict(self, keepFileName = None):
+		# Called with the exclusive lock held, removes least recently used entries until the cache fits in maxBytes
+		entries = self.getEntries()
+		totalBytes = sum ( entryBytes for lastUse, entryBytes, fileName in entries )
+		for lastUse, entryBytes, fileName in entries:
+			if totalBytes <= self.maxBytes:
+				break
+			if fileName == keepFileName:
+				continue
+			self.logger.info( "Result cache evicting fileName:[%s] bytes:[%s]" % ( fileName, entryBytes ) )
+			os.remove( fileName )
+			totalBytes -= entryBytes
+
+	def clear(self):
+		lockFile = self.lock( fcntl.LOCK_EX )
+		try:
+			for lastUse, entryBytes, fileName in self.getEntries():
+				os.remove( fileName )
+		finally:
+			lockFile.close()
+
+class TestResultCache():
+
+	@staticmethod
+	def putEntry( testCache, key, size ):
+		testCache.put( key, { 'price' : numpy.arange( size, dtype = numpy.float64 ), 'side' : numpy.zeros( size, numpy.int8 ) } )
+
+	@staticmethod
+	def testResultCache():
+		import tempfile
+		import shutil
+		import time
+		import pickle
+
+		directory = tempfile.mkdtemp()
+		try:
+			testCache = ResultCache( directory + '/cache' )
+			assert ( testCache.get( 'a' ) is None and testCache.misses == 1 )
+			TestResultCache.putEntry( testCache, 'a', 10 )
+			arrays = testCache.get( 'a' )
+			assert ( arrays['price'].tolist() == range ( 0, 10 ) and arrays['side'].dtype == numpy.int8 and testCache.hits == 1 )
+			assert ( [ name for name in os.listdir( testCache.directory ) if name.endswith( '.tmp' ) ] == [] )
+
+			# Entries over the size cap are evicted least recently used first
+			entryBytes = testCache.getTotalBytes()
+			testCache.maxBytes = 2 * entryBytes
+			os.utime( testCache.getFileName( 'a' ), ( time.time() - 20, time.time() - 20 ) )
+			TestResultCache.putEntry( testCache, 'b', 10 )
+			os.utime( testCache.getFileName( 'b' ), ( time.time() - 10, time.time() - 10 ) )
+			assert ( testCache.get( 'a' ) is not None ) # Now the most recently used
+			TestResultCache.putEntry( testCache, 'c', 10 )
+			assert ( testCache.get( 'b' ) is None and testCache.get( 'a' ) is not None and testCache.get( 'c' ) is not None )
+			assert ( testCache.getTotalBytes() <= testCache.maxBytes )
+
+			# Only the directory and size cap are pickled for worker processes
+			workerCache = pickle.loads( pickle.dumps( testCache ) )
+			assert ( workerCache.directory == testCache.directory and workerCache.hits == 0 )
+			workerCache.clear()
+			assert ( testCache.get( 'a' ) is None )
+		finally:
+			shutil.rmtree( directory )
+
+if __name__ == "__main__":
+
+	logger.MyLogger.InitializeLogger()
+	TestResultCache.testResultCache()
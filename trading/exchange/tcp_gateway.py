@@ -0,0 +1,481 @@
+#!/usr/bin/python
+
+import trading.exchange.exchange_account as exchange_account
+import trading.exchange.order as order
+import trading.exchange.trade as trade
+import logger.logger as logger
+import logging
+import numpy
+import socket
+import select
+import struct
+import errno
+import time
+
+class MessageTypes():
+	Logon = 1 # orderId field holds the accountId of the connection
+	NewOrder = 2
+	Cancel = 3
+	Ack = 4
+	Reject = 5
+	Fill = 6
+	CancelAck = 7
+
+	def __init__(self):
+		pass
+
+class RejectReasons():
+	InvalidOrder = 1
+	UnknownOrder = 2
+	NotLoggedOn = 3
+	AccountInUse = 4
+	AlreadyLoggedOn = 5
+
+	def __init__(self):
+		pass
+
+# Every message has the same size : ( messageType, tradeAction, orderType, reason, clientOrderId, orderId, price, qty )
+MESSAGE = struct.Struct( '<BBBB4xqqdd' )
+
+class GatewayConnection():
+
+	"""
+	State of one client connection of the TcpGateway, bytes read that do not yet form a whole message and the messages
+	waiting to be written.
+	"""
+
+	def __init__(self, clientSocket, address):
+		self.socket = clientSocket
+		self.address = address
+		self.accountId = None
+		self.readBuffer = bytearray()
+		self.writeBuffer = bytearray()
+
+	def __str__(self):
+		return "GatewayConnection address:[%s] accountId:[%s]" % ( self.address, self.accountId )
+
+	def sendMessage(self, messageType, tradeAction = 0, orderType = 0, reason = 0, clientOrderId = 0, orderId = 0, price = 0.0, qty = 0.0):
+		self.writeBuffer += MESSAGE.pack( messageType, tradeAction, orderType, reason, clientOrderId, orderId, price, qty )
+
+class TcpGateway():
+
+	"""
+	This class is a TCP order entry gateway in front of an Exchange using the fixed size binary MESSAGE.  One thread polls
+	every connection, it parses all the whole messages of each read and matches the new orders of all connections of a
+	poll round with one submitOrders call, cancels are applied between runs of new orders in arrival order.  Acks,
+	rejects and fills are added to the write buffer of their connection and each connection is written once per round.
+	A connection first sends a Logon with its accountId, only one connection per account is accepted.  When a connection
+	closes every open order of its account is canceled.  A client that does not read its messages is disconnected once
+	more than maxWriteBufferBytes are waiting to be written to it.
+	"""
+
+	READ_SIZE = 1 << 16
+	POLL_MILLISECONDS = 50
+	MAX_WRITE_BUFFER_BYTES = 1 << 22
+
+	def __init__(self, exchange, host = '127.0.0.1', port = 0, maxWriteBufferBytes = MAX_WRITE_BUFFER_BYTES):
+		self.exchange = exchange
+		self.maxWriteBufferBytes = maxWriteBufferBytes
+		self.listenSocket = socket.socket( socket.AF_INET, socket.SOCK_STREAM )
+		self.listenSocket.setsockopt( socket.SOL_SOCKET, socket.SO_REUSEADDR, 1 )
+		self.listenSocket.bind( ( host, port ) )
+		self.listenSocket.listen( 128 )
+		self.listenSocket.setblocking( False )
+		self.address = self.listenSocket.getsockname()
+		self.poller = select.poll()
+		self.poller.register( self.listenSocket.fileno(), select.POLLIN )
+		self.connections = {} # File descriptor -> GatewayConnection
+		self.accountConnections = {} # accountId -> GatewayConnection
+		self.listenedAccountIds = set()
+		self.orderOwners = {} # Exchange orderId -> ( GatewayConnection, clientOrderId ) of orders that can still fill
+		self.pendingOrders = [] # ( GatewayConnection, clientOrderId, Order ) read this round
+		self.pendingTrades = []
+		self.running = False
+		self.logger = logging.getLogger('MyLogger')
+		self.logger.info( "TCP gateway listening on address:[%s] symbol:[%s]" % ( self.address, exchange.symbol ) )
+
+	def acceptConnections(self):
+		while True:
+			try:
+				clientSocket, address = self.listenSocket.accept()
+			except socket.error as ex:
+				if ex.args[0] in ( errno.EAGAIN, errno.EWOULDBLOCK ):
+					return
+				raise
+			clientSocket.setblocking( False )
+			clientSocket.setsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 )
+			self.connections[ clientSocket.fileno() ] = GatewayConnection( clientSocket, address )
+			self.poller.register( clientSocket.fileno(), select.POLLIN )
+			self.logger.info( "Accepted gateway connection address:[%s]" % ( address, ) )
+
+	def closeConnection(self, connection):
+		self.logger.info( "Closing gateway connection:[%s]" % ( connection ) )
+		self.poller.unregister( connection.socket.fileno() )
+		del self.connections[ connection.socket.fileno() ]
+		connection.socket.close()
+		del connection.writeBuffer[:]
+		self.pendingOrders = [ pendingOrder for pendingOrder in self.pendingOrders if pendingOrder[0] is not connection ]
+		if connection.accountId is not None and self.accountConnections.get( connection.accountId ) is connection:
+			del self.accountConnections[ connection.accountId ]
+			for orderId in self.exchange.cancelAllOrdersForAccount( connection.accountId ):
+				self.orderOwners.pop( orderId, None )
+
+	def readConnection(self, connection):
+		try:
+			data = connection.socket.recv( TcpGateway.READ_SIZE )
+		except socket.error as ex:
+			if ex.args[0] in ( errno.EAGAIN, errno.EWOULDBLOCK ):
+				return True
+			data = None
+		if not data:
+			self.closeConnection( connection )
+			return False
+
+		readBuffer = connection.readBuffer
+		readBuffer += data
+		messageCount = len ( readBuffer ) // MESSAGE.size
+		for i in xrange ( 0, messageCount ):
+			self.handleMessage( connection, *MESSAGE.unpack_from( readBuffer, i * MESSAGE.size ) )
+		del readBuffer[ : messageCount * MESSAGE.size ]
+		return True
+
+	def handleMessage(self, connection, messageType, tradeAction, orderType, reason, clientOrderId, orderId, price, qty):
+		if messageType == MessageTypes.Logon:
+			if connection.accountId is not None:
+				connection.sendMessage( MessageTypes.Reject, reason = RejectReasons.AlreadyLoggedOn, clientOrderId = clientOrderId, orderId = orderId )
+				return
+			if orderId in self.accountConnections:
+				connection.sendMessage( MessageTypes.Reject, reason = RejectReasons.AccountInUse, clientOrderId = clientOrderId )
+				return
+			connection.accountId = orderId
+			self.accountConnections[ orderId ] = connection
+			if orderId not in self.listenedAccountIds:
+				self.listenedAccountIds.add( orderId )
+				self.exchange.registerTradesListener( exchange_account.ExchangeAccount( orderId ), self.pendingTrades.extend )
+			connection.sendMessage( MessageTypes.Ack, clientOrderId = clientOrderId, orderId = orderId )
+		elif connection.accountId is None:
+			connection.sendMessage( MessageTypes.Reject, tradeAction, orderType, RejectReasons.NotLoggedOn, clientOrderId, orderId )
+		elif messageType == MessageTypes.NewOrder:
+			price = price if orderType == order.OrderTypes.Limit else None
+			self.pendingOrders.append( ( connection, clientOrderId, order.Order( self.exchange.symbol, tradeAction, orderType, price, qty, connection.accountId ) ) )
+		elif messageType == MessageTypes.Cancel:
+			self.submitPendingOrders()
+			self.cancelOrder( connection, clientOrderId, orderId )
+		else:
+			self.logger.warning( "Failed to handle gateway message type:[%s] connection:[%s]" % ( messageType, connection ) )
+			connection.sendMessage( MessageTypes.Reject, tradeAction, orderType, RejectReasons.InvalidOrder, clientOrderId, orderId )
+
+	def cancelOrder(self, connection, clientOrderId, orderId):
+		owner = self.orderOwners.get( orderId )
+		if owner is None or owner[0].accountId != connection.accountId:
+			connection.sendMessage( MessageTypes.Reject, reason = RejectReasons.UnknownOrder, clientOrderId = clientOrderId, orderId = orderId )
+			return
+		self.exchange.cancelOrder( orderId )
+		del self.orderOwners[ orderId ]
+		connection.sendMessage( MessageTypes.CancelAck, clientOrderId = clientOrderId, orderId = orderId )
+
+	def submitPendingOrders(self):
+		pendingOrders = self.pendingOrders
+		if not pendingOrders:
+			return
+		self.pendingOrders = []
+
+		results = self.exchange.submitOrders( [ currentOrder for connection, clientOrderId, currentOrder in pendingOrders ] )
+		for ( connection, clientOrderId, currentOrder ), ( accepted, result ) in zip ( pendingOrders, results ):
+			if accepted:
+				self.orderOwners[ result ] = ( connection, clientOrderId )
+				connection.sendMessage( MessageTypes.Ack, currentOrder.getTradeAction(), currentOrder.getOrderType(), 0, clientOrderId, result, currentOrder.getPrice() or 0.0, currentOrder.originalQty )
+			else:
+				connection.sendMessage( MessageTypes.Reject, currentOrder.getTradeAction(), currentOrder.getOrderType(), RejectReasons.InvalidOrder, clientOrderId, 0, currentOrder.getPrice() or 0.0, currentOrder.originalQty )
+
+		# Fills are published by the exchange before submitOrders returns, they are sent after the acks
+		trades = self.pendingTrades[:]
+		del self.pendingTrades[:]
+		for exchangeTrade in trades:
+			owner = self.orderOwners.get( exchangeTrade.orderId )
+			if owner is not None:
+				owner[0].sendMessage( MessageTypes.Fill, exchangeTrade.tradeAction, 0, 0, owner[1], exchangeTrade.orderId, exchangeTrade.tradePrice, exchangeTrade.qty )
+		for exchangeTrade in trades:
+			if exchangeTrade.orderId in self.orderOwners and self.exchange.orderBook.getOpenOrderInfo( exchangeTrade.orderId ) is None:
+				del self.orderOwners[ exchangeTrade.orderId ]
+		for connection, clientOrderId, currentOrder in pendingOrders:
+			if currentOrder.getOrderType() == order.OrderTypes.Market:
+				self.orderOwners.pop( currentOrder.getOrderId(), None )
+
+	def writeConnection(self, connection):
+		try:
+			sent = connection.socket.send( connection.writeBuffer )
+		except socket.error as ex:
+			if ex.args[0] in ( errno.EAGAIN, errno.EWOULDBLOCK ):
+				sent = 0
+			else:
+				self.closeConnection( connection )
+				return
+		del connection.writeBuffer[ : sent ]
+		if len ( connection.writeBuffer ) > self.maxWriteBufferBytes:
+			self.logger.warning( "Disconnecting slow gateway connection, write buffer bytes:[%s] connection:[%s]" % ( len ( connection.writeBuffer ), connection ) )
+			self.closeConnection( connection )
+			return
+		self.poller.modify( connection.socket.fileno(), select.POLLIN | ( select.POLLOUT if connection.writeBuffer else 0 ) )
+
+	def pollOnce(self, timeoutMilliseconds = POLL_MILLISECONDS):
+		for fileDescriptor, event in self.poller.poll( timeoutMilliseconds ):
+			if fileDescriptor == self.listenSocket.fileno():
+				self.acceptConnections()
+				continue
+			connection = self.connections.get( fileDescriptor )
+			if connection is None:
+				continue
+			if event & ( select.POLLIN | select.POLLHUP | select.POLLERR ):
+				if not self.readConnection( connection ):
+					continue
+			if event & select.POLLOUT:
+				self.writeConnection( connection )
+
+		self.submitPendingOrders()
+		for connection in self.connections.values():
+			if connection.writeBuffer:
+				self.writeConnection( connection )
+
+	def serveForever(self):
+		self.running = True
+		while self.running:
+			self.pollOnce()
+		for connection in self.connections.values():
+			self.closeConnection( connection )
+		self.poller.unregister( self.listenSocket.fileno() )
+		self.listenSocket.close()
+
+	def stop(self):
+		# Can be called from another thread, the loop exits within POLL_MILLISECONDS
+		self.running = False
+
+class TcpGatewayClient():
+
+	"""
+	Blocking client of the TcpGateway, used by the tests.  See TcpLoadGenerator for the pipelined client.
+	"""
+
+	def __init__(self, address, accountId):
+		self.socket = socket.create_connection( address )
+		self.socket.setsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 )
+		self.readBuffer = bytearray()
+		self.send( MessageTypes.Logon, orderId = accountId )
+
+	def send(self, messageType, tradeAction = 0, orderType = 0, clientOrderId = 0, orderId = 0, price = 0.0, qty = 0.0):
+		self.socket.sendall( MESSAGE.pack( messageType, tradeAction, orderType, 0, clientOrderId, orderId, price, qty ) )
+
+	def receive(self):
+		while len ( self.readBuffer ) < MESSAGE.size:
+			data = self.socket.recv( TcpGateway.READ_SIZE )
+			if not data:
+				return None
+			self.readBuffer += data
+		message = MESSAGE.unpack_from( self.readBuffer )
+		del self.readBuffer[ : MESSAGE.size ]
+		return message
+
+	def close(self):
+		self.socket.close()
+
+class TcpLoadGenerator():
+
+	"""
+	This class measures a TcpGateway over loopback.  Each of numberOfClients connections keeps up to window orders in
+	flight, alternating buy and sell limit orders around 100 so about half of them trade.  The round trip latency is the
+	time from writing an order to reading its Ack or Reject.  run returns orders per second and the latency percentiles
+	in microseconds.
+	"""
+
+	def __init__(self, address, numberOfClients = 4, ordersPerClient = 10000, window = 32, firstAccountId = 1):
+		self.address = address
+		self.numberOfClients = numberOfClients
+		self.ordersPerClient = ordersPerClient
+		self.window = window
+		self.firstAccountId = firstAccountId
+		self.logger = logging.getLogger('MyLogger')
+
+	def run(self):
+		clients = []
+		poller = select.poll()
+		for i in range ( 0, self.numberOfClients ):
+			client = TcpGatewayClient( self.address, self.firstAccountId + i )
+			if client.receive()[0] != MessageTypes.Ack:
+				raise Exception( 'Logon rejected by the gateway' )
+			client.socket.setblocking( False )
+			client.sent = 0
+			client.acked = 0
+			client.sendTimes = {}
+			clients.append( client )
+			poller.register( client.socket.fileno(), select.POLLIN )
+		clientsByFileDescriptor = dict ( ( client.socket.fileno(), client ) for client in clients )
+
+		latencies = []
+		fills = 0
+		totalOrders = self.numberOfClients * self.ordersPerClient
+		startTime = time.time()
+		while len ( latencies ) < totalOrders:
+			for client in clients:
+				messages = bytearray()
+				while client.sent < self.ordersPerClient and client.sent - client.acked < self.window:
+					client.sent += 1
+					i = client.sent
+					tradeAction = trade.TradeActions.Buy if i % 2 == 0 else trade.TradeActions.Sell
+					price = 100 + ( ( i % 7 ) - 3 if tradeAction == trade.TradeActions.Buy else ( i % 11 ) - 5 ) * .01
+					messages += MESSAGE.pack( MessageTypes.NewOrder, tradeAction, order.OrderTypes.Limit, 0, i, 0, round ( price, 2 ), 10 )
+					client.sendTimes[ i ] = time.time()
+				if messages:
+					client.socket.setblocking( True )
+					client.socket.sendall( messages )
+					client.socket.setblocking( False )
+
+			for fileDescriptor, event in poller.poll( 1000 ):
+				client = clientsByFileDescriptor[ fileDescriptor ]
+				data = client.socket.recv( TcpGateway.READ_SIZE )
+				if not data:
+					raise Exception( 'Gateway closed the connection' )
+				client.readBuffer += data
+				now = time.time()
+				messageCount = len ( client.readBuffer ) // MESSAGE.size
+				for j in xrange ( 0, messageCount ):
+					message = MESSAGE.unpack_from( client.readBuffer, j * MESSAGE.size )
+					if message[0] in ( MessageTypes.Ack, MessageTypes.Reject ):
+						latencies.append( now - client.sendTimes.pop( message[4] ) )
+						client.acked += 1
+					elif message[0] == MessageTypes.Fill:
+						fills += 1
+				del client.readBuffer[ : messageCount * MESSAGE.size ]
+		seconds = time.time() - startTime
+
+		for client in clients:
+			client.close()
+		latencies = numpy.array( latencies ) * 1e6
+		results = { 'orders' : totalOrders, 'fills' : fills, 'seconds' : seconds, 'ordersPerSecond' : totalOrders / seconds }
+		for percentile in ( 50, 90, 99 ):
+			results[ 'p%s' % ( percentile ) ] = float ( numpy.percentile( latencies, percentile ) )
+		results['max'] = float ( latencies.max() )
+		self.logger.info( "Load generator results:[%s]" % ( results ) )
+		return results
+
+class TestTcpGateway():
+
+	@staticmethod
+	def startGateway( **kwargs ):
+		import trading.exchange.exchange as exchange
+		import threading
+
+		gateway = TcpGateway( exchange.Exchange( "AA" ), **kwargs )
+		gatewayThread = threading.Thread( target = gateway.serveForever )
+		gatewayThread.daemon = True
+		gatewayThread.start()
+		return ( gateway, gatewayThread )
+
+	@staticmethod
+	def testTcpGateway():
+		gateway, gatewayThread = TestTcpGateway.startGateway()
+		try:
+			seller = TcpGatewayClient( gateway.address, 1 )
+			assert ( seller.receive()[0] == MessageTypes.Ack )
+			assert ( TcpGatewayClient( gateway.address, 1 ).receive()[3] == RejectReasons.AccountInUse )
+
+			# Several messages in one write
+			seller.socket.sendall( MESSAGE.pack( MessageTypes.NewOrder, trade.TradeActions.Sell, order.OrderTypes.Limit, 0, 1, 0, 10.0, 5 ) +
+				MESSAGE.pack( MessageTypes.NewOrder, trade.TradeActions.Sell, order.OrderTypes.Limit, 0, 2, 0, 10.5, 5 ) +
+				MESSAGE.pack( MessageTypes.NewOrder, trade.TradeActions.Sell, order.OrderTypes.Limit, 0, 3, 0, -1.0, 5 ) )
+			acks = [ seller.receive() for i in range ( 0, 3 ) ]
+			assert ( [ ( message[0], message[4] ) for message in acks ] == [ ( MessageTypes.Ack, 1 ), ( MessageTypes.Ack, 2 ), ( MessageTypes.Reject, 3 ) ] )
+
+			buyer = TcpGatewayClient( gateway.address, 2 )
+			buyer.receive()
+			buyer.send( MessageTypes.NewOrder, trade.TradeActions.Buy, order.OrderTypes.Market, 7, qty = 3 )
+			buyerAck = buyer.receive()
+			buyerFill = buyer.receive()
+			assert ( buyerAck[0] == MessageTypes.Ack and buyerAck[4] == 7 )
+			assert ( buyerFill[0] == MessageTypes.Fill and buyerFill[4] == 7 and buyerFill[5] == buyerAck[5] and buyerFill[6 : ] == ( 10.0, 3 ) )
+			fill = seller.receive()
+			assert ( fill[0] == MessageTypes.Fill and fill[4] == 1 and fill[5] == acks[0][5] and fill[7] == 3 )
+
+			# Cancels only for the account's own orders
+			buyer.send( MessageTypes.Cancel, clientOrderId = 8, orderId = acks[1][5] )
+			assert ( buyer.receive()[ : 6 : 3 ] == ( MessageTypes.Reject, RejectReasons.UnknownOrder ) )
+			seller.send( MessageTypes.Cancel, clientOrderId = 4, orderId = acks[1][5] )
+			assert ( seller.receive()[0] == MessageTypes.CancelAck )
+
+			# Disconnecting cancels the remaining orders of the account
+			assert ( gateway.exchange.orderBook.getTopOfBook().asksz == 2 )
+			seller.close()
+			deadline = time.time() + 5
+			while gateway.exchange.orderBook.getLowestAskPrice() is not None and time.time() < deadline:
+				time.sleep( .01 )
+			assert ( gateway.exchange.getOpenOrderIdsForAccountId( 1 ) == [] and 1 not in gateway.accountConnections )
+			buyer.close()
+		finally:
+			gateway.stop()
+			gatewayThread.join()
+
+	@staticmethod
+	def testInvalidMessages():
+		gateway, gatewayThread = TestTcpGateway.startGateway()
+		try:
+			client = TcpGatewayClient( gateway.address, 1 )
+			assert ( client.receive()[0] == MessageTypes.Ack )
+
+			# A second Logon on the same connection does not take over another account
+			client.send( MessageTypes.Logon, clientOrderId = 1, orderId = 2 )
+			assert ( client.receive()[ : 6 : 3 ] == ( MessageTypes.Reject, RejectReasons.AlreadyLoggedOn ) )
+			otherClient = TcpGatewayClient( gateway.address, 2 )
+			assert ( otherClient.receive()[0] == MessageTypes.Ack and gateway.accountConnections[1].accountId == 1 )
+
+			for price, qty in ( ( float ( 'nan' ), 5 ), ( 10.0, float ( 'nan' ) ), ( float ( 'inf' ), 5 ) ):
+				client.send( MessageTypes.NewOrder, trade.TradeActions.Buy, order.OrderTypes.Limit, 2, price = price, qty = qty )
+				assert ( client.receive()[ : 6 : 3 ] == ( MessageTypes.Reject, RejectReasons.InvalidOrder ) )
+			assert ( gateway.exchange.getOpenOrderIdsForAccountId( 1 ) == [] )
+			client.close()
+			otherClient.close()
+		finally:
+			gateway.stop()
+			gatewayThread.join()
+
+	@staticmethod
+	def testSlowClientDisconnected():
+		gateway, gatewayThread = TestTcpGateway.startGateway( maxWriteBufferBytes = 1 << 16 )
+		try:
+			# The client sends orders and never reads the acks, its small receive buffer fills up first
+			clientSocket = socket.socket( socket.AF_INET, socket.SOCK_STREAM )
+			clientSocket.setsockopt( socket.SOL_SOCKET, socket.SO_RCVBUF, 4096 )
+			clientSocket.connect( gateway.address )
+			clientSocket.sendall( MESSAGE.pack( MessageTypes.Logon, 0, 0, 0, 0, 1, 0.0, 0.0 ) )
+			assert ( MESSAGE.unpack( clientSocket.recv( MESSAGE.size, socket.MSG_WAITALL ) )[0] == MessageTypes.Ack )
+			messages = MESSAGE.pack( MessageTypes.NewOrder, trade.TradeActions.Buy, order.OrderTypes.Limit, 0, 1, 0, 50.0, 1 ) * 1000
+			deadline = time.time() + 30
+			try:
+				while 1 in gateway.accountConnections and time.time() < deadline:
+					clientSocket.sendall( messages )
+			except socket.error:
+				pass # Closed by the gateway
+			while ( gateway.connections or gateway.exchange.getOpenOrderIdsForAccountId( 1 ) ) and time.time() < deadline:
+				time.sleep( .01 )
+			assert ( 1 not in gateway.accountConnections and len ( gateway.connections ) == 0 )
+			assert ( gateway.exchange.getOpenOrderIdsForAccountId( 1 ) == [] )
+			clientSocket.close()
+		finally:
+			gateway.stop()
+			gatewayThread.join()
+
+	@staticmethod
+	def testTcpLoadGenerator():
+		gateway, gatewayThread = TestTcpGateway.startGateway()
+		try:
+			results = TcpLoadGenerator( gateway.address, numberOfClients = 3, ordersPerClient = 500, window = 16 ).run()
+			assert ( results['orders'] == 1500 and results['fills'] > 0 and results['p50'] <= results['p99'] <= results['max'] )
+		finally:
+			gateway.stop()
+			gatewayThread.join()
+
+if __name__ == "__main__":
+
+	logger.MyLogger.InitializeLogger()
+	TestTcpGateway.testTcpGateway()
+	TestTcpGateway.testInvalidMessages()
+	TestTcpGateway.testSlowClientDisconnected()
+	TestTcpGateway.testTcpLoadGenerator()
@@ -12,17 +12,11 @@ class TradeActions():
 	def __init__(self):
 		pass
 
-class Trade():
+class Trade( object ):
 
-	def __init__(self):
-		self.qty = 0 
-		self.tradeAction = TradeActions.Void 
-		self.buySellFactor = -1 
-		self.symbol = None
-		self.accountId = None 
-		self.tradeId= None 
-	
-	def __init__(self, accountId, tradeId, qty, tradePrice, tradeAction, symbol, timestamp = None, extraInfo = {}, orderId = None ):
+	__slots__ = ( 'accountId', 'tradeId', 'qty', 'tradePrice', 'tradeAction', 'buySellFactor', 'symbol', 'orderId', 'timestamp', 'fee', 'extraInfo' )
+
+	def __init__(self, accountId, tradeId, qty, tradePrice, tradeAction, symbol, timestamp = None, extraInfo = None, orderId = None, fee = 0 ):
 		self.accountId = accountId 
 		self.tradeId = tradeId 
 		self.qty = qty 
@@ -32,7 +26,8 @@ class Trade():
 		self.symbol = symbol 
 		self.orderId = orderId 
 		self.timestamp = timestamp 
-		self.extraInfo = extraInfo 
+		self.fee = fee # Transaction fee charged to accountId for this trade 
+		self.extraInfo = extraInfo # Extra info of the order that traded, None if the order did not use it 
 	
 	def setSymbol(self, symbol):
 		self.symbol = symbol 
@@ -43,6 +38,9 @@ class Trade():
 	def getTradePrice(self):
 		return self.tradePrice 
 	
+	def getFee(self):
+		return self.fee 
+	
 	def setAccountId(self, accountId):
 		self.accountId = accountId 
 
@@ -57,7 +55,7 @@ class Trade():
 		self.buySellFactor = buySellFactor 
 	
 	def __str__(self): 
-		return str ( vars(self) )
+		return str ( dict ( ( key, getattr( self, key ) ) for key in self.__slots__ ) )
 	
 	def __repr__(self): 
 		return self.__str__() 
@@ -0,0 +1,148 @@
+#!/usr/bin/python
+
+import logger.logger as logger
+import logging
+import numpy
+import os
+
+class TradeTape():
+
+	"""
+	This class records every fill of an exchange in typed columns ( tradeId, accountId, qty, price, side, fee, timestamp )
+	instead of keeping the trade objects around.  Fills are appended into preallocated NumPy arrays of chunkSize rows.  When
+	a chunk is full it is written to one .npy file per column if a directory was given, otherwise it is kept in memory.  The
+	columns are exposed as NumPy views so they can be analyzed without copying, missing timestamps are stored as NaN.
+	"""
+
+	COLUMNS = ( ( 'tradeId', numpy.int64 ), ( 'accountId', numpy.int64 ), ( 'qty', numpy.float64 ), ( 'price', numpy.float64 ),
+		( 'side', numpy.int8 ), ( 'fee', numpy.float64 ), ( 'timestamp', numpy.float64 ) )
+
+	def __init__(self, chunkSize = 1 << 16, directory = None, name = 'trades' ):
+		self.chunkSize = chunkSize
+		self.directory = directory # Full chunks are spilled to this directory when set
+		self.name = name # Prefix of the spilled chunk files
+		self.chunks = [] # Full chunks, dict of column -> array in memory or the file names of the spilled columns
+		self.chunk = None # Chunk being appended to, allocated on the first fill
+		self.count = 0 # Rows used in self.chunk
+		self.totalCount = 0
+		self.logger = logging.getLogger('MyLogger')
+
+	def __len__(self):
+		return self.totalCount
+
+	def allocateChunk(self):
+		self.chunk = dict( ( column, numpy.empty( self.chunkSize, dtype ) ) for column, dtype in TradeTape.COLUMNS )
+		self.count = 0
+
+	def append(self, tradeId, accountId, qty, price, side, fee, timestamp = None ):
+		if self.chunk is None:
+			self.allocateChunk()
+
+		chunk = self.chunk
+		i = self.count
+		chunk['tradeId'][i] = tradeId
+		chunk['accountId'][i] = accountId
+		chunk['qty'][i] = qty
+		chunk['price'][i] = price
+		chunk['side'][i] = side
+		chunk['fee'][i] = fee
+		chunk['timestamp'][i] = numpy.nan if timestamp is None else timestamp
+		self.count += 1
+		self.totalCount += 1
+
+		if self.count == self.chunkSize:
+			self.flushChunk()
+
+	def appendTrade(self, exchangeTrade):
+		self.append( exchangeTrade.tradeId, exchangeTrade.accountId, exchangeTrade.qty, exchangeTrade.tradePrice, exchangeTrade.tradeAction, exchangeTrade.fee, exchangeTrade.timestamp )
+
+	def getChunkFileName(self, chunkIndex, column):
+		return os.path.join( self.directory, "%s_%06d_%s.npy" % ( self.name, chunkIndex, column ) )
+
+	def flushChunk(self):
+		# Moves the current chunk to the full chunks, trimmed to the rows used, and writes it to disk if a directory is set
+		if self.chunk is None or self.count == 0:
+			return
+
+		chunk = dict( ( column, values[ : self.count ] ) for column, values in self.chunk.iteritems() )
+		if self.directory is not None:
+			chunkIndex = len ( self.chunks )
+			self.logger.info( "Spilling trade tape chunk:[%s] rows:[%s] to directory:[%s]" % ( chunkIndex, self.count, self.directory ) )
+			for column, values in chunk.iteritems():
+				numpy.save( self.getChunkFileName( chunkIndex, column ), values )
+				chunk[ column ] = self.getChunkFileName( chunkIndex, column )
+			self.count = 0 # Chunk arrays are reused once written
+		else:
+			self.chunk = None
+			self.count = 0
+		self.chunks.append( chunk )
+
+	def getColumns(self):
+		# Views of the rows of the chunk being appended to, no copy is made
+		if self.chunk is None:
+			return dict( ( column, numpy.empty( 0, dtype ) ) for column, dtype in TradeTape.COLUMNS )
+		return dict( ( column, values[ : self.count ] ) for column, values in self.chunk.iteritems() )
+
+	def iterChunks(self):
+		# Columns of every chunk in fill order, spilled chunks are memory mapped from their files
+		for chunk in self.chunks:
+			if self.directory is not None:
+				yield dict( ( column, numpy.load( fileName, mmap_mode = 'r' ) ) for column, fileName in chunk.iteritems() )
+			else:
+				yield chunk
+		if self.count > 0:
+			yield self.getColumns()
+
+	def getColumn(self, column):
+		# Whole column across every chunk, this is a copy when there is more than one chunk
+		values = [ chunk[ column ] for chunk in self.iterChunks() ]
+		if len ( values ) == 1:
+			return values[0]
+		return numpy.concatenate( values ) if values else numpy.empty( 0, dict( TradeTape.COLUMNS )[ column ] )
+
+	def clear(self):
+		self.__init__( self.chunkSize, self.directory, self.name )
+
+class TestTradeTape():
+
+	@staticmethod
+	def testTradeTape():
+		testTape = TradeTape( chunkSize = 4 )
+		for i in range ( 0, 10 ):
+			testTape.append( i + 1, i % 3, 10 + i, 100 + i * .01, i % 2, .5, None if i == 0 else 1000 + i )
+
+		assert ( len ( testTape ) == 10 and len ( testTape.chunks ) == 2 )
+		assert ( list ( testTape.getColumn( 'tradeId' ) ) == range ( 1, 11 ) )
+		assert ( testTape.getColumn( 'qty' ).sum() == sum ( range ( 10, 20 ) ) )
+		assert ( numpy.isnan( testTape.getColumn( 'timestamp' )[0] ) and testTape.getColumn( 'timestamp' )[9] == 1009 )
+
+		# Views of the current chunk share memory with the tape
+		columns = testTape.getColumns()
+		assert ( list ( columns['side'] ) == [ 0, 1 ] and columns['side'].base is testTape.chunk['side'] )
+
+	@staticmethod
+	def testTradeTapeSpill():
+		import tempfile
+		import shutil
+
+		directory = tempfile.mkdtemp()
+		try:
+			testTape = TradeTape( chunkSize = 3, directory = directory, name = 'AA' )
+			for i in range ( 0, 7 ):
+				testTape.append( i + 1, 7, 1, 50 + i, 0, 0 )
+			assert ( len ( testTape.chunks ) == 2 and len ( os.listdir( directory ) ) == 2 * len ( TradeTape.COLUMNS ) )
+			assert ( list ( testTape.getColumn( 'price' ) ) == range ( 50, 57 ) )
+
+			spilledChunk = next( testTape.iterChunks() )
+			assert ( isinstance ( spilledChunk['price'], numpy.memmap ) and list ( spilledChunk['tradeId'] ) == [ 1, 2, 3 ] )
+
+			testTape.flushChunk()
+			assert ( len ( testTape.chunks ) == 3 and testTape.count == 0 and len ( testTape ) == 7 )
+		finally:
+			shutil.rmtree( directory )
+
+if __name__ == "__main__":
+
+	logger.MyLogger.InitializeLogger()
+	TestTradeTape.testTradeTape()
+	TestTradeTape.testTradeTapeSpill()
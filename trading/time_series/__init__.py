@@ -0,0 +1,3 @@
+#!/usr/bin/python
+# Allows the current dir to be found as a module in the python path 
+
@@ -0,0 +1,229 @@
+#!/usr/bin/python
+
+import trading.time_series.time_series as time_series
+import logger.logger as logger
+import logging
+import numpy
+import itertools
+import threading
+import Queue
+import calendar
+import datetime
+import csv
+
+class CsvTickReader():
+
+	"""
+	This class streams a CSV file of ticks as typed arrays.  Lines are read and parsed chunkSize at a time by a background
+	thread so parsing overlaps with whatever consumes the chunks ( e.g. the simulation matching orders ).  At most queueSize
+	parsed chunks wait for the consumer which keeps memory bounded by the chunk size whatever the size of the file.  Rows that
+	are all numbers are parsed by numpy in one call per chunk, other rows ( e.g. timestamps in timestampFormat or extra text
+	columns ) go through the csv module.  convert writes the file once in the binary format of TimeSeries so later runs can
+	open it directly.
+	"""
+
+	def __init__(self, fileName, timestampColumn = 0, priceColumn = 1, sizeColumn = 2, hasHeader = True, delimiter = ',',
+			timestampFormat = None, chunkSize = 1 << 16, queueSize = 2):
+		self.fileName = fileName
+		self.timestampColumn = timestampColumn
+		self.priceColumn = priceColumn
+		self.sizeColumn = sizeColumn # None when the file has no size column, sizes are then 0
+		self.hasHeader = hasHeader
+		self.delimiter = delimiter
+		self.timestampFormat = timestampFormat # strptime format of the timestamp column, None if it is already in seconds
+		self.chunkSize = chunkSize
+		self.queueSize = queueSize
+		self.logger = logging.getLogger('MyLogger')
+
+	def __str__(self):
+		return "CsvTickReader fileName:[%s]" % ( self.fileName )
+
+	def parseTimestamp(self, value):
+		if self.timestampFormat is None:
+			return float ( value )
+		timestamp = datetime.datetime.strptime( value, self.timestampFormat )
+		return calendar.timegm( timestamp.timetuple() ) + timestamp.microsecond / 1e6
+
+	def parseNumericLines(self, lines):
+		# Whole chunk in one numpy call, None if the rows are not all numbers with the same number of columns.  Only the total
+		# number of values is known after the call, so rows of different lengths are ruled out first by counting the
+		# delimiters of each row with array operations on the text of the chunk
+		rowsText = '\n'.join( line.strip() for line in lines ) + '\n'
+		characters = numpy.frombuffer( rowsText, dtype = numpy.uint8 )
+		delimiterTotals = numpy.searchsorted( numpy.flatnonzero( characters == ord ( self.delimiter ) ), numpy.flatnonzero( characters == ord ( '\n' ) ) )
+		delimiterCount = delimiterTotals[0]
+		if numpy.any( numpy.diff( delimiterTotals ) != delimiterCount ):
+			return None
+		columnCount = delimiterCount + 1
+		try:
+			values = numpy.fromstring( rowsText[ : -1 ].replace( '\n', self.delimiter ), sep = self.delimiter )
+		except ValueError:
+			return None
+		if len ( values ) != len ( lines ) * columnCount:
+			return None
+		return values.reshape( len ( lines ), columnCount )
+
+	def parseLines(self, lines):
+		values = None if self.timestampFormat is not None else self.parseNumericLines( lines )
+		if values is not None:
+			timestamps = values[ :, self.timestampColumn ].copy()
+			prices = values[ :, self.priceColumn ].copy()
+			sizes = values[ :, self.sizeColumn ].copy() if self.sizeColumn is not None else numpy.zeros( len ( lines ) )
+			return ( timestamps, prices, sizes )
+
+		timestamps = numpy.empty( len ( lines ) )
+		prices = numpy.empty( len ( lines ) )
+		sizes = numpy.zeros( len ( lines ) )
+		for i, row in enumerate ( csv.reader( lines, delimiter = self.delimiter ) ):
+			try:
+				timestamps[i] = self.parseTimestamp( row[ self.timestampColumn ] )
+				prices[i] = float ( row[ self.priceColumn ] )
+				if self.sizeColumn is not None:
+					sizes[i] = float ( row[ self.sizeColumn ] )
+			except ( ValueError, IndexError ) as ex:
+				self.logger.warning( "Failed to parse tick row:[%s] exception:[%s]" % ( row, ex ) )
+				raise Exception( 'Invalid tick row in file:[%s] row:[%s]' % ( self.fileName, row ) )
+		return ( timestamps, prices, sizes )
+
+	def readChunks(self, chunkQueue, stopEvent):
+		# Runs in the background thread, the last item put on the queue is None or the exception that stopped parsing
+		try:
+			with open( self.fileName, 'rb' ) as csvFile:
+				if self.hasHeader:
+					next( csvFile, None )
+				while not stopEvent.is_set():
+					lines = [ line for line in itertools.islice( csvFile, self.chunkSize ) if line.strip() ]
+					if not lines:
+						break
+					chunkQueue.put( self.parseLines( lines ) )
+			chunkQueue.put( None )
+		except Exception as ex:
+			chunkQueue.put( ex )
+
+	def iterColumnChunks(self):
+		# ( timestamps, prices, sizes ) arrays of up to chunkSize ticks in file order
+		self.logger.info( "Streaming ticks from fileName:[%s] chunkSize:[%s]" % ( self.fileName, self.chunkSize ) )
+
+		chunkQueue = Queue.Queue( self.queueSize )
+		stopEvent = threading.Event()
+		parser = threading.Thread( target = self.readChunks, args = ( chunkQueue, stopEvent ) )
+		parser.daemon = True
+		parser.start()
+		try:
+			while True:
+				chunk = chunkQueue.get()
+				if chunk is None:
+					return
+				if isinstance ( chunk, Exception ):
+					raise chunk
+				yield chunk
+		finally:
+			# Consumer stopped early or failed, let the parser finish its current put and exit
+			stopEvent.set()
+			while parser.is_alive():
+				try:
+					chunkQueue.get_nowait()
+				except Queue.Empty:
+					parser.join( .01 )
+
+	def iterChunks(self, withTimestamps = False):
+		# Same interface as TimeSeries.iterChunks so a reader can be replayed directly by the simulation
+		for timestamps, prices, sizes in self.iterColumnChunks():
+			if withTimestamps:
+				yield ( timestamps, prices )
+			else:
+				yield prices
+
+	def __iter__(self):
+		for prices in self.iterChunks():
+			for price in prices.tolist():
+				yield price
+
+	def convert(self, directory):
+		# Parses the file once into the binary tick format and returns the memory mapped TimeSeries.  A series already in
+		# directory is replaced, it is left as it was if the file fails to parse
+		writer = time_series.TimeSeriesWriter( directory )
+		try:
+			for timestamps, prices, sizes in self.iterColumnChunks():
+				writer.append( timestamps, prices, sizes )
+		except Exception:
+			writer.discard()
+			raise
+		writer.close()
+		return time_series.TimeSeries.open( directory )
+
+class TestCsvTickReader():
+
+	@staticmethod
+	def writeTestFile(directory, fileName, lines):
+		import os
+
+		filePath = os.path.join( directory, fileName )
+		with open( filePath, 'w' ) as testFile:
+			testFile.write( '\n'.join( lines ) + '\n' )
+		return filePath
+
+	@staticmethod
+	def testCsvTickReader():
+		import tempfile
+		import shutil
+		import os
+
+		directory = tempfile.mkdtemp()
+		try:
+			lines = [ 'timestamp,price,size' ] + [ '%s,%s,%s' % ( 1000 + i, 10 + i * .01, i ) for i in range ( 0, 10 ) ]
+			filePath = TestCsvTickReader.writeTestFile( directory, 'ticks.csv', lines )
+
+			reader = CsvTickReader( filePath, chunkSize = 4 )
+			chunks = list ( reader.iterColumnChunks() )
+			assert ( [ len ( timestamps ) for timestamps, prices, sizes in chunks ] == [ 4, 4, 2 ] )
+			assert ( list ( reader ) == [ 10 + i * .01 for i in range ( 0, 10 ) ] )
+			assert ( chunks[2][0].tolist() == [ 1008, 1009 ] and chunks[2][2].tolist() == [ 8, 9 ] )
+
+			# Rows of different lengths are not parsed by numpy, a missing column is an error and extra columns are ignored
+			filePath = TestCsvTickReader.writeTestFile( directory, 'ragged.csv', [ '1,10,5', '2,11', '3,12,7,8' ] )
+			try:
+				list ( CsvTickReader( filePath, hasHeader = False ).iterColumnChunks() )
+				assert ( False )
+			except Exception as ex:
+				assert ( ex.args[0].startswith( 'Invalid tick row' ) )
+			TestCsvTickReader.writeTestFile( directory, 'ragged.csv', [ '1,10,5', '2,11,6,x', '3,12,7,8' ] )
+			timestamps, prices, sizes = next ( CsvTickReader( filePath, hasHeader = False ).iterColumnChunks() )
+			assert ( timestamps.tolist() == [ 1, 2, 3 ] and prices.tolist() == [ 10, 11, 12 ] and sizes.tolist() == [ 5, 6, 7 ] )
+
+			# Text columns and formatted timestamps go through the csv module
+			lines = [ 'AA|2015-01-02 09:30:00|10.5', 'AA|2015-01-02 09:30:01.5|10.6' ]
+			filePath = TestCsvTickReader.writeTestFile( directory, 'vendor.csv', lines )
+			reader = CsvTickReader( filePath, timestampColumn = 1, priceColumn = 2, sizeColumn = None, hasHeader = False,
+				delimiter = '|', timestampFormat = '%Y-%m-%d %H:%M:%S' )
+			try:
+				list ( reader.iterColumnChunks() )
+				assert ( False )
+			except Exception as ex:
+				assert ( ex.args[0].startswith( 'Invalid tick row' ) ) # Second row has fractional seconds
+			reader.timestampFormat = '%Y-%m-%d %H:%M:%S.%f'
+			lines[0] = 'AA|2015-01-02 09:30:00.0|10.5'
+			TestCsvTickReader.writeTestFile( directory, 'vendor.csv', lines )
+			timestamps, prices, sizes = next ( reader.iterColumnChunks() )
+			assert ( timestamps.tolist() == [ 1420191000, 1420191001.5 ] and sizes.tolist() == [ 0, 0 ] )
+
+			# Converting once gives the memory mapped binary series
+			aTimeSeries = CsvTickReader( TestCsvTickReader.writeTestFile( directory, 'ticks.csv', [ 'timestamp,price,size', '1,10,5', '2,11,6' ] ) ).convert( directory + '/ticks' )
+			assert ( list ( aTimeSeries ) == [ 10, 11 ] and aTimeSeries.getSizes().tolist() == [ 5, 6 ] )
+
+			# Converting again replaces the series, a file that fails to parse leaves it as it was
+			aTimeSeries = CsvTickReader( os.path.join( directory, 'ticks.csv' ) ).convert( directory + '/ticks' )
+			assert ( list ( aTimeSeries ) == [ 10, 11 ] )
+			try:
+				CsvTickReader( TestCsvTickReader.writeTestFile( directory, 'ticks.csv', [ 'timestamp,price,size', '3,12,7', '4,x,8' ] ), chunkSize = 1 ).convert( directory + '/ticks' )
+				assert ( False )
+			except Exception as ex:
+				assert ( ex.args[0].startswith( 'Invalid tick row' ) )
+			assert ( list ( time_series.TimeSeries.open( directory + '/ticks' ) ) == [ 10, 11 ] and len ( os.listdir( directory + '/ticks' ) ) == 3 )
+		finally:
+			shutil.rmtree( directory )
+
+if __name__ == "__main__":
+
+	logger.MyLogger.InitializeLogger()
+	TestCsvTickReader.testCsvTickReader()
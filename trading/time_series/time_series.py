@@ -0,0 +1,216 @@
+#!/usr/bin/python
+
+import logger.logger as logger
+import logging
+import numpy
+import hashlib
+import os
+
+class TimeSeriesWriter():
+
+	"""
+	This class writes a tick series to a directory in the binary tick format read by TimeSeries.open.  Each column is a file of
+	native float64 values ( timestamp.bin, price.bin, size.bin ) so ticks can be appended chunk by chunk without holding the
+	series in memory.  A series already in the directory is replaced when the writer is closed, the columns are written to
+	temporary files and renamed so series memory mapped from the old files stay valid.  With append the ticks are added to
+	the end of the existing series instead.
+	"""
+
+	TEMPORARY_EXTENSION = '.tmp'
+
+	def __init__(self, directory, append = False):
+		self.directory = directory
+		self.appending = append
+		if not os.path.isdir( directory ):
+			os.makedirs( directory )
+		self.columnFiles = dict( ( column, open( self.getFileName( column ), 'ab' if append else 'wb' ) ) for column in TimeSeries.COLUMNS )
+		self.count = 0
+		self.logger = logging.getLogger('MyLogger')
+
+	def getFileName(self, column):
+		fileName = os.path.join( self.directory, column + TimeSeries.FILE_EXTENSION )
+		return fileName if self.appending else fileName + TimeSeriesWriter.TEMPORARY_EXTENSION
+
+	def append(self, timestamps, prices, sizes):
+		# Columns must have the same length, timestamps are expected to be in increasing order across appends
+		columns = { 'timestamp' : timestamps, 'price' : prices, 'size' : sizes }
+		lengths = set ( len ( values ) for values in columns.itervalues() )
+		if len ( lengths ) != 1:
+			self.logger.warning( "Failed to append ticks, column lengths differ lengths:[%s]" % ( lengths ) )
+			raise Exception( 'Invalid ticks, timestamp, price and size must have the same length' )
+
+		for column, values in columns.iteritems():
+			numpy.asarray( values, dtype = numpy.float64 ).tofile( self.columnFiles[ column ] )
+		self.count += lengths.pop()
+
+	def close(self):
+		for column, columnFile in self.columnFiles.iteritems():
+			columnFile.close()
+			if not self.appending:
+				os.rename( columnFile.name, os.path.join( self.directory, column + TimeSeries.FILE_EXTENSION ) )
+		self.logger.info( "Wrote ticks:[%s] to directory:[%s]" % ( self.count, self.directory ) )
+
+	def discard(self):
+		# Stops writing without replacing the stored series, ticks appended to an existing series are kept
+		for columnFile in self.columnFiles.itervalues():
+			columnFile.close()
+			if not self.appending:
+				os.remove( columnFile.name )
+		self.logger.info( "Discarded ticks:[%s] for directory:[%s]" % ( self.count, self.directory ) )
+
+class TimeSeries():
+
+	"""
+	This class is a series of ticks held as timestamp, price and size columns.  A series saved to a directory is opened with
+	TimeSeries.open which memory maps the column files, this takes the same time for any length of series and only the pages
+	that are read are loaded.  Slicing by time range returns a TimeSeries of views of the same columns without copying and
+	iterChunks walks the prices in fixed size chunks so a replay never has to hold the series as Python objects.
+	"""
+
+	COLUMNS = ( 'timestamp', 'price', 'size' )
+	FILE_EXTENSION = '.bin'
+
+	def __init__(self, prices = None, timestamps = None, sizes = None):
+		# In memory series, timestamps default to the tick index and sizes to 0
+		self.prices = numpy.asarray( prices if prices is not None else [], dtype = numpy.float64 )
+		self.timestamps = numpy.arange( len ( self.prices ), dtype = numpy.float64 ) if timestamps is None else numpy.asarray( timestamps, dtype = numpy.float64 )
+		self.sizes = numpy.zeros( len ( self.prices ) ) if sizes is None else numpy.asarray( sizes, dtype = numpy.float64 )
+		self.logger = logging.getLogger('MyLogger')
+
+	@staticmethod
+	def fromColumns(timestamps, prices, sizes):
+		# Wraps existing arrays ( e.g. memory maps or views ) without copying them
+		aTimeSeries = TimeSeries()
+		aTimeSeries.timestamps = timestamps
+		aTimeSeries.prices = prices
+		aTimeSeries.sizes = sizes
+		return aTimeSeries
+
+	@staticmethod
+	def open(directory):
+		columns = {}
+		for column in TimeSeries.COLUMNS:
+			fileName = os.path.join( directory, column + TimeSeries.FILE_EXTENSION )
+			if os.path.getsize( fileName ) == 0: # numpy can not memory map an empty file
+				columns[ column ] = numpy.empty( 0 )
+			else:
+				columns[ column ] = numpy.memmap( fileName, dtype = numpy.float64, mode = 'r' )
+		return TimeSeries.fromColumns( columns['timestamp'], columns['price'], columns['size'] )
+
+	def save(self, directory, chunkSize = 1 << 20, append = False):
+		# Replaces a series already saved in directory unless append is set
+		writer = TimeSeriesWriter( directory, append )
+		for start in xrange ( 0, len ( self ), chunkSize ):
+			writer.append( self.timestamps[ start : start + chunkSize ], self.prices[ start : start + chunkSize ], self.sizes[ start : start + chunkSize ] )
+		writer.close()
+
+	def __len__(self):
+		return len ( self.prices )
+
+	def __str__(self):
+		if len ( self ) == 0:
+			return "TimeSeries ticks:[0]"
+		return "TimeSeries ticks:[%s] start:[%s] end:[%s]" % ( len ( self ), self.timestamps[0], self.timestamps[-1] )
+
+	def __iter__(self):
+		# Prices as floats, converted one chunk at a time
+		for prices in self.iterChunks():
+			for price in prices.tolist():
+				yield price
+
+	def getFingerprint(self, chunkSize = 1 << 20):
+		# Content hash of the ticks, equal series give the same fingerprint whether they are in memory or memory mapped
+		fingerprint = hashlib.sha1()
+		for column in ( self.timestamps, self.prices, self.sizes ):
+			fingerprint.update( str ( len ( column ) ) )
+			for start in xrange ( 0, len ( column ), chunkSize ):
+				fingerprint.update( numpy.ascontiguousarray( column[ start : start + chunkSize ], dtype = numpy.float64 ) )
+		return fingerprint.hexdigest()
+
+	def getTimeSeries(self):
+		# Every price as a Python list, only meant for small series.  Use iterChunks or getPrices for large series
+		return self.prices.tolist()
+
+	def getPrices(self):
+		return self.prices
+
+	def getTimestamps(self):
+		return self.timestamps
+
+	def getSizes(self):
+		return self.sizes
+
+	def sliceByTime(self, startTime = None, endTime = None):
+		# Ticks with startTime <= timestamp < endTime as views of the same columns, found with a binary search on the timestamps
+		start = 0 if startTime is None else numpy.searchsorted( self.timestamps, startTime, side = 'left' )
+		end = len ( self ) if endTime is None else numpy.searchsorted( self.timestamps, endTime, side = 'left' )
+		return TimeSeries.fromColumns( self.timestamps[ start : end ], self.prices[ start : end ], self.sizes[ start : end ] )
+
+	def iterChunks(self, chunkSize = 1 << 16, withTimestamps = False):
+		# Price views of chunkSize ticks, or ( timestamps, prices ) views when withTimestamps is set
+		for start in xrange ( 0, len ( self ), chunkSize ):
+			if withTimestamps:
+				yield ( self.timestamps[ start : start + chunkSize ], self.prices[ start : start + chunkSize ] )
+			else:
+				yield self.prices[ start : start + chunkSize ]
+
+class TestTimeSeries():
+
+	@staticmethod
+	def testTimeSeries():
+		aTimeSeries = TimeSeries( [ 11, 10, 11 ] )
+		assert ( aTimeSeries.getTimeSeries() == [ 11, 10, 11 ] and list ( aTimeSeries ) == [ 11, 10, 11 ] )
+		assert ( list ( aTimeSeries.getTimestamps() ) == [ 0, 1, 2 ] and len ( aTimeSeries ) == 3 )
+
+		aTimeSeries = TimeSeries( range ( 100, 110 ), timestamps = range ( 1000, 1100, 10 ), sizes = [ 5 ] * 10 )
+		timeSlice = aTimeSeries.sliceByTime( 1015, 1050 )
+		assert ( list ( timeSlice.getPrices() ) == [ 102, 103, 104 ] )
+		assert ( timeSlice.getPrices().base is aTimeSeries.getPrices() ) # View, not a copy
+		assert ( len ( aTimeSeries.sliceByTime( endTime = 1000 ) ) == 0 and len ( aTimeSeries.sliceByTime( 1090 ) ) == 1 )
+		assert ( [ len ( prices ) for prices in aTimeSeries.iterChunks( 4 ) ] == [ 4, 4, 2 ] )
+
+	@staticmethod
+	def testMemoryMappedTimeSeries():
+		import tempfile
+		import shutil
+
+		directory = tempfile.mkdtemp()
+		try:
+			aTimeSeries = TimeSeries( [ 10.5, 10.6, 10.4, 10.7 ], timestamps = [ 1, 2, 3, 4 ], sizes = [ 100, 200, 300, 400 ] )
+			aTimeSeries.save( directory, chunkSize = 3 )
+			aTimeSeries.save( directory ) # Replaces the stored series
+			assert ( len ( TimeSeries.open( directory ) ) == 4 )
+
+			# Appending extends the stored series
+			writer = TimeSeriesWriter( directory, append = True )
+			writer.append( [ 5, 6 ], [ 10.8, 10.9 ], [ 500, 600 ] )
+			writer.close()
+
+			openedTimeSeries = TimeSeries.open( directory )
+			assert ( isinstance ( openedTimeSeries.getPrices(), numpy.memmap ) and len ( openedTimeSeries ) == 6 )
+			assert ( list ( openedTimeSeries ) == [ 10.5, 10.6, 10.4, 10.7, 10.8, 10.9 ] )
+			timeSlice = openedTimeSeries.sliceByTime( 3, 6 )
+			assert ( list ( timeSlice.getSizes() ) == [ 300, 400, 500 ] and isinstance ( timeSlice.getSizes(), numpy.memmap ) )
+
+			try:
+				TimeSeriesWriter( directory, append = True ).append( [ 7 ], [ 11.0, 11.1 ], [ 700 ] )
+				assert ( False )
+			except Exception as ex:
+				assert ( ex.args[0].startswith( 'Invalid ticks' ) )
+			assert ( len ( TimeSeries.open( directory ) ) == 6 )
+
+			fingerprint = openedTimeSeries.getFingerprint()
+			assert ( fingerprint == TimeSeries( list ( openedTimeSeries ), timestamps = range ( 1, 7 ), sizes = range ( 100, 700, 100 ) ).getFingerprint() )
+			assert ( fingerprint != openedTimeSeries.sliceByTime( 2 ).getFingerprint() and fingerprint == openedTimeSeries.getFingerprint( chunkSize = 4 ) )
+
+			# Saving over a memory mapped series leaves the open series unchanged
+			TimeSeries( [ 1.0 ] ).save( directory )
+			assert ( len ( TimeSeries.open( directory ) ) == 1 and list ( openedTimeSeries )[-1] == 10.9 )
+		finally:
+			shutil.rmtree( directory )
+
+if __name__ == "__main__":
+
+	logger.MyLogger.InitializeLogger()
+	TestTimeSeries.testTimeSeries()
+	TestTimeSeries.testMemoryMappedTimeSeries()